@@ -0,0 +1,55 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Speed of the compiled envelopes (seur.envelopes) against Genshi rendering of
+the same templates, with the parity cases of seur/tests/test_envelopes.py.
+Exits with status 1 if any output differs.
+
+    python bench/envelopes.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from seur.envelopes import TEMPLATES, EnvelopeBuilder
+from seur.templates import TemplateCache
+from seur.tests.test_envelopes import cases, differences, template_names
+
+ITERATIONS = 2000
+
+
+def main():
+    iterations = len(sys.argv) > 1 and int(sys.argv[1]) or ITERATIONS
+    genshi = TemplateCache()
+    builder = EnvelopeBuilder(loader=genshi)
+
+    errors = 0
+    print '%-24s %7s %8s %12s %12s %8s' % ('template', 'cases', 'errors',
+        'genshi', 'envelope', 'speedup')
+    for name in TEMPLATES:
+        count = len(list(cases(name)))
+        failed = 0
+        for vals, expected, result in differences(genshi, builder, name):
+            failed += 1
+            if failed == 1:
+                print 'Differs: %s %r\n%r\n%r' % (name, vals, expected,
+                    result)
+        errors += failed
+
+        names, fields = template_names(name)
+        vals = dict((n, 'Value & <%s>' % n) for n in names)
+        vals['bultos'] = [dict((f, '1') for f in fields)] * 3
+        times = []
+        for renderer in (genshi, builder):
+            seconds = timeit.timeit(lambda: renderer.render(name, vals),
+                number=iterations)
+            times.append(seconds / iterations * 1e6)
+        print '%-24s %7d %8d %9.1f us %9.1f us %7.1fx' % (name, count, failed,
+            times[0], times[1], times[0] / times[1])
+    sys.exit(errors and 1 or 0)
+
+if __name__ == '__main__':
+    main()
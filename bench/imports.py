@@ -0,0 +1,36 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Import time of the seur package and modules, each measured in a new
+interpreter (best of runs), with the targets of seur/tests/test_imports.py.
+Exits with status 1 if a case takes more than its target or imports a
+module it should not.
+
+    python bench/imports.py [runs]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from seur.tests.test_imports import CASES, RUNS, imports
+
+
+def main():
+    runs = len(sys.argv) > 1 and int(sys.argv[1]) or RUNS
+    errors = 0
+    print '%-28s %10s %10s  %s' % ('statement', 'best ms', 'target ms',
+        'result')
+    for statement, target, forbidden in CASES:
+        best, loaded = imports(statement, forbidden, runs)
+        failed = best > target or loaded
+        errors += bool(failed)
+        result = failed and 'FAIL' or 'ok'
+        if loaded:
+            result += ' (imports %s)' % ', '.join(loaded)
+        print '%-28s %10.1f %10d  %s' % (statement, best, target, result)
+    sys.exit(errors and 1 or 0)
+
+if __name__ == '__main__':
+    main()
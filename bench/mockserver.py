@@ -0,0 +1,358 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Local stand-in for the Seur webservices, to test and benchmark the client
+without cit.seur.com / ws.seur.com
+
+Implements the envelopes of seur/template: ImprimirECBWebService (ECB trace
+and PDF labels), DetalleBultoPDFWebService (manifiesto),
+WSConsultaExpediciones (info and list), WSCrearRecogida (pickup and cancel)
+and WSServiciosWebPublicos (zip and city).
+
+    python bench/mockserver.py [--port 8080] [--latency 0.05] [--jitter 0.02]
+        [--error-rate 0.01] [--payload-size 50000]
+
+Example usage ::
+
+    server = MockServer(latency=0.05, error_rate=0.01).start()
+    with Picking(username, password, vat, franchise, seurid, ci, ccc,
+            urls=server.urls) as picking_api:
+        reference, label, error = picking_api.create(data)
+    server.stop()
+"""
+
+from xml.sax.saxutils import escape
+import BaseHTTPServer
+import SocketServer
+import argparse
+import base64
+import datetime
+import os
+import random
+import re
+import socket
+import threading
+import time
+
+SERVICES = (
+    'ImprimirECBWebService',
+    'DetalleBultoPDFWebService',
+    'WSConsultaExpediciones',
+    'WSCrearRecogida',
+    'WSServiciosWebPublicos',
+    )
+
+ENVELOPE = ('<?xml version="1.0" encoding="UTF-8"?>'
+    '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+    'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<soap:Body><ns1:%(operation)sResponse xmlns:ns1="%(namespace)s">'
+    '<ns1:out>%(out)s</ns1:out>'
+    '</ns1:%(operation)sResponse></soap:Body></soap:Envelope>')
+
+FAULT = ('<?xml version="1.0" encoding="UTF-8"?>'
+    '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+    '<soap:Body><soap:Fault><faultcode>soap:Server</faultcode>'
+    '<faultstring>%s</faultstring></soap:Fault></soap:Body>'
+    '</soap:Envelope>')
+
+CITIES = (
+    ('08720', 'VILAFRANCA DEL PENEDES', 'BARCELONA'),
+    ('08400', 'GRANOLLERS', 'BARCELONA'),
+    ('08001', 'BARCELONA', 'BARCELONA'),
+    ('28001', 'MADRID', 'MADRID'),
+    ('29651', 'MIJAS COSTA', 'MALAGA'),
+    )
+
+
+def operation(body):
+    """
+    Operation name of a SOAP request: first element of the Body
+    """
+    match = re.search(r'<soapenv:Body>\s*<\w+:(\w+)', body)
+    return match and match.group(1) or None
+
+
+def field(body, name):
+    """
+    Text of the first name element of the request
+    """
+    match = re.search(r'<(?:\w+:)?%s>([^<]*)</' % name, body)
+    return match and match.group(1).strip() or ''
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    #Buffer the response and send it without Nagle: small writes on a
+    #keep-alive connection wait for the delayed ACK of the client
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connect(self.connection)
+
+    def finish(self):
+        self.server.disconnect(self.connection)
+        BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format,
+                *args)
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        body = self.rfile.read(length)
+        server = self.server
+        service = self.path.rstrip('/').rsplit('/', 1)[-1]
+        server.count(service)
+        server.last_request = (self.path, self.headers)
+
+        delay = server.latency + random.uniform(-1, 1) * server.jitter
+        action = server.next_action(service)
+        if isinstance(action, float):
+            delay += action
+        if delay > 0:
+            time.sleep(delay)
+        if action == 'close':
+            self.close_connection = 1
+            return
+        if isinstance(action, int):
+            return self.respond(action, FAULT % 'Scripted error')
+
+        if service not in SERVICES:
+            return self.respond(404, FAULT % 'Unknown service %s' % service)
+        if server.error_rate and random.random() < server.error_rate:
+            return self.respond(500, FAULT % 'Simulated error')
+        op = operation(body)
+        method = getattr(self, 'op_%s' % op, None)
+        if method is None:
+            return self.respond(500, FAULT % 'Unknown operation %s' % op)
+        out, namespace = method(body)
+        self.respond(200, ENVELOPE % {
+                'operation': op,
+                'namespace': namespace,
+                'out': out,
+                })
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def ecb(self, body):
+        bultos = max(body.count('<bulto>'), 1)
+        reference = self.server.next_reference()
+        return ''.join('<string>%s%03d</string>' % (reference, i + 1)
+            for i in range(bultos))
+
+    def op_impresionIntegracionConECBWS(self, body):
+        trace = ('^XA^FO50,50^A0N,50,50^FD%s^FS^XZ\n' %
+            field(body, 'referencia_expedicion'))
+        trace = (trace * (self.server.payload_size // len(trace) + 1))[
+            :self.server.payload_size]
+        return ('<ECB xmlns="http://dto.servicios.ecb.seur">%s</ECB>'
+            '<mensaje>OK</mensaje><traza>%s</traza>' % (self.ecb(body),
+                escape(trace)),
+            'http://localhost:7026/ImprimirECBWebService')
+
+    def op_impresionIntegracionPDFConECBWS(self, body):
+        if '<bulto>' not in body:
+            #test_connection sends an empty bulto
+            return ('<mensaje>ERROR</mensaje>',
+                'http://localhost:7026/ImprimirECBWebService')
+        return ('<ECB xmlns="http://dto.servicios.ecb.seur">%s</ECB>'
+            '<mensaje>OK</mensaje><PDF>%s</PDF>' % (self.ecb(body),
+                self.server.pdf),
+            'http://localhost:7026/ImprimirECBWebService')
+
+    def op_generacionPDFDetallePorFecha(self, body):
+        return (self.server.pdf,
+            'http://localhost:7026/DetalleBultoPDFWebService')
+
+    def op_consultaExpedicionesStr(self, body):
+        reference = field(body, 'in3')
+        if reference:
+            references = [reference]
+        else:
+            references = ['S/%s/%04d' % (field(body, 'in5'), i)
+                for i in range(1, 21)]
+        expediciones = []
+        for ref in references:
+            expediciones.append('<EXPEDICION>'
+                '<EXPEDICION_NUM>%(num)s</EXPEDICION_NUM>'
+                '<REF_EXPEDICION>%(ref)s</REF_EXPEDICION>'
+                '<FECHA_CAPTURA>%(date)s</FECHA_CAPTURA>'
+                '<SITUACIONES><SITUACION>'
+                '<FECHA_SITUACION>%(date)s</FECHA_SITUACION>'
+                '<COD_SITUACION>T</COD_SITUACION>'
+                '<DESCRIPCION_CLIENTE>EN TRANSITO</DESCRIPCION_CLIENTE>'
+                '</SITUACION></SITUACIONES>'
+                '</EXPEDICION>' % {
+                    'num': abs(hash(ref)) % 10 ** 9,
+                    'ref': escape(ref),
+                    'date': datetime.date.today().strftime('%d-%m-%Y'),
+                    })
+        out = '<EXPEDICIONES>%s</EXPEDICIONES>' % ''.join(expediciones)
+        return escape(out), 'http://consultaExpediciones.servicios.webseur'
+
+    def op_crearRecogida(self, body):
+        num = self.server.next_reference()
+        out = ('<RECOGIDA><LOCALIZADOR>L%s</LOCALIZADOR>'
+            '<NUM_RECOGIDA>%s</NUM_RECOGIDA><TASACION>0</TASACION>'
+            '</RECOGIDA>' % (num, num))
+        return escape(out), 'http://crearRecogida.servicios.webseur'
+
+    def op_anularRecogida(self, body):
+        return (escape(u'Anulaci\xf3n realizada con \xe9xito'.encode('utf-8')),
+            'http://crearRecogida.servicios.webseur')
+
+    def op_infoPoblacionesCortoStr(self, body):
+        city = field(body, 'in1').upper()
+        zip = field(body, 'in2')
+        regs = []
+        for cp, name, province in CITIES:
+            if (city and city in name) or (zip and cp.startswith(zip)):
+                regs.append('<REG%(i)s>'
+                    '<CODIGO_POSTAL>%(cp)s</CODIGO_POSTAL>'
+                    '<NOM_POBLACION>%(name)s</NOM_POBLACION>'
+                    '<NOM_PROVINCIA>%(province)s</NOM_PROVINCIA>'
+                    '</REG%(i)s>' % {
+                        'i': len(regs) + 1,
+                        'cp': cp,
+                        'name': name,
+                        'province': province,
+                        })
+        out = '<REGISTROS>%s</REGISTROS>' % ''.join(regs)
+        return escape(out), 'http://eCatalogoWS'
+
+
+class MockServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Threaded mock Seur server with keep-alive connections
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, jitter=0,
+            error_rate=0, payload_size=50000, verbose=False):
+        """
+        :param latency: seconds each response is delayed
+        :param jitter: max seconds added or removed to latency at random
+        :param error_rate: fraction of requests answered with a SOAP fault
+        :param payload_size: bytes of the labels (before base64) and
+                             manifests
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload_size = payload_size
+        self.verbose = verbose
+        self.pdf = base64.encodestring(os.urandom(payload_size))
+        self.requests = {}
+        #Request target and headers of the last request
+        self.last_request = None
+        self.actions = {}
+        self.connections = set()
+        self._reference = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def urls(self):
+        """
+        URLs by service to pass to API/Picking
+        """
+        host, port = self.server_address[:2]
+        return dict((service, 'http://%s:%s/services/%s' % (host, port,
+                    service))
+            for service in SERVICES)
+
+    def count(self, service):
+        with self._lock:
+            self.requests[service] = self.requests.get(service, 0) + 1
+
+    def script(self, service, *actions):
+        """
+        Answer the next requests of a service with actions, in order: an
+        HTTP status (int) answered with a SOAP fault, extra seconds of
+        latency (float) or 'close' to close the connection without response
+        """
+        with self._lock:
+            self.actions.setdefault(service, []).extend(actions)
+
+    def next_action(self, service):
+        with self._lock:
+            actions = self.actions.get(service)
+            return actions and actions.pop(0) or None
+
+    def connect(self, connection):
+        with self._lock:
+            self.connections.add(connection)
+
+    def disconnect(self, connection):
+        with self._lock:
+            self.connections.discard(connection)
+
+    def close_connections(self):
+        """
+        Close the open keep-alive connections, like a server dropping them
+        after its idle timeout
+        """
+        with self._lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def next_reference(self):
+        with self._lock:
+            self._reference += 1
+            return '%014d' % self._reference
+
+    def start(self):
+        """
+        Serve in a background thread
+
+        Return self
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the '
+        'Seur webservices, to test and benchmark the client')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--payload-size', type=int, default=50000)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    server = MockServer(args.host, args.port, latency=args.latency,
+        jitter=args.jitter, error_rate=args.error_rate,
+        payload_size=args.payload_size, verbose=args.verbose)
+    for service, url in sorted(server.urls.items()):
+        print '%-28s %s' % (service, url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
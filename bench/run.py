@@ -0,0 +1,219 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Throughput and latency percentiles of Picking create, label, zip, city and
+manifiesto against the local mock server, sending the requests one at a
+time (serial), from a thread pool (threaded) and with AsyncPicking (async)
+
+    python bench/run.py [--requests 200] [--concurrency 16] [--latency 0.02]
+        [--error-rate 0] [--payload-size 50000] [--operations create,zip]
+        [--modes serial,threaded,async] [--attempts 1] [--limits]
+        [--coalesce]
+
+Every request is sent to the mock server: identical calls are not coalesced
+(unless --coalesce), nor retried (unless --attempts) nor limited by seur.limits
+(unless --limits).
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mockserver import MockServer
+from seur.coalesce import SingleFlight
+from seur.limits import Limits
+from seur.picking import Picking
+from seur.retry import Retry
+from seur.transport import Transport
+from seur.utils import imap_unordered
+
+OPERATIONS = ('create', 'label', 'zip', 'city', 'manifiesto')
+MODES = ('serial', 'threaded', 'async')
+
+DATA = {
+    'servicio': '1',
+    'product': '2',
+    'total_bultos': 1,
+    'observaciones': 'Benchmark',
+    'referencia_expedicion': 'S/OUT/0001',
+    'ref_bulto': 'S/OUT/0001',
+    'cliente_nombre': 'Zikzakmedia SL',
+    'cliente_direccion': 'Sant Jaume, 9. Baixos 2',
+    'cliente_poblacion': 'Vilafranca del Penedes',
+    'cliente_cpostal': '08720',
+    'cliente_pais': 'ES',
+    'cliente_email': 'zikzak@zikzakmedia.com',
+    'cliente_telefono': '938902108',
+    'cliente_atencion': 'Raimon Esteve',
+    }
+
+ARGS = {
+    'create': DATA,
+    'label': DATA,
+    'zip': '08720',
+    'city': 'Granollers',
+    'manifiesto': {},
+    }
+_references = itertools.count(1)
+
+
+def argument(operation):
+    """
+    Argument of a request: each create has its own referencia_expedicion, as
+    the same one is a duplicate shipment
+    """
+    if operation != 'create':
+        return ARGS[operation]
+    reference = 'S/BENCH/%07d' % next(_references)
+    return dict(DATA, referencia_expedicion=reference, ref_bulto=reference)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def timed(func):
+    def call(arg):
+        start = time.time()
+        func(arg)
+        return time.time() - start
+    return call
+
+
+def run_serial(picking, operation, requests, concurrency):
+    func = timed(getattr(picking, operation))
+    latencies, errors = [], 0
+    for i in xrange(requests):
+        try:
+            latencies.append(func(argument(operation)))
+        except Exception:
+            errors += 1
+    return latencies, errors
+
+
+def run_threaded(picking, operation, requests, concurrency):
+    func = timed(getattr(picking, operation))
+    latencies, errors = [], 0
+    for index, latency, exception in imap_unordered(func,
+            (argument(operation) for i in xrange(requests)),
+            max_workers=concurrency):
+        if exception is not None:
+            errors += 1
+        else:
+            latencies.append(latency)
+    return latencies, errors
+
+
+def run_async(picking, operation, requests, concurrency):
+    import trollius as asyncio
+    from trollius import From
+    method = getattr(picking, operation)
+    latencies, failures = [], []
+
+    #concurrency calls at a time, timed like the threaded ones
+    semaphore = asyncio.Semaphore(concurrency, loop=picking.loop)
+
+    @asyncio.coroutine
+    def call(arg):
+        with (yield From(semaphore)):
+            start = time.time()
+            try:
+                yield From(method(arg))
+            except Exception as e:
+                failures.append(e)
+            else:
+                latencies.append(time.time() - start)
+
+    picking.loop.run_until_complete(asyncio.gather(
+            *[call(argument(operation)) for i in xrange(requests)],
+            loop=picking.loop))
+    return latencies, len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and latency '
+        'percentiles of Picking operations against the local mock server')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--payload-size', type=int, default=50000)
+    parser.add_argument('--operations', default=','.join(OPERATIONS))
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--pdf', action='store_true',
+        help='PDF labels instead of ECB traces')
+    parser.add_argument('--attempts', type=int, default=1,
+        help='calls of each request with the retry policy (1: no retries)')
+    parser.add_argument('--limits', action='store_true',
+        help='rate and adaptive concurrency limits of a new seur.limits.Limits'
+        ' (threaded and serial modes)')
+    parser.add_argument('--coalesce', action='store_true',
+        help='coalesce identical calls in flight with a new SingleFlight')
+    args = parser.parse_args()
+
+    server = MockServer(latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, payload_size=args.payload_size).start()
+    context = {'pdf': args.pdf}
+    #Explicit policies: the process-wide defaults would be shared with
+    #other clients and coalesce or throttle the requests measured
+    options = {
+        'context': context,
+        'urls': server.urls,
+        'retry': Retry(attempts=args.attempts),
+        'flights': args.coalesce and SingleFlight() or False,
+        }
+    transport = Transport(maxsize=args.concurrency,
+        limits=args.limits and Limits(adaptive=True) or False)
+    picking = Picking('user', 'password', 'B00000000', '00', 'SEURID',
+        '0000', '00000', transport=transport, **options)
+    async_picking = None
+
+    print '%-11s %-9s %8s %8s %10s %9s %9s %9s %9s' % ('operation', 'mode',
+        'requests', 'errors', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms',
+        'max ms')
+    for operation in args.operations.split(','):
+        for mode in args.modes.split(','):
+            client = picking
+            if mode == 'async':
+                try:
+                    from seur.aio import AsyncPicking
+                    from seur.aiotransport import AsyncTransport
+                except ImportError:
+                    print '%-11s %-9s skipped: trollius not installed' % (
+                        operation, mode)
+                    continue
+                if async_picking is None:
+                    async_transport = AsyncTransport(maxsize=args.concurrency,
+                        concurrency=args.concurrency)
+                    async_picking = AsyncPicking('user', 'password',
+                        'B00000000', '00', 'SEURID', '0000', '00000',
+                        transport=async_transport, **options)
+                client = async_picking
+            run = globals()['run_%s' % mode]
+            start = time.time()
+            latencies, errors = run(client, operation, args.requests,
+                args.concurrency)
+            elapsed = time.time() - start
+            print '%-11s %-9s %8d %8d %10.1f %9.1f %9.1f %9.1f %9.1f' % (
+                operation, mode, args.requests, errors,
+                args.requests / elapsed,
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 90) * 1000,
+                percentile(latencies, 99) * 1000,
+                max(latencies or [0]) * 1000)
+    if async_picking is not None:
+        async_picking.close()
+    transport.close()
+    server.stop()
+
+if __name__ == '__main__':
+    main()
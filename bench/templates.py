@@ -0,0 +1,54 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Per-call template load and render cost: Genshi TemplateLoader with
+auto_reload (before) against the shared precompiled cache (after)
+
+    python bench/templates.py [iterations]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import genshi.template
+from seur.templates import TEMPLATE_DIR, TemplateCache
+
+ITERATIONS = 2000
+
+
+def template_vals(name):
+    with open(os.path.join(TEMPLATE_DIR, name)) as f:
+        names = set(re.findall(r'\$\{(\w+)\}', f.read()))
+    vals = dict((n, 'X') for n in names)
+    vals['total_bultos'] = 1
+    vals['bultos'] = [{'peso_bulto': 'X', 'ref_bulto': 'X'}]
+    return vals
+
+
+def main():
+    iterations = len(sys.argv) > 1 and int(sys.argv[1]) or ITERATIONS
+    before = genshi.template.TemplateLoader(TEMPLATE_DIR, auto_reload=True)
+    after = TemplateCache()
+    after.preload()
+
+    print '%-28s %14s %14s %14s %14s' % ('template', 'load before',
+        'load after', 'render before', 'render after')
+    for name in sorted(os.listdir(TEMPLATE_DIR)):
+        vals = template_vals(name)
+        row = [name]
+        for mode in ('load', 'render'):
+            for cache in (before, after):
+                if mode == 'load':
+                    func = lambda: cache.load(name)
+                else:
+                    func = lambda: cache.load(name).generate(**vals).render()
+                seconds = timeit.timeit(func, number=iterations)
+                row.append('%.1f us' % (seconds / iterations * 1e6))
+        print '%-28s %14s %14s %14s %14s' % tuple(row)
+
+if __name__ == '__main__':
+    main()
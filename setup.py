@@ -35,6 +35,8 @@ setup(name='seur',
             ],
         license='GPL-3',
         extras_require={
+            'async': ['trollius'],
+            'pdf': ['PyPDF2'],
         },
-        # test_suite="seur.tests",
+        test_suite="seur.tests",
     )
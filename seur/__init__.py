@@ -1,5 +1,8 @@
 #This file is part of seur. The COPYRIGHT file at the top level of
 #this repository contains the full copyright notices and license terms.
+import importlib
+import sys
+import types
 
 __version__ = '0.0.17'
 
@@ -8,5 +11,31 @@ __all__ = [
     'Picking',
 ]
 
-from api import API
-from picking import Picking
+#Names imported from their module on first use
+LAZY = {
+    'API': 'seur.api',
+    'Picking': 'seur.picking',
+    }
+
+
+class LazyModule(types.ModuleType):
+    """
+    seur package importing API and Picking (and their dependencies) when
+    first used
+    """
+
+    def __getattr__(self, name):
+        module = LAZY.get(name)
+        if module is None:
+            raise AttributeError('module %r has no attribute %r'
+                % (self.__name__, name))
+        value = getattr(importlib.import_module(module), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(LAZY))
+
+_module = sys.modules[__name__]
+_lazy = sys.modules[__name__] = LazyModule(__name__, __doc__)
+_lazy.__dict__.update(_module.__dict__)
@@ -0,0 +1,198 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+#Production and test (pre-production) URLs by service
+URLS = {
+    'ImprimirECBWebService': (
+        'https://cit.seur.com/CIT-war/services/ImprimirECBWebService',
+        'https://citpre.seur.com/CIT-war/services/ImprimirECBWebService'),
+    'DetalleBultoPDFWebService': (
+        'https://cit.seur.com/CIT-war/services/DetalleBultoPDFWebService',
+        'https://citpre.seur.com/CIT-war/services/DetalleBultoPDFWebService'),
+    'WSCrearRecogida': (
+        'https://ws.seur.com/webseur/services/WSCrearRecogida',
+        'https://wspre.seur.com/webseur/services/WSCrearRecogida'),
+    'WSConsultaExpediciones': (
+        'https://ws.seur.com/webseur/services/WSConsultaExpediciones',
+        'https://ws.seur.com/webseur/services/WSConsultaExpediciones'),
+    'WSServiciosWebPublicos': (
+        'https://ws.seur.com/WSEcatalogoPublicos/servlet/XFireServlet/'
+        'WSServiciosWebPublicos',
+        'https://ws.seur.com/WSEcatalogoPublicos/servlet/XFireServlet/'
+        'WSServiciosWebPublicos'),
+    }
+#ECB trace settings when the context has none
+PRINTER = 'ZEBRA'
+PRINTER_MODEL = 'LP2844-Z'
+ECB_CODE = '2C'
+
+
+class Vals(dict):
+    """
+    Immutable dict of template values that are the same in every request of
+    an account. Keeps the compiled envelopes with them rendered in (see
+    seur.envelopes.EnvelopeBuilder.bound).
+    """
+    __slots__ = ('envelopes',)
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.envelopes = {}
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('%s is immutable' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = \
+        update = _immutable
+
+
+class Account(object):
+    """
+    Immutable, pre-resolved settings of a Seur account: credentials, service
+    URLs and label format. Safe to share between threads and API instances.
+
+    Example usage ::
+
+        account = Account(username, password, vat, franchise, seurid, ci,
+            ccc, context={'pdf': True})
+        with Picking.from_account(account) as picking_api:
+            reference, label, error = picking_api.create(data)
+        with Picking.from_account(account.replace(pdf=False)) as picking_api:
+            reference, label, error = picking_api.create(data)
+    """
+    __slots__ = (
+        'username',
+        'password',
+        'vat',
+        'franchise',
+        'seurid',
+        'ci',
+        'ccc',
+        'ws_username',
+        'ws_password',
+        'is_test_config',
+        'pdf',
+        'printer',
+        'printer_model',
+        'ecb_code',
+        'urls',
+        'endpoints',
+        'credentials',
+        'ws_credentials',
+        'printing',
+        'label_format',
+        'label_owner',
+    )
+
+    def __init__(self, username, password, vat, franchise, seurid, ci, ccc,
+            ws_username=False, ws_password=False, is_test_config=False,
+            context=None, urls=None):
+        """
+        :param context: dict of pdf (PDF labels instead of ECB traces) and
+                        the printer, printer_model and ecb_code of the traces
+        :param urls: dict of service name and URL to use instead of the Seur
+                     servers (see URLS)
+
+        See seur.api.API for the other arguments.
+        """
+        context = context or {}
+        init = lambda name, value: object.__setattr__(self, name, value)
+        init('username', username)
+        init('password', password)
+        init('vat', vat)
+        init('franchise', franchise)
+        init('seurid', seurid)
+        init('ci', ci)
+        init('ccc', ccc)
+        init('ws_username', ws_username)
+        init('ws_password', ws_password)
+        init('is_test_config', is_test_config)
+        init('pdf', bool(context.get('pdf')))
+        init('printer', context.get('printer', PRINTER))
+        init('printer_model', context.get('printer_model', PRINTER_MODEL))
+        init('ecb_code', context.get('ecb_code', ECB_CODE))
+
+        init('urls', Vals(urls or {}))
+        endpoints = dict((service, values[is_test_config and 1 or 0])
+            for service, values in URLS.items())
+        endpoints.update(self.urls)
+        init('endpoints', Vals(endpoints))
+        #Values of the cit.seur.com, webseur and catalogue requests
+        init('credentials', Vals(
+                username=username,
+                password=password,
+                vat=vat,
+                franchise=franchise,
+                seurid=seurid,
+                ci=ci,
+                ccc=ccc,
+                ))
+        #Values of the pickup requests
+        init('ws_credentials', Vals(
+                username=ws_username,
+                password=ws_password,
+                ))
+        #Values of the labels requests
+        if self.pdf:
+            init('printing', Vals())
+            init('label_format', 'pdf')
+        else:
+            init('printing', Vals(
+                    printer=self.printer,
+                    printer_model=self.printer_model,
+                    ecb_code=self.ecb_code,
+                    ))
+            init('label_format', '%s:%s:%s' % (self.printer,
+                    self.printer_model, self.ecb_code))
+        #Account of the stored labels: a reference is only unique by
+        #customer and server
+        init('label_owner', '%s:%s@%s' % (username, ccc,
+                self.endpoints['ImprimirECBWebService']))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Account is immutable, use replace')
+
+    def __repr__(self):
+        return '<Account %s %s>' % (self.username, self.label_format)
+
+    def url(self, service):
+        """
+        URL of a service
+
+        :param service: service name (see URLS)
+        Return string
+        """
+        return self.endpoints[service]
+
+    @property
+    def context(self):
+        """
+        Context of the label format
+
+        Return dict
+        """
+        return {
+            'pdf': self.pdf,
+            'printer': self.printer,
+            'printer_model': self.printer_model,
+            'ecb_code': self.ecb_code,
+            }
+
+    def replace(self, **changes):
+        """
+        Account with some values changed: the constructor arguments or pdf,
+        printer, printer_model and ecb_code
+
+        Return Account
+        """
+        context = self.context
+        for name in context:
+            if name in changes:
+                context[name] = changes.pop(name)
+        values = dict((name, getattr(self, name)) for name in ('username',
+                'password', 'vat', 'franchise', 'seurid', 'ci', 'ccc',
+                'ws_username', 'ws_password', 'is_test_config'))
+        values['urls'] = dict(self.urls)
+        values['context'] = context
+        values.update(changes)
+        return Account(**values)
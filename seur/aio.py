@@ -0,0 +1,344 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from seur.aiotransport import AsyncTransport
+from seur.api import API
+from seur.metrics import Timing, recording
+from seur.picking import EXISTING, Picking, registros
+from seur.transport import ConnectError
+from StringIO import StringIO
+import time
+
+import trollius as asyncio
+from trollius import From, Return
+
+
+class AsyncAPI(object):
+    """
+    API sending the requests with non-blocking I/O from an asyncio (trollius)
+    event loop
+
+    The methods take the same arguments as the API methods and return
+    asyncio tasks, to wait for with yield From or run_until_complete. The
+    requests are rendered and the responses parsed with the API methods, by
+    the event loop; they are sent by a seur.aiotransport.AsyncTransport.
+    The API retry policy, hooks, label store, catalogue, cache and request
+    coalescing apply as in the API.
+
+    Example usage ::
+
+        from seur.aio import AsyncPicking
+
+        picking_api = AsyncPicking(username, password, vat, franchise,
+            seurid, ci, ccc, context=context, loop=loop)
+        reference, label, error = yield From(picking_api.create(data))
+    """
+    __slots__ = (
+        'api',
+        'loop',
+        'transport',
+    )
+    api_class = API
+
+    def __init__(self, *args, **kwargs):
+        """
+        Same arguments as the API class but:
+
+        :param transport: seur.aiotransport.AsyncTransport of the loop
+                          (default a new one, closed by close)
+        :param loop: asyncio event loop (default the current event loop)
+        """
+        self.loop = kwargs.pop('loop', None) or asyncio.get_event_loop()
+        transport = kwargs.get('transport')
+        if transport is None:
+            transport = kwargs['transport'] = AsyncTransport(loop=self.loop)
+        self.transport = transport
+        self.api = self.api_class(*args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the idle connections
+        """
+        self.transport.close()
+
+    def set_ws_login(self, ws_username, ws_password):
+        self.api.set_ws_login(ws_username, ws_password)
+
+    def pool_stats(self):
+        return self.transport.stats()
+
+    def limit_stats(self):
+        return self.transport.limit_stats()
+
+    def start(self, operation, func, *args):
+        """
+        Run func(timing, *args) in a task of the loop, recording the Timing
+        of operation for the API hooks
+
+        Return asyncio task
+        """
+        return asyncio.ensure_future(self.instrumented(operation, func,
+                *args), loop=self.loop)
+
+    @asyncio.coroutine
+    def instrumented(self, operation, func, *args):
+        hooks = self.api.hooks
+        timing = hooks and Timing(operation) or None
+        try:
+            result = yield From(func(timing, *args))
+        except Exception as e:
+            if timing is not None:
+                timing.error = e
+            raise
+        finally:
+            if timing is not None:
+                timing.total = time.time() - timing.start
+                for hook in hooks:
+                    hook(timing)
+        raise Return(result)
+
+    def coalesce(self, method, operation, func, *args):
+        """
+        Start func like start, sharing the task of an identical call in
+        flight (see seur.coalesce)
+
+        :param method: coalesced API method of the call
+        Return asyncio future
+        """
+        flights = self.api.flights
+        key = flights is not None and method.flight_key(self.api, *args)
+        if not key:
+            return self.start(operation, func, *args)
+        future = flights.submit(key + (self.loop,),
+            lambda: self.start(operation, func, *args))
+        #A caller cancelling its wait does not cancel the shared request
+        return asyncio.shield(future, loop=self.loop)
+
+    @asyncio.coroutine
+    def send(self, timing, request, result):
+        """
+        Send a request and parse its response
+
+        :param timing: seur.metrics.Timing of the operation or None
+        :param request: callable returning the URL and XML of the request
+        :param result: callable parsing the file-like response
+        :return: result value
+        """
+        with recording(timing):
+            url, xml = request()
+        body = yield From(self.transport.post(url, xml.encode('utf-8'),
+                timing=timing))
+        with recording(timing):
+            value = result(StringIO(body))
+        raise Return(value)
+
+    @asyncio.coroutine
+    def retried(self, func, safe=True, check=None):
+        """
+        Call the coroutine function func retrying transient errors with the
+        API retry policy (see seur.retry.Retry.call). Outputs are not
+        rewound: they are written after the whole response is received.
+
+        :param safe: func may be sent again (read only)
+        :param check: coroutine function returning the result of a request
+                      that may have been processed by Seur, or None
+        """
+        retry = self.api.retry
+        attempt = 0
+        while True:
+            try:
+                result = yield From(func())
+            except Exception as e:
+                attempt += 1
+                if (retry is None or attempt >= retry.attempts
+                        or not retry.transient(e)):
+                    raise
+                if not safe and not isinstance(e, ConnectError):
+                    if check is None:
+                        raise
+                    try:
+                        result = yield From(check())
+                    except Exception:
+                        raise e
+                    if result is not None:
+                        break
+                retry.count()
+                yield From(asyncio.sleep(retry.delay(attempt - 1),
+                        loop=self.loop))
+                continue
+            break
+        raise Return(result)
+
+    def test_connection(self):
+        api = self.api
+        account = api.account
+        return self.start('test_connection', lambda timing: self.send(timing,
+                lambda: api._test_connection_request(account),
+                api._test_connection_result))
+
+
+class AsyncPicking(AsyncAPI):
+    """
+    Picking API with non-blocking I/O. See AsyncAPI and Picking.
+    """
+    __slots__ = ()
+    api_class = Picking
+
+    def create(self, data, output=None):
+        return self.start('create', self._create, data, output)
+
+    @asyncio.coroutine
+    def _create(self, timing, data, output=None):
+        api = self.api
+        account = api.account
+        reference = data.get('referencia_expedicion')
+        check = None
+        if reference:
+            check = lambda: self._existing_picking(timing, reference,
+                account)
+        result = yield From(self.retried(lambda: self.send(timing,
+                    lambda: api._create_request(data, account),
+                    lambda response: api._create_result(response, data,
+                        output, account)),
+                safe=False, check=check))
+        raise Return(result)
+
+    @asyncio.coroutine
+    def _existing_picking(self, timing, reference, account):
+        """
+        Create result of an expedition that exists in Seur, or None (see
+        Picking._existing_picking)
+        """
+        api = self.api
+        expedicion = yield From(self.send(timing,
+                lambda: api._info_request({'reference': reference}, account),
+                lambda response: api._info_result(response, records=True)))
+        if expedicion is None:
+            raise Return(None)
+        raise Return((None, None, EXISTING % reference))
+
+    def pickup_service(self, data):
+        return self.start('pickup_service', self._pickup_service, data)
+
+    @asyncio.coroutine
+    def _pickup_service(self, timing, data):
+        api = self.api
+        account = api.account
+        result = yield From(self.retried(lambda: self.send(timing,
+                    lambda: api._pickup_service_request(data, account),
+                    api._pickup_service_result),
+                safe=False))
+        raise Return(result)
+
+    def cancel_pickup(self, pickup_num, pickup_ref):
+        return self.start('cancel_pickup', self._cancel_pickup, pickup_num,
+            pickup_ref)
+
+    @asyncio.coroutine
+    def _cancel_pickup(self, timing, pickup_num, pickup_ref):
+        api = self.api
+        account = api.account
+        result = yield From(self.send(timing,
+                lambda: api._cancel_pickup_request(pickup_num, pickup_ref,
+                    account),
+                api._cancel_pickup_result))
+        raise Return(result)
+
+    def info(self, data, records=False):
+        return self.coalesce(self.api.info, 'info', self._info, data, records)
+
+    @asyncio.coroutine
+    def _info(self, timing, data, records=False):
+        api = self.api
+        account = api.account
+        result = yield From(self.retried(lambda: self.send(timing,
+                    lambda: api._info_request(data, account),
+                    lambda response: api._info_result(response, records))))
+        raise Return(result)
+
+    def list(self, data, records=False):
+        """
+        With records the task returns a list of seur.records.Expedicion
+        """
+        return self.start('list', self._list, data, records)
+
+    @asyncio.coroutine
+    def _list(self, timing, data, records=False):
+        api = self.api
+        account = api.account
+
+        def result(response):
+            result = api._list_result(response, records)
+            if records:
+                return list(result)
+            return result
+        result = yield From(self.retried(lambda: self.send(timing,
+                    lambda: api._list_request(data, account), result)))
+        raise Return(result)
+
+    def label(self, data, output=None):
+        return self.start('label', self._label, data, output)
+
+    @asyncio.coroutine
+    def _label(self, timing, data, output=None):
+        api = self.api
+        account = api.account
+        if api.labels is not None:
+            with recording(timing):
+                label = api._stored_label(data, output, account)
+            if label is not None:
+                raise Return(label)
+        result = yield From(self.retried(lambda: self.send(timing,
+                    lambda: api._label_request(data, account),
+                    lambda response: api._label_result(response, data,
+                        output, account))))
+        raise Return(result)
+
+    def manifiesto(self, data, output=None):
+        return self.coalesce(self.api.manifiesto, 'manifiesto',
+            self._manifiesto, data, output)
+
+    @asyncio.coroutine
+    def _manifiesto(self, timing, data, output=None):
+        api = self.api
+        account = api.account
+        result = yield From(self.retried(lambda: self.send(timing,
+                    lambda: api._manifiesto_request(data, account),
+                    lambda response: api._manifiesto_result(response,
+                        output))))
+        raise Return(result)
+
+    def city(self, city):
+        return self.coalesce(self.api.city, 'city', self._city, city)
+
+    def _city(self, timing, city):
+        return self._lookup(timing, 'city', city.upper())
+
+    def zip(self, zip):
+        return self.coalesce(self.api.zip, 'zip', self._zip, zip)
+
+    def _zip(self, timing, zip):
+        return self._lookup(timing, 'zip', zip)
+
+    @asyncio.coroutine
+    def _lookup(self, timing, method, key):
+        """
+        zip or city values from the catalogue or the cache, or from Seur
+        (see Picking._lookup)
+        """
+        api = self.api
+        values = api._looked_up(method, key)
+        if values is not None:
+            raise Return(values)
+        account = api.account
+        request = getattr(api, '_%s_request' % method)
+        values = yield From(self.retried(lambda: self.send(timing,
+                    lambda: request(key, account), registros)))
+        api._keep_lookup(method, key, values)
+        raise Return(values)
@@ -0,0 +1,482 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from seur.transport import (CONNECT_TIMEOUT, IDLE_TIMEOUT, MAX_LIFETIME,
+    READ_TIMEOUT, ConnectError, find_proxy, proxy_headers, stale)
+from StringIO import StringIO
+import httplib
+import socket
+import ssl
+import time
+import urllib
+import urllib2
+import urlparse
+
+import trollius as asyncio
+from trollius import From, Return
+
+POOL_SIZE = 100
+#Requests in flight of a transport
+CONCURRENCY = 100
+
+
+def socket_error(exception):
+    """
+    socket.error of an OSError raised by trollius (ConnectionResetError...),
+    the errors retried by seur.retry and seur.transport.stale
+    """
+    if isinstance(exception, socket.error):
+        return exception
+    return socket.error(exception.errno, exception.strerror or
+        str(exception))
+
+
+class Connection(object):
+    """
+    Keep-alive connection: asyncio stream reader and writer
+    """
+    __slots__ = ('reader', 'writer', 'created', 'used', 'will_close')
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.created = self.used = time.time()
+        self.will_close = False
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP(S) connections to a single host, used from one event loop
+    """
+
+    def __init__(self, scheme, host, port=None, maxsize=POOL_SIZE,
+                 idle_timeout=IDLE_TIMEOUT, max_lifetime=MAX_LIFETIME,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 proxy=None, loop=None):
+        """
+        Same arguments as seur.transport.ConnectionPool plus:
+
+        :param loop: asyncio event loop of the connections
+        """
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.proxy = proxy and urlparse.urlsplit(proxy) or None
+        self.proxy_headers = self.proxy and proxy_headers(self.proxy) or {}
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.loop = loop
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self._idle = []
+
+    @property
+    def address(self):
+        """
+        Host and port of the server
+        """
+        return self.host, self.port or (self.scheme == 'https' and 443 or 80)
+
+    def target(self, path):
+        """
+        Request target of a path: the absolute URL through an HTTP proxy
+        """
+        if self.proxy is None or self.scheme == 'https':
+            return path
+        return 'http://%s%s%s' % (self.host,
+            self.port and ':%s' % self.port or '', path)
+
+    def headers(self, headers):
+        """
+        Request headers with the proxy credentials of plain HTTP requests
+        """
+        if self.proxy is None or self.scheme == 'https':
+            return headers
+        headers = dict(headers)
+        headers.update(self.proxy_headers)
+        return headers
+
+    @asyncio.coroutine
+    def connect(self):
+        """
+        Open a new connection
+
+        Raise ConnectError if it fails
+        """
+        try:
+            conn = yield From(asyncio.wait_for(self._open(),
+                    self.connect_timeout, loop=self.loop))
+        except ConnectError:
+            raise
+        except asyncio.TimeoutError:
+            raise ConnectError('%s:%s timed out' % (self.host,
+                    self.port or ''))
+        except (EnvironmentError, ssl.SSLError) as e:
+            raise ConnectError('%s:%s %s' % (self.host, self.port or '', e))
+        raise Return(conn)
+
+    @asyncio.coroutine
+    def _open(self):
+        host, port = self.address
+        tls = self.scheme == 'https' or None
+        if self.proxy is None:
+            reader, writer = yield From(asyncio.open_connection(host, port,
+                    ssl=tls, loop=self.loop))
+        elif self.scheme == 'https':
+            sock = yield From(self._tunnel(host, port))
+            reader, writer = yield From(asyncio.open_connection(sock=sock,
+                    ssl=tls, server_hostname=host, loop=self.loop))
+        else:
+            reader, writer = yield From(asyncio.open_connection(
+                    self.proxy.hostname, self.proxy.port or 80,
+                    loop=self.loop))
+        raise Return(Connection(reader, writer))
+
+    @asyncio.coroutine
+    def _tunnel(self, host, port):
+        """
+        Socket connected to host through the proxy with CONNECT
+        """
+        loop = self.loop
+        addresses = yield From(loop.getaddrinfo(self.proxy.hostname,
+                self.proxy.port or 80, type=socket.SOCK_STREAM))
+        family, type, proto, _, address = addresses[0]
+        sock = socket.socket(family, type, proto)
+        sock.setblocking(False)
+        request = ['CONNECT %s:%s HTTP/1.1' % (host, port),
+            'Host: %s:%s' % (host, port)]
+        request.extend('%s: %s' % header
+            for header in self.proxy_headers.items())
+        try:
+            yield From(loop.sock_connect(sock, address))
+            yield From(loop.sock_sendall(sock,
+                    '\r\n'.join(request) + '\r\n\r\n'))
+            data = ''
+            while '\r\n\r\n' not in data:
+                chunk = yield From(loop.sock_recv(sock, 4096))
+                if not chunk:
+                    break
+                data += chunk
+            line = data.split('\r\n', 1)[0]
+            parts = line.split(None, 2)
+            if len(parts) < 2 or parts[1] != '200':
+                raise ConnectError('Tunnel connection failed: %s' % line)
+        except Exception:
+            sock.close()
+            raise
+        raise Return(sock)
+
+    def _expired(self, created, used, now):
+        return (now - used > self.idle_timeout or
+            now - created > self.max_lifetime)
+
+    def get(self):
+        """
+        Get an idle connection
+
+        Return (connection or None to open a new one, reused)
+        """
+        now = time.time()
+        while self._idle:
+            conn = self._idle.pop()
+            if (self._expired(conn.created, conn.used, now)
+                    or conn.reader.at_eof()):
+                conn.close()
+                self.discarded += 1
+                continue
+            self.reused += 1
+            return conn, True
+        self.created += 1
+        return None, False
+
+    def put(self, conn):
+        """
+        Give back a connection after a full response was read
+        """
+        now = time.time()
+        conn.used = now
+        if (not conn.will_close and len(self._idle) < self.maxsize
+                and not self._expired(conn.created, now, now)):
+            self._idle.append(conn)
+            return
+        self.discarded += 1
+        conn.close()
+
+    def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        idle = len(self._idle)
+        requests = self.created + self.reused
+        return {
+            'requests': requests,
+            'created': self.created,
+            'reused': self.reused,
+            'discarded': self.discarded,
+            'idle': idle,
+            'reuse_rate': requests and float(self.reused) / requests or 0.0,
+            }
+
+
+class AsyncTransport(object):
+    """
+    Send SOAP requests with non-blocking I/O from an asyncio (trollius) event
+    loop, over per-host keep-alive connection pools
+
+    The responses are read whole before they are parsed. The seur.limits of
+    the blocking transport do not apply (they block threads): the requests
+    in flight are limited by concurrency.
+
+    Example usage ::
+
+        transport = AsyncTransport(loop=loop)
+        body = loop.run_until_complete(transport.post(url, xml))
+    """
+
+    def __init__(self, maxsize=POOL_SIZE, idle_timeout=IDLE_TIMEOUT,
+                 max_lifetime=MAX_LIFETIME, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, proxies=None,
+                 concurrency=CONCURRENCY, loop=None):
+        """
+        Same arguments as seur.transport.Transport (without limits) plus:
+
+        :param concurrency: max requests in flight
+        :param loop: asyncio event loop (default the current event loop)
+        """
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.proxies = proxies
+        self.concurrency = concurrency
+        self.loop = loop or asyncio.get_event_loop()
+        self.semaphore = asyncio.Semaphore(concurrency, loop=self.loop)
+        self.inflight = 0
+        self.waits = 0
+        self.pools = {}
+
+    def proxy(self, scheme, host):
+        """
+        URL of the proxy of a host or None
+        """
+        if self.proxies is None:
+            self.proxies = urllib.getproxies()
+        return find_proxy(self.proxies, scheme, host)
+
+    def get_pool(self, scheme, host, port=None):
+        key = (scheme, host, port)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = ConnectionPool(scheme, host, port,
+                maxsize=self.maxsize, idle_timeout=self.idle_timeout,
+                max_lifetime=self.max_lifetime,
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                proxy=self.proxy(scheme, host), loop=self.loop)
+        return pool
+
+    @asyncio.coroutine
+    def post(self, url, body, headers=None, timing=None):
+        """
+        POST body to url and return the response body
+
+        Raise urllib2.HTTPError on HTTP error status like urllib2.urlopen
+
+        :param timing: seur.metrics.Timing of the operation or None
+        """
+        parts = urlparse.urlsplit(url)
+        pool = self.get_pool(parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        request_headers = {
+            'Host': parts.netloc,
+            'Content-Type': 'text/xml; charset=utf-8',
+            'Content-Length': str(len(body)),
+            }
+        if headers:
+            request_headers.update(headers)
+        if timing is not None:
+            timing.url = url
+            timing.request_size += len(body)
+
+        if self.semaphore.locked():
+            self.waits += 1
+        yield From(self.semaphore.acquire())
+        self.inflight += 1
+        try:
+            status, reason, msg, data = yield From(self._request(pool,
+                    pool.target(path), body, pool.headers(request_headers),
+                    timing))
+        finally:
+            self.inflight -= 1
+            self.semaphore.release()
+        if status >= 400:
+            raise urllib2.HTTPError(url, status, reason, msg, StringIO(data))
+        raise Return(data)
+
+    @asyncio.coroutine
+    def _request(self, pool, path, body, headers, timing=None):
+        """
+        Send the request on a pooled connection and read the response
+
+        The request is sent again on another connection only when a reused
+        keep-alive connection turns out to be closed by the server before
+        any response (see seur.transport.stale). Timeouts and other errors
+        are raised: the server may have received the request.
+
+        Return (status, reason, httplib.HTTPMessage, body)
+        """
+        request = ''.join(['POST %s HTTP/1.1\r\n' % path]
+            + ['%s: %s\r\n' % header for header in headers.items()]
+            + ['\r\n', body])
+        while True:
+            conn, reused = pool.get()
+            start = time.time()
+            if conn is None:
+                conn = yield From(pool.connect())
+            sent = time.time()
+            if timing is not None:
+                timing.connect += sent - start
+            try:
+                conn.writer.write(request)
+                status, reason, msg = yield From(self._status(pool, conn))
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                if reused and stale(e, sending=True):
+                    continue
+                raise
+            if timing is not None:
+                timing.ttfb += time.time() - sent
+            start = time.time()
+            try:
+                data = yield From(self._body(pool, conn, msg))
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                raise
+            if timing is not None:
+                timing.transfer += time.time() - start
+                timing.response_size += len(data)
+            pool.put(conn)
+            raise Return((status, reason, msg, data))
+
+    @asyncio.coroutine
+    def _read(self, pool, read):
+        """
+        Wait for a read of the response, up to the read timeout
+        """
+        try:
+            data = yield From(asyncio.wait_for(read, pool.read_timeout,
+                    loop=self.loop))
+        except asyncio.TimeoutError:
+            raise socket.timeout('timed out')
+        except asyncio.IncompleteReadError as e:
+            raise httplib.IncompleteRead(e.partial)
+        except EnvironmentError as e:
+            raise socket_error(e)
+        raise Return(data)
+
+    @asyncio.coroutine
+    def _status(self, pool, conn):
+        """
+        Read the status line and the headers of the response, skipping the
+        1xx informational responses
+
+        Return (status, reason, httplib.HTTPMessage)
+        """
+        while True:
+            line = yield From(self._read(pool, conn.reader.readline()))
+            if not line:
+                raise httplib.BadStatusLine("''")
+            parts = line.split(None, 2)
+            if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+                raise httplib.BadStatusLine(line)
+            try:
+                status = int(parts[1])
+            except ValueError:
+                raise httplib.BadStatusLine(line)
+            reason = len(parts) > 2 and parts[2].strip() or ''
+            lines = []
+            while True:
+                header = yield From(self._read(pool, conn.reader.readline()))
+                if header in ('\r\n', '\n', ''):
+                    break
+                lines.append(header)
+            if status >= 200:
+                break
+        msg = httplib.HTTPMessage(StringIO(''.join(lines)))
+        conn.will_close = (msg.getheader('connection', '').lower() == 'close'
+            or parts[0] == 'HTTP/1.0')
+        raise Return((status, reason, msg))
+
+    @asyncio.coroutine
+    def _body(self, pool, conn, msg):
+        """
+        Read the response body: chunked, of Content-Length or up to the end
+        of the connection
+        """
+        reader = conn.reader
+        if msg.getheader('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                line = yield From(self._read(pool, reader.readline()))
+                try:
+                    size = int(line.split(';', 1)[0], 16)
+                except ValueError:
+                    raise httplib.IncompleteRead(''.join(chunks))
+                if not size:
+                    break
+                chunks.append((yield From(self._read(pool,
+                                reader.readexactly(size)))))
+                yield From(self._read(pool, reader.readexactly(2)))
+            #Trailers
+            while True:
+                line = yield From(self._read(pool, reader.readline()))
+                if line in ('\r\n', '\n', ''):
+                    break
+            raise Return(''.join(chunks))
+        length = msg.getheader('content-length')
+        if length is not None:
+            data = yield From(self._read(pool,
+                    reader.readexactly(int(length))))
+            raise Return(data)
+        conn.will_close = True
+        data = yield From(self._read(pool, reader.read()))
+        raise Return(data)
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+
+    def limit_stats(self):
+        """
+        Concurrency limit of the transport: limit, requests in flight and
+        requests that waited for a free slot
+
+        Return dict
+        """
+        return {
+            'limit': self.concurrency,
+            'inflight': self.inflight,
+            'waits': self.waits,
+            }
+
+    def stats(self):
+        """
+        Connection pool stats by host
+
+        Return dict
+        """
+        return dict(('%s://%s' % (scheme, host) +
+                (port and ':%s' % port or ''), pool.stats())
+            for (scheme, host, port), pool in self.pools.items())
@@ -1,15 +1,68 @@
 #This file is part of seur. The COPYRIGHT file at the top level of
 #this repository contains the full copyright notices and license terms.
 
-from xml.dom.minidom import parseString
-import urllib2
-import os
-import genshi
-import genshi.template
+from seur.account import Account, URLS
+from seur.coalesce import flights as default_flights
+from seur.metrics import current, instrumented
+from seur.parser import parse
+from seur.retry import Retry
+from seur.templates import loader
+from seur.transport import transport as default_transport
+import time
 
-loader = genshi.template.TemplateLoader(
-    os.path.join(os.path.dirname(__file__), 'template'),
-    auto_reload=True)
+#Shared by all API instances without a retry policy
+default_retry = Retry()
+
+
+def account_property(name):
+    """
+    Attribute of the account of an API. Setting it replaces the account by
+    a copy with the new value (see seur.account.Account.replace).
+    """
+    def setter(self, value):
+        self.account = self.account.replace(**{name: value})
+    return property(lambda self: getattr(self.account, name), setter,
+        doc='%s of the account' % name)
+
+
+class AccountContext(dict):
+    """
+    Context of the account of an API. Changing it replaces the account, as
+    changing the context dict given to the API did.
+    """
+
+    def __init__(self, api):
+        super(AccountContext, self).__init__(api.account.context)
+        self.api = api
+
+    def _changed(self):
+        self.api.context = dict(self)
+
+    def __setitem__(self, name, value):
+        super(AccountContext, self).__setitem__(name, value)
+        self._changed()
+
+    def __delitem__(self, name):
+        super(AccountContext, self).__delitem__(name)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        super(AccountContext, self).update(*args, **kwargs)
+        self._changed()
+
+    def setdefault(self, name, value=None):
+        value = super(AccountContext, self).setdefault(name, value)
+        self._changed()
+        return value
+
+    def pop(self, name, *args):
+        value = super(AccountContext, self).pop(name, *args)
+        self._changed()
+        return value
+
+    def clear(self):
+        super(AccountContext, self).clear()
+        self._changed()
 
 
 class API(object):
@@ -18,22 +71,23 @@ class API(object):
     """
     __slots__ = (
         'url',
-        'username',
-        'password',
-        'vat',
-        'franchise',
-        'seurid',
-        'ci',
-        'ccc',
-        'context',
-        'ws_username',
-        'ws_password',
-        'is_test_config',
+        'transport',
+        'catalogue',
+        'cache',
+        'hooks',
+        'renderer',
+        'retry',
+        'labels',
+        'flights',
+        'account',
     )
 
     def __init__(self, username, password, vat, franchise, seurid, ci, ccc,
                  ws_username=False, ws_password=False, is_test_config=False,
-                 context={}):
+                 context=None, transport=None, catalogue=None,
+                 cache=None, urls=None, hooks=None,
+                 renderer=None, retry=None, labels=None,
+                 flights=None, account=None):
         """
         This is the Base API class which other APIs have to subclass. By
         default the inherited classes also get the properties of this
@@ -61,18 +115,76 @@ class API(object):
                             ws.seur.com webservice (pickup services)
         :param ws_password: API password of the Seur Web Services. Used for
                             ws.seur.com webservice (pickup services)
+        :param transport: seur.transport.Transport used to send requests. By
+                          default a keep-alive connection pool shared by all
+                          instances
+        :param catalogue: seur.catalogue.Catalogue looked up by Picking.zip
+                          and Picking.city before calling the webservice
+        :param cache: seur.cache.Cache of Picking.zip and Picking.city values
+        :param urls: dict of service name and URL to use instead of the Seur
+                     servers (see URLS)
+        :param hooks: list of callables called with the seur.metrics.Timing
+                      of each operation (see seur.metrics.Metrics)
+        :param renderer: object rendering the request templates, with a
+                         render(template, vals) method: the Genshi
+                         templates cache (default) or
+                         seur.envelopes.builder
+        :param retry: seur.retry.Retry policy of the requests (default shared
+                      by the process), False for no retries
+        :param labels: seur.labels.LabelStore of the labels received, looked
+                       up by Picking.label before calling the webservice
+        :param flights: seur.coalesce.SingleFlight sharing the requests in
+                        flight of identical concurrent lookups (default
+                        shared by the process), False to not coalesce them
+        :param account: seur.account.Account with the credentials, URLs and
+                        label format already resolved, shared with other
+                        instances (built from the other arguments if not set)
         """
-        self.username = username
-        self.password = password
-        self.vat = vat
-        self.franchise = franchise
-        self.seurid = seurid
-        self.ci = ci
-        self.ccc = ccc
-        self.context = context
-        self.ws_username = ws_username
-        self.ws_password = ws_password
-        self.is_test_config = is_test_config
+        if account is None:
+            account = Account(username, password, vat, franchise, seurid,
+                ci, ccc, ws_username=ws_username, ws_password=ws_password,
+                is_test_config=is_test_config, context=context, urls=urls)
+        self.account = account
+        self.transport = transport or default_transport
+        self.catalogue = catalogue
+        self.cache = cache
+        self.hooks = list(hooks or [])
+        if renderer is None:
+            renderer = loader
+        self.renderer = renderer
+        if retry is None:
+            retry = default_retry
+        self.retry = retry or None
+        self.labels = labels
+        if flights is None:
+            flights = default_flights
+        self.flights = flights or None
+
+    username = account_property('username')
+    password = account_property('password')
+    vat = account_property('vat')
+    franchise = account_property('franchise')
+    seurid = account_property('seurid')
+    ci = account_property('ci')
+    ccc = account_property('ccc')
+    ws_username = account_property('ws_username')
+    ws_password = account_property('ws_password')
+    is_test_config = account_property('is_test_config')
+    context = property(AccountContext, account_property('context').fset,
+        doc='context of the account')
+    urls = account_property('urls')
+
+    @classmethod
+    def from_account(cls, account, **kwargs):
+        """
+        Instance of an Account, sharing its resolved settings
+
+        :param account: seur.account.Account
+        :param kwargs: other arguments (transport, cache, hooks...)
+        """
+        return cls(account.username, account.password, account.vat,
+            account.franchise, account.seurid, account.ci, account.ccc,
+            account=account, **kwargs)
 
     def __enter__(self):
         return self
@@ -89,8 +201,63 @@ class API(object):
         :param ws_username: username for ws.seur.com
         :param ws_password: password for ws.seur.com
         """
-        self.ws_username = ws_username
-        self.ws_password = ws_password
+        self.account = self.account.replace(ws_username=ws_username,
+            ws_password=ws_password)
+
+    def get_url(self, service, account=None):
+        """
+        URL of a service: the production or test server or the one set in
+        urls
+
+        :param service: service name (see URLS)
+        :param account: seur.account.Account read by the caller (default
+                        the API account)
+        Return string
+        """
+        timing = current()
+        if timing is not None:
+            timing.service = service
+        return (account or self.account).url(service)
+
+    def server(self, service):
+        """
+        URL of a service, without recording it in the current timing
+
+        :param service: service name (see URLS)
+        Return string
+        """
+        return self.account.url(service)
+
+    def add_hook(self, hook):
+        """
+        Call hook with the seur.metrics.Timing of each operation: seconds
+        spent rendering the template, connecting, waiting the first byte,
+        reading and parsing the response and request/response sizes
+
+        :param hook: callable
+        """
+        self.hooks.append(hook)
+
+    def render(self, template, vals, fixed=None):
+        """
+        Render a template
+
+        :param template: template file name
+        :param vals: dict of template values
+        :param fixed: seur.account.Vals of vals that are the same in every
+                      request of the account. Renderers with compiled
+                      envelopes (seur.envelopes.builder) render them once
+        Return unicode XML
+        """
+        timing = current()
+        start = time.time()
+        if fixed is not None and hasattr(self.renderer, 'bound'):
+            xml = self.renderer.render(template, vals, fixed=fixed)
+        else:
+            xml = self.renderer.render(template, vals)
+        if timing is not None:
+            timing.render += time.time() - start
+        return xml
 
     def connect(self, url, xml):
         """
@@ -102,39 +269,76 @@ class API(object):
         Return XML object
         """
         xml = xml.encode('utf-8')
-        headers={}
-        request = urllib2.Request(url, xml, headers)
-        response = urllib2.urlopen(request)
-        return response.read()
+        return self.transport.post(url, xml)
+
+    def connect_stream(self, url, xml):
+        """
+        Connect to the Webservices and return the response from seur to read
+        incrementally
+
+        :param url: url service.
+        :param xml: XML data.
+
+        Return file-like object
+        """
+        xml = xml.encode('utf-8')
+        return self.transport.open(url, xml)
+
+    def pool_stats(self):
+        """
+        Connection pool stats by host: requests, created, reused, discarded
+        and idle connections and the reuse rate
+
+        Return dict
+        """
+        return self.transport.stats()
+
+    def limit_stats(self):
+        """
+        Rate and concurrency limits by endpoint: current limit, requests in
+        flight, requests, errors, latency and rate limit waits
+
+        Return dict
+        """
+        return self.transport.limit_stats()
 
+    @instrumented('test_connection')
     def test_connection(self):
         """
         Test connection to Seur webservices
         Send XML to Seur and return error send data
         """
-        tmpl = loader.load('test_connection.xml')
+        url, xml = self._test_connection_request(self.account)
+        return self._test_connection_result(self.connect_stream(url, xml))
 
-        vals = {
-            'username': self.username,
-            'password': self.password,
-            'vat': self.vat,
-            'franchise': self.franchise,
-            'seurid': self.seurid,
-            }
+    def _test_connection_request(self, account):
+        """
+        URL and XML of a test_connection request
 
-        url = 'https://cit.seur.com/CIT-war/services/ImprimirECBWebService'
-        if self.is_test_config:
-            url = 'https://citpre.seur.com/CIT-war/services/ImprimirECBWebService'
-        xml = tmpl.generate(**vals).render()
-        result = self.connect(url, xml)
-        dom = parseString(result)
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        template = 'test_connection.xml'
+
+        vals = dict(account.credentials)
+
+        url = self.get_url('ImprimirECBWebService', account)
+        xml = self.render(template, vals, fixed=account.credentials)
+        return url, xml
+
+    def _test_connection_result(self, response):
+        """
+        Parse a test_connection response (see test_connection)
+
+        :param response: file-like XML response
+        """
+        result = parse(response)
 
         #Get message connection
         #username and password wrong, get error message
         #send a shipment error, connection successfully
-        message = dom.getElementsByTagName('mensaje')
-        if message:
-            msg = message[0].firstChild.data
+        msg = result.text('mensaje')
+        if msg is not None:
             if msg == 'ERROR':
                 return 'Connection successfully'
             return msg
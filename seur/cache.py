@@ -0,0 +1,207 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class MemoryBackend(object):
+    """
+    In-process LRU store
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        :param maxsize: max entries, the least recently used are evicted
+        """
+        self.maxsize = maxsize
+        self.evictions = 0
+        self.data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return None
+            self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.data.clear()
+
+
+class FileBackend(object):
+    """
+    Store in a local directory, one JSON file per key, that several
+    processes can share. Files are replaced atomically.
+    """
+
+    def __init__(self, path, maxsize=None):
+        """
+        :param path: directory, created if not exists
+        :param maxsize: max entries, the least recently used are evicted
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.evictions = 0
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+    def __len__(self):
+        return len(self._files())
+
+    def _files(self):
+        return [f for f in os.listdir(self.path) if f.endswith('.json')]
+
+    def filename(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return os.path.join(self.path,
+            '%s.json' % hashlib.sha1(key).hexdigest())
+
+    def get(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                value = json.load(f)
+        except (IOError, ValueError):
+            return None
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        filename = self.filename(key)
+        tmp = '%s.%s.%s.tmp' % (filename, os.getpid(),
+            threading.current_thread().ident)
+        with open(tmp, 'wb') as f:
+            json.dump(value, f, separators=(',', ':'))
+        os.rename(tmp, filename)
+        if self.maxsize:
+            self._evict()
+
+    def _evict(self):
+        files = self._files()
+        if len(files) <= self.maxsize:
+            return
+        mtimes = []
+        for name in files:
+            try:
+                mtimes.append((os.path.getmtime(
+                    os.path.join(self.path, name)), name))
+            except OSError:
+                pass
+        mtimes.sort()
+        for _, name in mtimes[:len(mtimes) - self.maxsize]:
+            try:
+                os.remove(os.path.join(self.path, name))
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self.filename(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in self._files():
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+
+class Cache(object):
+    """
+    Cache of Picking.zip and Picking.city values with a time to live
+
+    Example usage ::
+
+        cache = Cache(FileBackend('/var/cache/seur'), ttl=86400,
+            negative_ttl=3600)
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context=context, cache=cache) as picking_api:
+            options = picking_api.zip('08720')
+        print cache.stats()
+    """
+
+    def __init__(self, backend=None, ttl=86400, negative_ttl=0):
+        """
+        :param backend: MemoryBackend (default) or FileBackend
+        :param ttl: seconds the values are kept
+        :param negative_ttl: seconds empty values (unknown zip or city) are
+                             kept. 0 to not cache them
+        """
+        if backend is None:
+            backend = MemoryBackend()
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key):
+        """
+        Return the cached values or None
+        """
+        entry = self.backend.get(key)
+        if entry is not None:
+            expires, values = entry
+            if expires > time.time():
+                self.hits += 1
+                return values
+            self.backend.delete(key)
+            self.expired += 1
+        self.misses += 1
+        return None
+
+    def set(self, key, values):
+        ttl = values and self.ttl or self.negative_ttl
+        if ttl:
+            self.backend.set(key, (time.time() + ttl, values))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Return dict of hits, misses, expired, evictions and size
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.backend.evictions,
+            'size': len(self.backend),
+            }
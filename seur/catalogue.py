@@ -0,0 +1,187 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+import bisect
+import gzip
+import json
+import os
+import threading
+import unicodedata
+
+#Fields of the REGn records returned by Picking.zip and Picking.city
+ZIP_FIELD = 'CODIGO_POSTAL'
+CITY_FIELD = 'NOM_POBLACION'
+
+
+def normalize(name):
+    """
+    Accent and case insensitive key of a town name
+
+    :param name: string
+    :return: string
+    """
+    if not isinstance(name, unicode):
+        name = name.decode('utf-8')
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore')
+    return ' '.join(name.upper().split())
+
+
+class Catalogue(object):
+    """
+    Local index of Seur towns and postal codes
+
+    Built from the records returned by Picking.zip and Picking.city and saved
+    to a gzip JSON file. Pass it to Picking to look up towns and postal codes
+    locally before calling the webservice. Only the postal codes and towns
+    fetched in full are answered locally: the records of a postal code found
+    by a town query are not all the towns of the postal code.
+
+    Example usage ::
+
+        catalogue = Catalogue('/var/lib/seur/catalogue.json.gz')
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context=context, catalogue=catalogue) as picking_api:
+            options = picking_api.zip('08720')
+        catalogue.save()
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: file of the index. Loaded if exists
+        """
+        self.path = path
+        self.records = set()
+        self.zips = {}
+        self.cities = {}
+        #Postal codes and normalized towns fetched in full
+        self.complete_zips = set()
+        self.complete_cities = set()
+        self._keys = None
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, values, zip=None, city=None):
+        """
+        Add records to the index
+
+        :param values: list of dict (Picking.zip or Picking.city result)
+        :param zip: postal code whose records are all in values
+        :param city: town whose records are all in values
+        """
+        with self._lock:
+            if zip:
+                self.complete_zips.add(zip.strip())
+            if city:
+                self.complete_cities.add(normalize(city))
+            for vals in values:
+                record = tuple(sorted(vals.items()))
+                if record in self.records:
+                    continue
+                self.records.add(record)
+                value = vals.get(ZIP_FIELD)
+                if value:
+                    self.zips.setdefault(value.strip(), []).append(vals)
+                value = vals.get(CITY_FIELD)
+                if value:
+                    self.cities.setdefault(normalize(value), []).append(vals)
+                    self._keys = None
+
+    def zip(self, zip):
+        """
+        Records of a postal code fetched in full
+
+        :param zip: string
+        :return: list dict or None if not found
+        """
+        zip = zip.strip()
+        if zip not in self.complete_zips:
+            return None
+        values = self.zips.get(zip)
+        return values and list(values)
+
+    def city(self, city):
+        """
+        Records of a town fetched in full. Accent and case insensitive.
+
+        :param city: string
+        :return: list dict or None if not found
+        """
+        city = normalize(city)
+        if city not in self.complete_cities:
+            return None
+        values = self.cities.get(city)
+        return values and list(values)
+
+    def city_prefix(self, prefix):
+        """
+        Records of the towns starting with prefix, fetched in full or not.
+        Accent and case insensitive.
+
+        :param prefix: string
+        :return: list dict
+        """
+        keys = self._keys
+        if keys is None:
+            keys = self._keys = sorted(self.cities)
+        prefix = normalize(prefix)
+        values = []
+        for key in keys[bisect.bisect_left(keys, prefix):]:
+            if not key.startswith(prefix):
+                break
+            values.extend(self.cities[key])
+        return values
+
+    def update(self, picking, zips=(), cities=()):
+        """
+        Fetch postal codes and towns from Seur and add them to the index
+
+        :param picking: Picking instance
+        :param zips: list of postal codes
+        :param cities: list of towns
+        """
+        for zip in zips:
+            self.add(picking.zip(zip), zip=zip)
+        for city in cities:
+            self.add(picking.city(city), city=city)
+
+    def load(self, path=None):
+        path = path or self.path
+        f = gzip.open(path, 'rb')
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+        fields = data['fields']
+        self.add(dict((k, v) for k, v in zip(fields, row) if v is not None)
+            for row in data['rows'])
+        with self._lock:
+            self.complete_zips.update(data.get('complete_zips', ()))
+            self.complete_cities.update(data.get('complete_cities', ()))
+
+    def save(self, path=None):
+        """
+        Write the index to a gzip JSON file (fields and rows of values)
+        """
+        path = path or self.path
+        with self._lock:
+            records = [dict(r) for r in self.records]
+            complete_zips = sorted(self.complete_zips)
+            complete_cities = sorted(self.complete_cities)
+        fields = sorted(set(k for vals in records for k in vals))
+        data = {
+            'fields': fields,
+            'rows': [[vals.get(k) for k in fields] for vals in records],
+            'complete_zips': complete_zips,
+            'complete_cities': complete_cities,
+            }
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        f = gzip.open(tmp, 'wb')
+        try:
+            json.dump(data, f, separators=(',', ':'))
+        finally:
+            f.close()
+        os.rename(tmp, path)
@@ -0,0 +1,386 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from seur.cache import Cache
+from seur.limits import Limits
+from seur.metrics import Metrics
+from seur.picking import Picking
+from seur.transport import POOL_SIZE, Transport
+import Queue
+import collections
+import threading
+import time
+
+#Threads sending the requests of all the accounts
+MAX_WORKERS = 8
+#Seconds of the throughput counters
+WINDOW = 60
+
+
+class Task(object):
+    """
+    Request queued in a ClientManager
+    """
+
+    def __init__(self, client, method, args, kwargs):
+        self.client = client
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.queued = time.time()
+        self.value = None
+        self.exception = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        try:
+            self.value = getattr(self.client.picking, self.method)(
+                *self.args, **self.kwargs)
+        except Exception as e:
+            self.exception = e
+
+    def finish(self):
+        """
+        Set the task done and call its callbacks
+        """
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """
+        Call callback with the task when it is done (in the worker thread)
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the request and return its result or raise its exception
+
+        :param timeout: seconds to wait, None for no limit
+        """
+        if not self._event.wait(timeout):
+            raise RuntimeError('Task not done after %s seconds' % timeout)
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+class Client(object):
+    """
+    Warm Picking of an account in a ClientManager, with its own connection
+    pools, rate limits and cache, its queue of requests and its counters
+    """
+
+    def __init__(self, name, picking, weight=1, concurrency=None):
+        self.name = name
+        self.picking = picking
+        self.weight = weight
+        self.concurrency = concurrency
+        self.metrics = Metrics()
+        picking.add_hook(self.metrics)
+        self.queue = collections.deque()
+        self.running = 0
+        #Virtual time of the fair scheduling
+        self.vtime = 0.0
+        self.completed = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.wait = 0.0
+        self.finished = collections.deque()
+
+    def ready(self):
+        """
+        The client has queued requests and is under its concurrency
+        """
+        return bool(self.queue) and (self.concurrency is None
+            or self.running < self.concurrency)
+
+    def done(self, task, started, now):
+        """
+        Count a finished task
+        """
+        self.running -= 1
+        self.completed += 1
+        if task.exception is not None:
+            self.errors += 1
+        latency = now - started
+        self.latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.wait += started - task.queued
+        self.finished.append(now)
+        while self.finished and self.finished[0] < now - WINDOW:
+            self.finished.popleft()
+
+    def stats(self):
+        """
+        Queued and running requests, completed requests and errors,
+        throughput (requests per second in the last WINDOW seconds), mean and
+        max latency, mean queue wait, and the timings by operation, pools,
+        limits and cache of the account
+
+        Return dict
+        """
+        completed = self.completed or 1
+        now = time.time()
+        throughput = len([t for t in self.finished if t >= now - WINDOW])
+        picking = self.picking
+        return {
+            'queued': len(self.queue),
+            'running': self.running,
+            'completed': self.completed,
+            'errors': self.errors,
+            'throughput': float(throughput) / WINDOW,
+            'latency': self.latency / completed,
+            'max_latency': self.max_latency,
+            'wait': self.wait / completed,
+            'operations': self.metrics.stats(),
+            'pools': picking.pool_stats(),
+            'limits': picking.limit_stats(),
+            'cache': picking.cache and picking.cache.stats() or {},
+            }
+
+
+class ClientManager(object):
+    """
+    One warm Picking per account, each with its own connection pools, rate
+    limits and cache, sending the requests of all the accounts from a shared
+    pool of threads
+
+    The queued requests of the accounts are sent in weighted fair order: an
+    account with a large wave of requests gets its share of the threads but
+    the requests of the other accounts do not wait behind it.
+
+    Example usage ::
+
+        from seur.account import Account
+        from seur.clients import ClientManager
+
+        with ClientManager(max_workers=16) as manager:
+            manager.add('acme', Account(username, password, vat, franchise,
+                seurid, ci, ccc, ws_username=ws_username,
+                ws_password=ws_password, context=context))
+            manager.add('other', other_account, weight=2,
+                limits={'rate': 5})
+            for index, result, error in manager.map('acme', 'create', datas):
+                print index, result, error
+            reference, label, error = manager.submit('other', 'create',
+                data).result()
+            print manager.stats()
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, maxsize=POOL_SIZE,
+            limits=None, cache=True, **kwargs):
+        """
+        :param max_workers: requests sent at the same time by all accounts
+        :param maxsize: idle connections kept by host of each account
+        :param limits: dict of seur.limits.EndpointLimiter arguments of each
+                       account (rate, burst, limit...)
+        :param cache: keep a seur.cache.Cache of zip and city per account
+        :param kwargs: other Picking arguments of every account (renderer,
+                       labels, retry, hooks...)
+        """
+        self.max_workers = max_workers
+        self.maxsize = maxsize
+        self.limits = limits or {}
+        self.cache = cache
+        self.kwargs = kwargs
+        self.clients = collections.OrderedDict()
+        self.vtime = 0.0
+        self._threads = []
+        self._closed = False
+        self._lock = threading.Condition(threading.Lock())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __getitem__(self, name):
+        return self.clients[name].picking
+
+    def __contains__(self, name):
+        return name in self.clients
+
+    def add(self, name, account, weight=1, concurrency=None, limits=None,
+            maxsize=None, cache=None, **kwargs):
+        """
+        Add an account
+
+        :param name: name of the account in the manager
+        :param account: seur.account.Account
+        :param weight: share of the threads when several accounts have
+                       queued requests
+        :param concurrency: max requests of the account at the same time
+                            (default max_workers)
+        :param limits: dict of EndpointLimiter arguments of the account
+                       (default the limits of the manager)
+        :param maxsize: idle connections kept by host (default the maxsize of
+                        the manager)
+        :param cache: seur.cache.Cache of zip and city, False for none
+                      (default a new Cache if the manager has cache)
+        :param kwargs: other Picking arguments
+        :return: Picking of the account
+        """
+        if cache is None:
+            cache = self.cache and Cache() or None
+        options = dict(self.kwargs)
+        options.update(kwargs)
+        transport = Transport(maxsize=maxsize or self.maxsize,
+            limits=Limits(**(limits or self.limits)))
+        picking = Picking.from_account(account, transport=transport,
+            cache=cache or None, **options)
+        client = Client(name, picking, weight=weight, concurrency=concurrency)
+        with self._lock:
+            if name in self.clients:
+                raise KeyError('Account %s already added' % name)
+            self.clients[name] = client
+        return picking
+
+    def remove(self, name):
+        """
+        Remove an account, failing its queued requests, and close its
+        connections
+        """
+        with self._lock:
+            client = self.clients.pop(name)
+            tasks = list(client.queue)
+            client.queue.clear()
+        for task in tasks:
+            task.exception = KeyError('Account %s removed' % name)
+            task.finish()
+        client.picking.transport.close()
+
+    def set_ws_login(self, name, ws_username, ws_password):
+        """
+        Set the ws.seur.com username and password of an account
+        """
+        self[name].set_ws_login(ws_username, ws_password)
+
+    def submit(self, name, method, *args, **kwargs):
+        """
+        Queue a request of an account
+
+        :param name: name of the account
+        :param method: Picking method name (create, label, pickup_service...)
+        :param args: arguments of the method
+        :return: Task
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('ClientManager is closed')
+            client = self.clients[name]
+            task = Task(client, method, args, kwargs)
+            if not client.queue and not client.running:
+                #Idle accounts do not save up turns
+                client.vtime = max(client.vtime, self.vtime)
+            client.queue.append(task)
+            self._start()
+            self._lock.notify()
+        return task
+
+    def map(self, name, method, items):
+        """
+        Call a method of an account for every item. Items are queued lazily,
+        keeping at most two per thread waiting.
+
+        :param name: name of the account
+        :param method: Picking method name with one argument
+        :param items: iterable of arguments
+        :return: iterator of (index, result, exception) as they complete
+        """
+        results = Queue.Queue()
+        window = self.max_workers * 2
+        pending = 0
+        for index, item in enumerate(items):
+            task = self.submit(name, method, item)
+            task.add_done_callback(lambda task, index=index: results.put(
+                    (index, task.value, task.exception)))
+            pending += 1
+            if pending >= window:
+                yield results.get()
+                pending -= 1
+        while pending:
+            yield results.get()
+            pending -= 1
+
+    def _start(self):
+        """
+        Start the threads on the first request
+        """
+        if self._threads:
+            return
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _next(self):
+        """
+        Queued task of the ready account with the lowest virtual time
+        """
+        selected = None
+        for client in self.clients.values():
+            if client.ready() and (selected is None
+                    or client.vtime < selected.vtime):
+                selected = client
+        if selected is None:
+            return None
+        self.vtime = selected.vtime
+        selected.vtime += 1.0 / selected.weight
+        selected.running += 1
+        return selected.queue.popleft()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                task = self._next()
+                while task is None:
+                    if self._closed:
+                        return
+                    self._lock.wait()
+                    task = self._next()
+            started = time.time()
+            task.run()
+            with self._lock:
+                task.client.done(task, started, time.time())
+                self._lock.notify()
+            task.finish()
+
+    def close(self):
+        """
+        Send the queued requests, stop the threads and close the
+        connections of all the accounts
+        """
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        for thread in self._threads:
+            thread.join()
+        del self._threads[:]
+        for client in self.clients.values():
+            client.picking.transport.close()
+
+    def stats(self):
+        """
+        Counters of each account (see Client.stats)
+
+        Return dict
+        """
+        with self._lock:
+            return dict((name, client.stats())
+                for name, client in self.clients.items())
@@ -0,0 +1,145 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from functools import wraps
+import sys
+import threading
+
+
+class Call(object):
+    """
+    Request in flight and its result
+    """
+    __slots__ = ('event', 'result', 'exc_info')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """
+    Coalescing of concurrent identical requests: the first caller of a key
+    sends the request and the callers arriving while it is in flight wait
+    for it and share its result (or exception)
+
+    Example usage ::
+
+        flights = SingleFlight()
+        values = flights.do(('zip', '08720'), lambda: picking_api.zip('08720'))
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.futures = {}
+        self.executed = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Call func, or wait for the call of the same key in flight
+
+        :param key: hashable key of the request
+        :param func: callable without arguments
+        :return: func result
+        """
+        with self._lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = Call()
+                self.executed += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            call.event.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+        try:
+            call.result = func()
+        except Exception:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
+
+    def submit(self, key, submit):
+        """
+        Future of the call of key in flight, or of a new call
+
+        :param key: hashable key of the request
+        :param submit: callable without arguments returning a future with
+                       add_done_callback (seur.aio tasks)
+        :return: future
+        """
+        with self._lock:
+            future = self.futures.get(key)
+            if future is not None:
+                self.shared += 1
+                return future
+            future = self.futures[key] = submit()
+            self.executed += 1
+        future.add_done_callback(lambda future: self._done(key, future))
+        return future
+
+    def _done(self, key, future):
+        with self._lock:
+            if self.futures.get(key) is future:
+                del self.futures[key]
+
+    def stats(self):
+        """
+        Return dict of requests sent (executed), requests served by another
+        in flight (shared) and requests in flight
+        """
+        with self._lock:
+            return {
+                'executed': self.executed,
+                'shared': self.shared,
+                'inflight': len(self.calls) + len(self.futures),
+                }
+
+
+def coalesced(service, key):
+    """
+    Decorator of the read only API methods: concurrent calls with the same
+    arguments, user and server share one request
+
+    The decorated method has a flight_key(api, *args, **kwargs) attribute
+    returning the key of a call, used by seur.aio to share futures.
+
+    :param service: service name of the method (see seur.api.URLS)
+    :param key: callable with the method arguments returning a hashable
+                key, or None to not coalesce the call (outputs)
+    """
+    def decorator(method):
+        def flight_key(self, *args, **kwargs):
+            value = key(*args, **kwargs)
+            if value is None:
+                return None
+            account = self.account
+            return (method.__name__, account.username,
+                account.url(service), value)
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            flights = self.flights
+            if flights is None:
+                return method(self, *args, **kwargs)
+            value = flight_key(self, *args, **kwargs)
+            if value is None:
+                return method(self, *args, **kwargs)
+            return flights.do(value, lambda: method(self, *args, **kwargs))
+        wrapper.flight_key = flight_key
+        return wrapper
+    return decorator
+
+#Shared by all API instances without single flight
+flights = SingleFlight()
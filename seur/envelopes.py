@@ -0,0 +1,342 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from genshi.core import escape
+from seur.templates import loader as default_loader
+import re
+import threading
+
+#Templates of the hot operations: create, label, zip, city, info, list and
+#pickups
+TEMPLATES = (
+    'picking_send.xml',
+    'picking_send_pdf.xml',
+    'picking_label.xml',
+    'picking_label_pdf.xml',
+    'zip.xml',
+    'city.xml',
+    'picking_info.xml',
+    'picking_list.xml',
+    'pickup_service.xml',
+    'pickup_service_cancel.xml',
+    )
+
+#Values rendered to compile a template: private use characters around the
+#slot name and the characters escaped in text and in attributes
+SENTINEL = u'\ue000%s&"\ue001'
+SLOT = re.compile(u'\ue000([^&\ue001]+)(&amp;&#34;|&amp;"|&")\ue001')
+#Escaping of each slot: None (raw, in CDATA), text or attribute
+MODES = {
+    u'&"': None,
+    u'&amp;"': False,
+    u'&amp;&#34;': True,
+    }
+EXPRESSION = re.compile(r'\$\{([^}]*)\}')
+DIRECTIVE = re.compile(r'[\s<]py:(\w+)(?:\s+function)?="([^"]*)"')
+START_TAG = re.compile(r'<[\w:.-]+(\s[^<>]*)?>$')
+END_TAG = re.compile(r'</[\w:.-]+>')
+LOOP = 'bulto in bultos'
+
+
+class Fallback(Exception):
+    """
+    Values the envelope can not render like Genshi: iterables and the
+    whitespace changed by the Genshi WhitespaceFilter
+    """
+
+
+class Envelope(object):
+    """
+    Genshi template compiled to literal strings and value slots
+
+    The template is rendered once with a sentinel for each value (and for
+    each field of 0 to 3 bultos) and the output split in the literals
+    between sentinels, so escaping, whitespace and empty elements are those
+    of Genshi. Rendering concatenates the literals and the escaped values.
+
+    Templates may only use ${name}, ${bulto.field}, py:def functions
+    without arguments and py:for="bulto in bultos".
+    """
+    __slots__ = ('names', 'fields', 'parts', 'unit', 'head', 'tail')
+
+    def __init__(self, tmpl, source):
+        """
+        :param tmpl: genshi.template.MarkupTemplate
+        :param source: template source
+        """
+        functions = set()
+        loop = False
+        for directive, value in DIRECTIVE.findall(source):
+            if directive == 'def' and value.endswith('()'):
+                functions.add(value)
+            elif directive == 'for' and value == LOOP:
+                loop = True
+            else:
+                raise ValueError('Unsupported directive py:%s="%s"' % (
+                        directive, value))
+        names = set()
+        fields = set()
+        for expression in EXPRESSION.findall(source):
+            if expression.startswith('bulto.') and loop:
+                fields.add(expression[len('bulto.'):])
+            elif expression in functions:
+                continue
+            elif re.match(r'^\w+$', expression):
+                names.add(expression)
+            else:
+                raise ValueError('Unsupported expression ${%s}' % expression)
+        names.discard('bultos')
+        self.names = tuple(sorted(names))
+        self.fields = tuple(sorted(fields))
+
+        vals = dict((name, SENTINEL % name) for name in self.names)
+
+        def render(count):
+            vals['bultos'] = [dict((field, SENTINEL % ('%d.%s' % (i, field)))
+                    for field in self.fields) for i in range(count)]
+            return tmpl.generate(**vals).render()
+
+        #parts of 0, 1 and 2 bultos and the unit repeated from the third
+        self.parts = [self.compile(render(0))]
+        self.unit = self.head = self.tail = None
+        if not loop:
+            return
+        self.parts.append(self.compile(render(1)))
+        two, three = render(2), render(3)
+        self.parts.append(self.compile(two))
+        start = 0
+        while start < len(two) and two[start] == three[start]:
+            start += 1
+        end = start + len(three) - len(two)
+        unit = three[start:end]
+        if three[end:] != two[start:] or u'\ue0002.' not in unit:
+            raise ValueError('Can not find the bultos loop')
+        self.head = self.compile(two[:start])
+        self.tail = self.compile(two[start:])
+        self.unit = self.compile(unit.replace(u'\ue0002.', u'\ue000*.'))
+
+    def compile(self, text):
+        """
+        Split a rendered text in literals and slots
+
+        Return list of (literal, slot), slot is (name, bulto index or None,
+        escape mode, length of the end tag removed when the value is None,
+        whether a newline may follow) and None after the last literal
+        """
+        parts = []
+        pos = 0
+        for match in SLOT.finditer(text):
+            literal = text[pos:match.start()]
+            pos = match.end()
+            key = match.group(1)
+            index = None
+            if '.' in key:
+                index, key = key.split('.', 1)
+                index = index == '*' and '*' or int(index)
+            end = 0
+            tag = END_TAG.match(text, pos)
+            if (tag and START_TAG.search(literal)
+                    and not literal.endswith('/>')):
+                end = len(tag.group(0))
+            #Genshi trims the spaces before a newline
+            after = text[pos:].lstrip(' \t')
+            newline = not after or after.startswith('\n')
+            parts.append((literal,
+                    (key, index, MODES[match.group(2)], end, newline)))
+        parts.append((text[pos:], None))
+        return parts
+
+    def fill(self, parts, vals, bultos, index, out):
+        """
+        Append to out the literals and values of parts
+        """
+        skip = 0
+        for literal, slot in parts:
+            if skip:
+                literal = literal[skip:]
+                skip = 0
+            if slot is None:
+                out.append(literal)
+                break
+            key, bulto, mode, end, newline = slot
+            if bulto is None:
+                value = vals[key]
+            else:
+                bulto = bultos[bulto == '*' and index or bulto]
+                if isinstance(bulto, dict):
+                    value = bulto[key]
+                else:
+                    value = getattr(bulto, key)
+            if value is None:
+                if end:
+                    out.append(literal[:-1])
+                    out.append(u'/>')
+                    skip = end
+                else:
+                    out.append(literal)
+                continue
+            out.append(literal)
+            if not isinstance(value, basestring):
+                if hasattr(value, '__iter__'):
+                    raise Fallback(key)
+                value = unicode(value)
+            if '\n' in value or (newline and value[-1:] in (' ', '\t')):
+                raise Fallback(key)
+            if mode is None:
+                out.append(value)
+            else:
+                out.append(escape(value, quotes=mode))
+
+    def bind(self, vals):
+        """
+        Envelope with the values of vals rendered into the literals, for the
+        values that are the same in every request (credentials). Values
+        Genshi would change are left as slots.
+
+        :param vals: dict of template values
+        Return Envelope
+        """
+        envelope = Envelope.__new__(Envelope)
+        envelope.names = tuple(name for name in self.names
+            if name not in vals)
+        envelope.fields = self.fields
+        envelope.parts = [self.bind_parts(parts, vals)
+            for parts in self.parts]
+        envelope.unit = envelope.head = envelope.tail = None
+        if self.unit is not None:
+            envelope.head = self.bind_parts(self.head, vals)
+            envelope.tail = self.bind_parts(self.tail, vals)
+            envelope.unit = self.bind_parts(self.unit, vals)
+        return envelope
+
+    def bind_parts(self, parts, vals):
+        """
+        Parts with the slots of vals merged into the literals
+        """
+        bound = []
+        text = []
+        skip = 0
+        for literal, slot in parts:
+            if skip:
+                literal = literal[skip:]
+                skip = 0
+            if (slot is not None and slot[1] is None and slot[0] in vals):
+                out = []
+                try:
+                    self.fill([(literal, slot)], vals, (), None, out)
+                except Fallback:
+                    pass
+                else:
+                    text.extend(out)
+                    if vals[slot[0]] is None:
+                        skip = slot[3]
+                    continue
+            text.append(literal)
+            bound.append((u''.join(text), slot))
+            text = []
+        return bound
+
+    def render(self, vals):
+        """
+        Render the envelope
+
+        :param vals: dict of template values
+        Return unicode XML
+        """
+        out = []
+        bultos = self.unit and vals.get('bultos') or []
+        count = len(bultos)
+        if count < len(self.parts):
+            self.fill(self.parts[count], vals, bultos, None, out)
+        else:
+            self.fill(self.head, vals, bultos, None, out)
+            for index in xrange(2, count):
+                self.fill(self.unit, vals, bultos, index, out)
+            self.fill(self.tail, vals, bultos, None, out)
+        return u''.join(out)
+
+
+class EnvelopeBuilder(object):
+    """
+    Render the templates of the hot operations (TEMPLATES) with compiled
+    Envelopes and the others with Genshi. Output is the same as Genshi.
+
+    Example usage ::
+
+        from seur.envelopes import builder
+
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context, renderer=builder) as picking_api:
+            picking_api.create(data)
+    """
+
+    def __init__(self, loader=default_loader, templates=TEMPLATES):
+        """
+        :param loader: seur.templates.TemplateCache
+        :param templates: names of the templates compiled to Envelopes
+        """
+        self.loader = loader
+        self.templates = templates
+        self.envelopes = {}
+        self._lock = threading.Lock()
+
+    def envelope(self, name):
+        """
+        Compiled envelope of a template, compiled again when the loader
+        reloads it
+
+        Return Envelope or None if it can not be compiled
+        """
+        tmpl = self.loader.load(name)
+        cached = self.envelopes.get(name)
+        if cached is not None and cached[0] is tmpl:
+            return cached[1]
+        with self._lock:
+            with open(tmpl.filepath) as f:
+                source = f.read()
+            try:
+                envelope = Envelope(tmpl, source)
+            except ValueError:
+                envelope = None
+            self.envelopes[name] = (tmpl, envelope)
+        return envelope
+
+    def bound(self, name, fixed):
+        """
+        Compiled envelope of a template with the fixed values rendered in,
+        kept in fixed.envelopes
+
+        :param fixed: seur.account.Vals
+        Return Envelope or None if it can not be compiled
+        """
+        envelope = self.envelope(name)
+        cached = fixed.envelopes.get(name)
+        if cached is not None and cached[0] is envelope:
+            return cached[1]
+        bound = envelope is not None and envelope.bind(fixed) or None
+        fixed.envelopes[name] = (envelope, bound)
+        return bound
+
+    def render(self, name, vals, fixed=None):
+        """
+        Render a template
+
+        :param name: template file name
+        :param vals: dict of template values
+        :param fixed: seur.account.Vals of vals that are the same in every
+                      request, rendered once into the envelope
+        Return unicode XML
+        """
+        if name in self.templates:
+            if fixed is not None:
+                envelope = self.bound(name, fixed)
+            else:
+                envelope = self.envelope(name)
+            if envelope is not None:
+                try:
+                    return envelope.render(vals)
+                except Fallback:
+                    pass
+        return self.loader.render(name, vals)
+
+builder = EnvelopeBuilder()
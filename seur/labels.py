@@ -0,0 +1,307 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from collections import OrderedDict
+import hashlib
+import mmap
+import os
+import threading
+
+#Max bytes of labels kept
+MAXBYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def digest(value):
+    return hashlib.sha1(value).hexdigest()
+
+
+class MemoryLabels(object):
+    """
+    In-process LRU store of labels by content, evicted by size
+    """
+
+    def __init__(self, maxbytes=MAXBYTES):
+        """
+        :param maxbytes: max bytes of labels, the least recently used are
+                         evicted
+        """
+        self.maxbytes = maxbytes
+        self.evictions = 0
+        self.size = 0
+        self.index = {}
+        self.blobs = OrderedDict()
+        self.keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, key):
+        with self._lock:
+            value = self.blobs.pop(self.index.get(key), None)
+            if value is None:
+                return None
+            self.blobs[self.index[key]] = value
+            return value
+
+    def set(self, key, value):
+        hexdigest = digest(value)
+        with self._lock:
+            old = self.index.get(key)
+            if old is not None and old != hexdigest:
+                self.keys[old].discard(key)
+            self.index[key] = hexdigest
+            self.keys.setdefault(hexdigest, set()).add(key)
+            if hexdigest in self.blobs:
+                self.blobs[hexdigest] = self.blobs.pop(hexdigest)
+                return
+            self.blobs[hexdigest] = value
+            self.size += len(value)
+            while self.size > self.maxbytes and len(self.blobs) > 1:
+                evicted, value = self.blobs.popitem(last=False)
+                self.size -= len(value)
+                for key in self.keys.pop(evicted, ()):
+                    if self.index.get(key) == evicted:
+                        del self.index[key]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.index.clear()
+            self.blobs.clear()
+            self.keys.clear()
+            self.size = 0
+
+
+class FileLabels(object):
+    """
+    Store of labels in a local directory that several processes can share:
+    a file per label content and a reference file per key. Files are
+    replaced atomically and the least recently used are evicted by size,
+    with the reference files pointing to them.
+    """
+
+    def __init__(self, path, maxbytes=MAXBYTES, mmap=False):
+        """
+        :param path: directory, created if not exists
+        :param maxbytes: max bytes of label files, None for no limit
+        :param mmap: return the labels memory-mapped (read-only mmap)
+                     instead of read into strings
+        """
+        self.path = path
+        self.maxbytes = maxbytes
+        self.mmap = mmap
+        self.evictions = 0
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+    def __len__(self):
+        return len(self._files('.ref'))
+
+    def _files(self, extension):
+        return [f for f in os.listdir(self.path) if f.endswith(extension)]
+
+    def filename(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return os.path.join(self.path, '%s.ref' % digest(key))
+
+    def blob(self, hexdigest):
+        return os.path.join(self.path, '%s.label' % hexdigest)
+
+    def _write(self, filename, value):
+        tmp = '%s.%s.%s.tmp' % (filename, os.getpid(),
+            threading.current_thread().ident)
+        with open(tmp, 'wb') as f:
+            f.write(value)
+        os.rename(tmp, filename)
+
+    def get(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                blob = self.blob(f.read())
+            f = open(blob, 'rb')
+        except IOError:
+            return None
+        try:
+            if not self.mmap:
+                return f.read()
+            if not os.fstat(f.fileno()).st_size:
+                return ''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+            try:
+                os.utime(blob, None)
+            except OSError:
+                pass
+
+    def set(self, key, value):
+        hexdigest = digest(value)
+        blob = self.blob(hexdigest)
+        if os.path.exists(blob):
+            os.utime(blob, None)
+        else:
+            self._write(blob, value)
+        self._write(self.filename(key), hexdigest)
+        if self.maxbytes:
+            self._evict()
+
+    def _evict(self):
+        files = []
+        size = 0
+        for name in self._files('.label'):
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+            size += stat.st_size
+        if size <= self.maxbytes:
+            return
+        files.sort()
+        evicted = set()
+        #Keep the newest label even if bigger than maxbytes
+        for _, filesize, name in files[:-1]:
+            try:
+                os.remove(os.path.join(self.path, name))
+                self.evictions += 1
+            except OSError:
+                pass
+            evicted.add(name[:-len('.label')])
+            size -= filesize
+            if size <= self.maxbytes:
+                break
+        self._remove_refs(evicted)
+
+    def _remove_refs(self, hexdigests):
+        """
+        Remove the reference files of the labels evicted
+        """
+        for name in self._files('.ref'):
+            filename = os.path.join(self.path, name)
+            try:
+                with open(filename, 'rb') as f:
+                    hexdigest = f.read()
+            except IOError:
+                continue
+            if hexdigest in hexdigests:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+
+    def delete(self, key):
+        try:
+            os.remove(self.filename(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in self._files('.ref') + self._files('.label'):
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+
+class LabelStore(object):
+    """
+    Labels by account, reference (referencia_expedicion or ECB code) and
+    format, for reprints without calling Seur. Several accounts can share a
+    store: references are only unique by account. Picking.create stores the
+    labels it receives and Picking.label looks them up before calling Seur.
+
+    Labels are stored as written to an output: the decoded PDF or the ECB
+    trace. Identical labels are stored once.
+
+    Example usage ::
+
+        labels = LabelStore(FileLabels('/var/cache/seur/labels',
+            maxbytes=2 * 1024 ** 3, mmap=True))
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context=context, labels=labels) as picking_api:
+            reference, label, error = picking_api.create(data)
+            label = picking_api.label(data)
+        print labels.stats()
+    """
+
+    def __init__(self, backend=None):
+        """
+        :param backend: MemoryLabels (default) or FileLabels
+        """
+        if backend is None:
+            backend = MemoryLabels()
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(owner, reference, format):
+        return '%s\x00%s\x00%s' % (owner, format, reference)
+
+    def get(self, owner, reference, format):
+        """
+        Label of a reference of an account in a format
+
+        :param owner: username, ccc and server of the account (see
+                      Picking.label_owner)
+        :param reference: referencia_expedicion or ECB code
+        :param format: pdf or the printer, printer_model and ecb_code of the
+                       trace (see Picking.label_format)
+        :return: string, mmap (FileLabels with mmap) or None
+        """
+        value = self.backend.get(self.key(owner, reference, format))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, owner, references, format, value):
+        """
+        Store a label of an account under one or several references
+        """
+        if isinstance(references, basestring):
+            references = [references]
+        for reference in references:
+            if reference:
+                self.backend.set(self.key(owner, reference, format),
+                    value)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Return dict of hits, misses, evictions and size
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+            'size': len(self.backend),
+            }
+
+
+def write(value, output):
+    """
+    Write a stored label (string or mmap) to a file path or file-like
+    object
+
+    :return: output
+    """
+    if isinstance(output, basestring):
+        with open(output, 'wb') as f:
+            write(value, f)
+        return output
+    for start in xrange(0, len(value), CHUNK_SIZE):
+        output.write(value[start:start + CHUNK_SIZE])
+    output.flush()
+    return output
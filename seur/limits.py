@@ -0,0 +1,256 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+import threading
+import time
+import urlparse
+
+#Requests per second and burst of each endpoint, None for no rate limit
+RATE = None
+BURST = 10
+#Limit the concurrent requests of each endpoint with an AdaptiveLimiter
+ADAPTIVE = False
+#Concurrent requests of each endpoint: initial, minimum and maximum limit
+CONCURRENCY = 16
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 64
+#Smoothed latency of a service over its baseline (lowest recent latency)
+#above which the limit shrinks instead of growing
+TOLERANCE = 2.0
+#Limit multiplier on error
+BACKOFF = 0.7
+
+
+def endpoint(url):
+    """
+    Endpoint of a URL: scheme, host and first path segment, so cit.seur.com
+    (CIT-war), ws.seur.com (webseur) and WSEcatalogoPublicos are limited
+    apart
+
+    :param url: service URL
+    :return: string
+    """
+    parts = urlparse.urlsplit(url)
+    segment = parts.path.lstrip('/').split('/', 1)[0]
+    return '%s://%s/%s' % (parts.scheme, parts.netloc, segment)
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter: rate tokens per second up to burst
+    """
+
+    def __init__(self, rate, burst=BURST):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self.tokens = min(self.burst,
+                    self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+
+class AdaptiveLimiter(object):
+    """
+    Concurrency limiter adjusting its limit to the latency and errors of
+    the responses (AIMD)
+
+    The limit grows by one every limit responses while the smoothed latency
+    of the service of the response is below tolerance times its baseline,
+    shrinks by one every limit responses while it is above and is
+    multiplied by backoff on an error, at most once every limit responses.
+    Each service keeps its own baseline: a label or a manifest is slower
+    than a create on the same endpoint without being a sign of overload.
+    """
+
+    def __init__(self, limit=CONCURRENCY, minimum=MIN_CONCURRENCY,
+            maximum=MAX_CONCURRENCY, tolerance=TOLERANCE, backoff=BACKOFF):
+        self.limit = float(limit)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.inflight = 0
+        #Baseline and smoothed latency by service
+        self.baselines = {}
+        self.latencies = {}
+        self.decreases = 0
+        self._since_decrease = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait until less than limit requests are in flight
+        """
+        with self._condition:
+            while self.inflight >= int(self.limit):
+                self._condition.wait()
+            self.inflight += 1
+
+    def release(self, latency, error=False, service=None):
+        """
+        Record the latency (seconds) of a finished request
+
+        :param latency: seconds until the response headers
+        :param error: error response or connection error
+        :param service: service URL of the request
+        """
+        with self._condition:
+            self.inflight -= 1
+            self._since_decrease += 1
+            if error:
+                if self._since_decrease >= self.limit:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.decreases += 1
+                    self._since_decrease = 0
+                self._condition.notify_all()
+                return
+            baseline = self.baselines.get(service)
+            if baseline is None or latency < baseline:
+                baseline = latency
+            else:
+                #Let the baseline follow lasting latency changes
+                baseline += (latency - baseline) * 0.01
+            self.baselines[service] = baseline
+            smoothed = self.latencies.get(service)
+            if smoothed is None:
+                smoothed = latency
+            else:
+                smoothed += (latency - smoothed) * 0.2
+            self.latencies[service] = smoothed
+            if smoothed <= baseline * self.tolerance:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(self.minimum, self.limit - 1 / self.limit)
+            self._condition.notify_all()
+
+
+class EndpointLimiter(object):
+    """
+    Rate and concurrency limits of an endpoint
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, adaptive=ADAPTIVE, **kwargs):
+        """
+        :param rate: requests per second or None
+        :param burst: requests sent at once above rate
+        :param adaptive: limit the concurrent requests with an
+                         AdaptiveLimiter
+        :param kwargs: AdaptiveLimiter arguments
+        """
+        self.bucket = rate and TokenBucket(rate, burst) or None
+        self.concurrency = adaptive and AdaptiveLimiter(**kwargs) or None
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+        with self._lock:
+            self.inflight += 1
+
+    def release(self, latency, error=False, service=None):
+        with self._lock:
+            self.inflight -= 1
+            self.requests += 1
+            if error:
+                self.errors += 1
+        if self.concurrency is not None:
+            self.concurrency.release(latency, error, service)
+
+    def stats(self):
+        concurrency = self.concurrency
+        return {
+            'limit': concurrency and int(concurrency.limit) or None,
+            'inflight': self.inflight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'decreases': concurrency and concurrency.decreases or 0,
+            'baselines': concurrency and dict(concurrency.baselines) or {},
+            'latencies': concurrency and dict(concurrency.latencies) or {},
+            'rate': self.bucket and self.bucket.rate,
+            'waited': self.bucket and self.bucket.waited or 0.0,
+            }
+
+
+class Limits(object):
+    """
+    Limiters by endpoint, shared by the transports of the process
+
+    Example usage ::
+
+        from seur.limits import limits
+
+        limits.configure('https://ws.seur.com/WSEcatalogoPublicos', rate=5)
+        limits.configure('https://cit.seur.com/CIT-war', adaptive=True)
+        print limits.stats()
+    """
+
+    def __init__(self, **defaults):
+        """
+        :param defaults: EndpointLimiter arguments of every endpoint
+        """
+        self.defaults = defaults
+        self.settings = {}
+        self.limiters = {}
+        self._lock = threading.Lock()
+
+    def configure(self, url, **kwargs):
+        """
+        Set the EndpointLimiter arguments of the endpoint of url. Replaces
+        its limiter.
+        """
+        key = endpoint(url)
+        with self._lock:
+            self.settings[key] = kwargs
+            self.limiters.pop(key, None)
+
+    def get(self, url):
+        """
+        Limiter of the endpoint of url
+
+        Return EndpointLimiter
+        """
+        key = endpoint(url)
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                limiter = self.limiters.get(key)
+                if limiter is None:
+                    kwargs = dict(self.defaults)
+                    kwargs.update(self.settings.get(key, {}))
+                    limiter = self.limiters[key] = EndpointLimiter(**kwargs)
+        return limiter
+
+    def stats(self):
+        """
+        Limit (None without adaptive), in flight requests, requests, errors,
+        latency by service and rate wait by endpoint
+
+        Return dict
+        """
+        return dict((key, limiter.stats())
+            for key, limiter in self.limiters.items())
+
+#Shared by all transports without limits
+limits = Limits()
@@ -0,0 +1,239 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from seur.coalesce import SingleFlight
+from seur.tracking import windows
+from seur.utils import imap_unordered
+import datetime
+import hashlib
+import os
+import re
+import threading
+import time
+
+#Seconds today's manifest is kept (closed days are kept forever)
+TTL = 300
+#Seconds without create before today's manifest is prefetched
+IDLE = 900
+
+
+class ManifestStore(object):
+    """
+    Decoded manifest PDFs by account and day in a local directory that
+    several processes can share. Files are replaced atomically.
+
+    The files of an account are named after its username and a hash of its
+    label_owner (username, ccc and server), so accounts of the same user
+    with another ccc or server do not share manifests.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: directory, created if not exists
+        """
+        self.path = path
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+    def filename(self, account, date):
+        """
+        :param account: seur.account.Account
+        :param date: datetime.date
+        Return string
+        """
+        owner = hashlib.sha1(account.label_owner.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, '%s-%s-%s.pdf' % (
+                re.sub(r'[^\w.-]', '_', account.username), owner[:12],
+                date.isoformat()))
+
+    def mtime(self, account, date):
+        """
+        Time the manifest of a day was saved or None if not found
+        """
+        try:
+            return os.path.getmtime(self.filename(account, date))
+        except OSError:
+            return None
+
+    def tmp(self, account, date):
+        return '%s.%s.%s.tmp' % (self.filename(account, date), os.getpid(),
+            threading.current_thread().ident)
+
+
+class ManifestService(object):
+    """
+    Manifests of a Picking account from a ManifestStore, fetched from Seur
+    when missing
+
+    The manifest of a day is fetched once after the day is closed. Today's
+    manifest is fetched again after ttl seconds or a create, and can be
+    prefetched in the background: pass the service as a Picking hook to
+    prefetch it idle seconds after the last create.
+
+    Example usage ::
+
+        store = ManifestStore('/var/cache/seur/manifests')
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context=context) as picking_api:
+            manifests = ManifestService(picking_api, store)
+            picking_api.add_hook(manifests)
+            filename = manifests.get()
+            for date, filename, error in manifests.range(date_from, date_to):
+                print date, filename, error
+    """
+
+    def __init__(self, picking, store, max_workers=4, ttl=TTL, idle=IDLE):
+        """
+        :param picking: Picking instance
+        :param store: ManifestStore
+        :param max_workers: manifiesto requests sent at the same time
+        :param ttl: seconds today's manifest is kept
+        :param idle: seconds without create before today's manifest is
+                     prefetched (used as a hook). None to not prefetch
+        """
+        self.picking = picking
+        self.store = store
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.idle = idle
+        self.last_create = 0
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.fetches = 0
+        self.errors = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def cached(self, date, account=None):
+        """
+        File of the manifest of a day in the store if it is still valid, or
+        None
+
+        :param account: seur.account.Account (default the Picking account)
+        """
+        account = account or self.picking.account
+        mtime = self.store.mtime(account, date)
+        if mtime is None:
+            return None
+        if datetime.date.fromtimestamp(mtime) > date:
+            #Saved after the day was closed
+            return self.store.filename(account, date)
+        if (date >= datetime.date.today() and mtime >= self.last_create
+                and time.time() - mtime < self.ttl):
+            return self.store.filename(account, date)
+        return None
+
+    def get(self, date=None, refresh=False):
+        """
+        File of the decoded manifest PDF of a day
+
+        :param date: datetime.date (default today)
+        :param refresh: fetch it from Seur even if stored
+        :return: file name or None if Seur returned no manifest
+        """
+        if date is None:
+            date = datetime.date.today()
+        account = self.picking.account
+        if not refresh:
+            filename = self.cached(date, account)
+            if filename is not None:
+                self.hits += 1
+                return filename
+        return self.flights.do((account.label_owner, date),
+            lambda: self.fetch(date, account))
+
+    def fetch(self, date, account=None):
+        """
+        Fetch the manifest of a day from Seur and save it to the store
+
+        :param account: seur.account.Account (default the Picking account)
+        :return: file name or None if Seur returned no manifest
+        """
+        account = account or self.picking.account
+        tmp = self.store.tmp(account, date)
+        self.fetches += 1
+        try:
+            result = self.picking.manifiesto({
+                    'date': date.strftime('%Y-%m-%d'),
+                    }, output=tmp)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if result is None:
+            os.remove(tmp)
+            return None
+        filename = self.store.filename(account, date)
+        os.rename(tmp, filename)
+        return filename
+
+    def range(self, date_from, date_to):
+        """
+        Manifests of a range of days, fetched concurrently
+
+        :param date_from: first date
+        :param date_to: last date (included)
+        :return: list of (date, file name, exception) in date order
+        """
+        dates = [date for date, _ in windows(date_from, date_to, days=1)]
+        results = [None] * len(dates)
+        for index, filename, exception in imap_unordered(self.get, dates,
+                max_workers=self.max_workers):
+            results[index] = (dates[index], filename, exception)
+        return results
+
+    def prefetch(self, date=None, delay=0):
+        """
+        Fetch the manifest of a day (default today) in a background thread
+
+        :param delay: seconds to wait before fetching it
+        :return: threading.Timer
+        """
+        def fetch():
+            try:
+                self.get(date, refresh=True)
+            except Exception as e:
+                self.errors.append(e)
+                del self.errors[:-10]
+        timer = threading.Timer(delay, fetch)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def __call__(self, timing):
+        """
+        Picking hook: invalidate today's manifest after a create and
+        prefetch it idle seconds after the last one
+        """
+        if timing.operation != 'create' or timing.error is not None:
+            return
+        self.last_create = time.time()
+        if self.idle is None:
+            return
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = self.prefetch(delay=self.idle)
+
+    def cancel(self):
+        """
+        Cancel the pending prefetch
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def stats(self):
+        """
+        Return dict of hits, fetches and errors of the prefetches
+        """
+        return {
+            'hits': self.hits,
+            'fetches': self.fetches,
+            'errors': len(self.errors),
+            }
@@ -0,0 +1,181 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import time
+
+PHASES = ('render', 'connect', 'ttfb', 'transfer', 'parse')
+
+_local = threading.local()
+
+
+class Timing(object):
+    """
+    Timings (seconds) and sizes (bytes) of an API operation
+
+    render: template rendering
+    connect: TCP/TLS connection (0 when a pooled connection is reused)
+    ttfb: from sending the request to the response headers
+    transfer: reading the response body
+    parse: parsing the response (without the transfer time)
+    """
+    __slots__ = (
+        'operation',
+        'service',
+        'url',
+        'start',
+        'total',
+        'render',
+        'connect',
+        'ttfb',
+        'transfer',
+        'parse',
+        'request_size',
+        'response_size',
+        'error',
+    )
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.service = None
+        self.url = None
+        self.start = time.time()
+        self.total = 0.0
+        self.render = 0.0
+        self.connect = 0.0
+        self.ttfb = 0.0
+        self.transfer = 0.0
+        self.parse = 0.0
+        self.request_size = 0
+        self.response_size = 0
+        self.error = None
+
+    def __repr__(self):
+        return '<Timing %s>' % ' '.join('%s=%r' % (name, getattr(self, name))
+            for name in self.__slots__)
+
+
+def current():
+    """
+    Timing of the operation running in this thread or None
+    """
+    return getattr(_local, 'timing', None)
+
+
+@contextmanager
+def recording(timing):
+    """
+    Make timing the Timing of the operation running in this thread while the
+    block runs. Used by seur.aio around the steps of a coroutine that do not
+    yield to the event loop (rendering and parsing).
+
+    :param timing: Timing or None
+    """
+    previous = current()
+    _local.timing = timing
+    try:
+        yield timing
+    finally:
+        _local.timing = previous
+
+
+def instrumented(operation):
+    """
+    Decorator of API methods: record a Timing and pass it to the API hooks.
+    Does nothing when the API has no hooks.
+
+    :param operation: operation name
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.hooks:
+                return method(self, *args, **kwargs)
+            timing = Timing(operation)
+            previous = current()
+            _local.timing = timing
+            try:
+                return method(self, *args, **kwargs)
+            except Exception as e:
+                timing.error = e
+                raise
+            finally:
+                _local.timing = previous
+                timing.total = time.time() - timing.start
+                for hook in self.hooks:
+                    hook(timing)
+        return wrapper
+    return decorator
+
+
+class Metrics(object):
+    """
+    API hook aggregating the timings by operation
+
+    Example usage ::
+
+        metrics = Metrics()
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context=context, hooks=[metrics]) as picking_api:
+            picking_api.create(data)
+        print metrics.stats()
+    """
+
+    def __init__(self):
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, timing):
+        with self._lock:
+            stats = self.operations.get(timing.operation)
+            if stats is None:
+                stats = self.operations[timing.operation] = {
+                    'count': 0,
+                    'errors': 0,
+                    'service': timing.service,
+                    'request_size': 0,
+                    'response_size': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                    }
+                for phase in PHASES:
+                    stats[phase] = 0.0
+            stats['count'] += 1
+            if timing.error is not None:
+                stats['errors'] += 1
+            stats['request_size'] += timing.request_size
+            stats['response_size'] += timing.response_size
+            stats['total'] += timing.total
+            stats['max'] = max(stats['max'], timing.total)
+            for phase in PHASES:
+                stats[phase] += getattr(timing, phase)
+
+    def stats(self):
+        """
+        Count, errors, max and mean seconds of each phase and bytes by
+        operation
+
+        Return dict
+        """
+        result = {}
+        with self._lock:
+            for operation, stats in self.operations.items():
+                count = stats['count']
+                result[operation] = {
+                    'count': count,
+                    'errors': stats['errors'],
+                    'service': stats['service'],
+                    'max': stats['max'],
+                    'mean': stats['total'] / count,
+                    'request_size': stats['request_size'] / count,
+                    'response_size': stats['response_size'] / count,
+                    }
+                for phase in PHASES:
+                    result[operation][phase] = stats[phase] / count
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.operations.clear()
@@ -0,0 +1,429 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Durable queue of create and pickup_service requests sent to Seur by a
+worker
+
+    python -m seur.outbox --db /var/lib/seur/outbox.db --config picking.json
+        [--workers 4] [--lease 300] [--once]
+
+picking.json has the Picking arguments (username, password, vat, ...).
+"""
+
+from seur.retry import Retry
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+METHODS = ('create', 'pickup_service')
+#Data key of the idempotency key of each method
+KEYS = {
+    'create': 'referencia_expedicion',
+    'pickup_service': 'num_referencia',
+    }
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+#Seconds a worker owns a running job without renewing it. After it, the
+#job is sent again. Workers renew it every third of it while sending it
+LEASE = 300
+POLL = 0.2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    method TEXT NOT NULL,
+    key TEXT,
+    data TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease REAL,
+    worker TEXT,
+    not_before REAL,
+    reference TEXT,
+    label BLOB,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_key ON jobs (method, key);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+"""
+
+
+class Outbox(object):
+    """
+    SQLite queue of pending create and pickup_service requests and their
+    results
+
+    Producers put requests and poll or wait for their results; a worker
+    (see Worker and main) sends them to Seur. A request is kept by its
+    idempotency key (referencia_expedicion or num_referencia): putting it
+    again returns the same job, queued again with the new data if it failed.
+
+    Example usage ::
+
+        outbox = Outbox('/var/lib/seur/outbox.db')
+        job_id = outbox.put('create', data)
+        job = outbox.wait(job_id, timeout=30)
+        if job and job['state'] == 'done':
+            print job['reference'], job['error']
+    """
+
+    def __init__(self, path):
+        """
+        :param path: SQLite database file
+        """
+        self.path = path
+        self._local = threading.local()
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        columns = [row['name']
+            for row in conn.execute('PRAGMA table_info(jobs)')]
+        if 'not_before' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN not_before REAL')
+
+    def connection(self):
+        """
+        SQLite connection of the current thread, in autocommit mode
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30,
+                isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def transaction(self):
+        return Transaction(self.connection())
+
+    def put(self, method, data):
+        """
+        Add a request
+
+        :param method: create or pickup_service
+        :param data: dictionary of values of the method
+        :return: job id. The job of the same key if any: pending again if it
+                 failed
+        """
+        if method not in METHODS:
+            raise ValueError('Unknown method %s' % method)
+        key = data.get(KEYS[method]) or None
+        now = time.time()
+        with self.transaction() as conn:
+            if key is not None:
+                row = conn.execute('SELECT id, state FROM jobs '
+                    'WHERE method = ? AND key = ?', (method, key)).fetchone()
+                if row is not None:
+                    if row['state'] == FAILED:
+                        conn.execute('UPDATE jobs SET data = ?, state = ?, '
+                            'attempts = 0, lease = NULL, worker = NULL, '
+                            'not_before = NULL, result = NULL, error = NULL, '
+                            'updated = ? WHERE id = ?',
+                            (json.dumps(data), PENDING, now, row['id']))
+                    return row['id']
+            cursor = conn.execute('INSERT INTO jobs (method, key, data, '
+                'state, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (method, key, json.dumps(data), PENDING, now, now))
+            return cursor.lastrowid
+
+    def get(self, job_id):
+        """
+        State and result of a job
+
+        :return: dict (id, method, key, data, state, attempts, reference,
+                 label, result, error) or None if not found
+        """
+        row = self.connection().execute('SELECT * FROM jobs WHERE id = ?',
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(row.keys(), row))
+        job['data'] = json.loads(job['data'])
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        if job['label'] is not None:
+            job['label'] = str(job['label'])
+        return job
+
+    def wait(self, job_id, timeout=None, poll=POLL):
+        """
+        Wait until a job is done or failed
+
+        :param timeout: seconds or None to wait forever
+        :return: job dict (see get) or None on timeout
+        """
+        end = timeout is not None and time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['state'] in (DONE, FAILED):
+                return job
+            if end and time.time() >= end:
+                return None
+            time.sleep(poll)
+
+    def claim(self, worker, limit=1, lease=LEASE):
+        """
+        Take pending jobs whose backoff is over, and running jobs whose
+        lease expired (their worker died), for worker
+
+        :param worker: unique name of the worker (thread) owning the jobs
+        :return: list of job dict
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            rows = conn.execute('SELECT id FROM jobs WHERE (state = ? AND '
+                '(not_before IS NULL OR not_before <= ?)) OR '
+                '(state = ? AND lease < ?) ORDER BY id LIMIT ?',
+                (PENDING, now, RUNNING, now, limit)).fetchall()
+            ids = [row['id'] for row in rows]
+            for job_id in ids:
+                conn.execute('UPDATE jobs SET state = ?, lease = ?, '
+                    'worker = ?, not_before = NULL, '
+                    'attempts = attempts + 1, updated = ? WHERE id = ?',
+                    (RUNNING, now + lease, worker, now, job_id))
+        return [self.get(job_id) for job_id in ids]
+
+    def _update(self, job_id, worker, sql, values):
+        """
+        Update a job, only if worker still owns it when given
+
+        :return: the job was updated
+        """
+        sql = 'UPDATE jobs SET %s WHERE id = ?' % sql
+        values = list(values) + [job_id]
+        if worker is not None:
+            sql += ' AND state = ? AND worker = ?'
+            values += [RUNNING, worker]
+        with self.transaction() as conn:
+            return conn.execute(sql, values).rowcount > 0
+
+    def renew(self, job_id, worker, lease=LEASE):
+        """
+        Extend the lease of a running job owned by worker
+
+        :return: worker still owns the job
+        """
+        return self._update(job_id, worker, 'lease = ?, updated = ?',
+            (time.time() + lease, time.time()))
+
+    def complete(self, job_id, reference=None, label=None, result=None,
+            error=None, worker=None):
+        """
+        Save the result of a job sent to Seur
+
+        :param worker: save it only if worker still owns the job
+        :return: the result was saved
+        """
+        if label is not None and not isinstance(label, str):
+            label = label.encode('utf-8')
+        return self._update(job_id, worker, 'state = ?, reference = ?, '
+            'label = ?, result = ?, error = ?, lease = NULL, updated = ?',
+            (DONE, reference,
+                label is not None and sqlite3.Binary(label) or None,
+                result is not None and json.dumps(result) or None,
+                error, time.time()))
+
+    def fail(self, job_id, error, retry=False, delay=0, worker=None):
+        """
+        Save the error of a job that could not be sent
+
+        :param retry: leave it pending to send it again
+        :param delay: seconds before it is sent again
+        :param worker: save it only if worker still owns the job
+        :return: the error was saved
+        """
+        now = time.time()
+        return self._update(job_id, worker, 'state = ?, error = ?, '
+            'lease = NULL, not_before = ?, updated = ?',
+            (retry and PENDING or FAILED, error,
+                retry and delay and now + delay or None, now))
+
+    def stats(self):
+        """
+        Number of jobs by state
+
+        Return dict
+        """
+        return dict(self.connection().execute('SELECT state, COUNT(*) '
+                'FROM jobs GROUP BY state').fetchall())
+
+    def purge(self, before):
+        """
+        Delete the done jobs updated before a timestamp
+        """
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM jobs WHERE state = ? AND updated < ?',
+                (DONE, before))
+
+
+class Transaction(object):
+    """
+    Context manager of an immediate (write locked) transaction of an
+    autocommit connection
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+
+
+class Worker(object):
+    """
+    Send the jobs of an Outbox to Seur with max_workers threads
+    """
+
+    def __init__(self, outbox, picking, max_workers=4, lease=LEASE,
+            retry=None):
+        """
+        :param outbox: Outbox
+        :param picking: Picking instance
+        :param max_workers: requests sent at the same time
+        :param lease: seconds a job is owned before it is sent again
+        :param retry: seur.retry.Retry, transient errors leave the job
+                      pending until attempts are exhausted
+        """
+        self.outbox = outbox
+        self.picking = picking
+        self.max_workers = max_workers
+        self.lease = lease
+        self.retry = retry or Retry()
+        self.name = '%s:%s' % (socket.gethostname(), os.getpid())
+        self._stop = threading.Event()
+
+    def worker(self):
+        """
+        Name of the current thread in the outbox
+        """
+        return '%s:%s' % (self.name, threading.current_thread().name)
+
+    def backoff(self, attempts):
+        """
+        Seconds before a job that failed attempts times is sent again
+        """
+        return min(self.retry.max_backoff,
+            self.retry.backoff * 2 ** (attempts - 1))
+
+    def keep_lease(self, job, worker):
+        """
+        Renew the lease of a job every third of it in a thread, while it is
+        sent
+
+        :return: threading.Event to set when the job is done
+        """
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.lease / 3.0):
+                if not self.outbox.renew(job['id'], worker, self.lease):
+                    return
+        thread = threading.Thread(target=renew)
+        thread.daemon = True
+        thread.start()
+        return done
+
+    def process(self, job):
+        """
+        Send a job claimed by the current thread and save its result
+        """
+        method, data = job['method'], job['data']
+        worker = self.worker()
+        done = self.keep_lease(job, worker)
+        try:
+            result = None
+            if (method == 'create' and job['attempts'] > 1
+                    and data.get(KEYS[method])):
+                #The worker may have died after Seur created it
+                result = self.picking._existing_picking(data)
+            if result is None:
+                result = getattr(self.picking, method)(data)
+        except Exception as e:
+            retry = (self.retry.transient(e)
+                and job['attempts'] < self.retry.attempts)
+            self.outbox.fail(job['id'], repr(e), retry=retry,
+                delay=self.backoff(job['attempts']), worker=worker)
+            return
+        finally:
+            done.set()
+        if method == 'create':
+            reference, label, error = result
+            if isinstance(reference, list):
+                reference = ','.join(reference)
+            self.outbox.complete(job['id'], reference, label, error=error,
+                worker=worker)
+        else:
+            self.outbox.complete(job['id'], result[0] or None,
+                result=list(result), error=result[4] or None, worker=worker)
+
+    def work(self, once=False):
+        while not self._stop.is_set():
+            jobs = self.outbox.claim(self.worker(), lease=self.lease)
+            if not jobs:
+                if once:
+                    return
+                self._stop.wait(POLL)
+                continue
+            for job in jobs:
+                self.process(job)
+
+    def run(self, once=False):
+        """
+        Process jobs until stop is called
+
+        :param once: return when there are no pending jobs
+        """
+        threads = [threading.Thread(target=self.work, args=(once,))
+            for i in range(self.max_workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    from seur.picking import Picking
+    parser = argparse.ArgumentParser(description='Send the create and '
+        'pickup_service requests of an outbox to Seur')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--config', required=True,
+        help='JSON file of Picking arguments')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--lease', type=int, default=LEASE)
+    parser.add_argument('--once', action='store_true',
+        help='exit when there are no pending jobs')
+    args = parser.parse_args()
+    with open(args.config) as f:
+        config = json.load(f)
+    outbox = Outbox(args.db)
+    with Picking(**config) as picking:
+        Worker(outbox, picking, max_workers=args.workers,
+            lease=args.lease).run(once=args.once)
+
+if __name__ == '__main__':
+    main()
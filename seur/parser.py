@@ -0,0 +1,231 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from seur.metrics import current
+from tempfile import SpooledTemporaryFile
+from xml.parsers import expat
+import base64
+import time
+
+#Tags of the SOAP responses with values, without namespace prefix
+TAGS = ('mensaje', 'PDF', 'traza', 'out')
+#Tags whose child elements are the values (ECB codes)
+CONTAINERS = ('ECB',)
+CHUNK_SIZE = 64 * 1024
+#Streamed values bigger than this are written to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+
+class ResponseParser(object):
+    """
+    Incremental parser of Seur SOAP responses
+
+    Only the text of TAGS and of the children of CONTAINERS is kept, not the
+    XML tree. The text of an element goes to the innermost tag kept, like
+    the first text node of a DOM element. The text of the streams tags
+    (base64 PDF, ECB traces) is written to a temporary file as it is parsed.
+
+    With outputs the text of a tag is written to a file-like object (a
+    Base64Writer to decode it) instead.
+
+    Example usage ::
+
+        parser = ResponseParser(streams=('PDF',))
+        parser.parse(response)
+        parser.text('mensaje'), parser.texts('ECB'), parser.stream('PDF')
+    """
+
+    def __init__(self, streams=(), tags=TAGS, containers=CONTAINERS,
+                 outputs=None):
+        """
+        :param streams: tags written to a file instead of kept in memory
+        :param tags: tags to keep
+        :param containers: tags whose children text is kept
+        :param outputs: dict of tag and file-like the text is written to
+        """
+        self.outputs = outputs or {}
+        self.streams = tuple(streams) + tuple(self.outputs)
+        self.tags = tags
+        self.containers = containers
+        self.values = {}
+        self._stack = []
+        self._captures = []
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+
+    def _start(self, name, attrs):
+        name = name.rpartition(':')[2]
+        parent = self._stack and self._stack[-1] or None
+        self._stack.append(name)
+        if parent in self.containers:
+            key = parent
+        elif name in self.tags:
+            key = name
+        else:
+            return
+        if key in self.streams:
+            target = self.new_stream(key)
+        else:
+            target = []
+        self._captures.append((key, len(self._stack), target))
+
+    def _end(self, name):
+        captures = self._captures
+        if captures and captures[-1][1] == len(self._stack):
+            key, _, target = captures.pop()
+            if isinstance(target, list):
+                target = u''.join(target)
+            else:
+                self.end_stream(key, target)
+            self.values.setdefault(key, []).append(target)
+        self._stack.pop()
+
+    def _data(self, data):
+        #Text goes to the innermost tag kept
+        if not self._captures:
+            return
+        target = self._captures[-1][2]
+        if isinstance(target, list):
+            target.append(data)
+        else:
+            self.write_stream(target, data)
+
+    def new_stream(self, key):
+        """
+        File the text of a streams tag is written to
+        """
+        if key in self.outputs:
+            return self.outputs[key]
+        return SpooledTemporaryFile(SPOOL_SIZE)
+
+    def write_stream(self, stream, data):
+        stream.write(data.encode('utf-8'))
+
+    def end_stream(self, key, stream):
+        if key in self.outputs:
+            stream.flush()
+        else:
+            stream.seek(0)
+
+    def feed(self, data):
+        self._parser.Parse(data, False)
+
+    def close(self):
+        self._parser.Parse('', True)
+
+    def parse(self, response, chunk_size=CHUNK_SIZE):
+        """
+        Read and parse a file-like response until the end
+
+        Return self
+        """
+        timing = current()
+        if timing is not None:
+            start = time.time()
+            transfer = timing.transfer
+        try:
+            while True:
+                data = response.read(chunk_size)
+                if not data:
+                    break
+                self.feed(data)
+        finally:
+            response.close()
+        self.close()
+        if timing is not None:
+            timing.parse += (time.time() - start
+                - (timing.transfer - transfer))
+        return self
+
+    def texts(self, tag):
+        """
+        Text of all the tag elements
+
+        Return list of unicode (or file-like for streams tags)
+        """
+        return self.values.get(tag, [])
+
+    def text(self, tag):
+        """
+        Text of the first tag element
+
+        Return unicode or None if not found
+        """
+        values = self.values.get(tag)
+        if not values:
+            return None
+        value = values[0]
+        if not isinstance(value, unicode):
+            value.seek(0)
+            value = value.read().decode('utf-8')
+        return value
+
+    def stream(self, tag):
+        """
+        Text of the first streams tag element as file-like of utf-8 bytes
+
+        Return file-like or None if not found
+        """
+        values = self.values.get(tag)
+        if not values:
+            return None
+        values[0].seek(0)
+        return values[0]
+
+
+def parse(response, streams=()):
+    """
+    Parse a file-like Seur response
+
+    :param response: file-like
+    :param streams: tags written to a file instead of kept in memory
+    :return: ResponseParser
+    """
+    return ResponseParser(streams=streams).parse(response)
+
+
+class Base64Writer(object):
+    """
+    File-like object decoding the base64 text written to it into fileobj,
+    a chunk at a time
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.size = 0
+        self._buffer = ''
+
+    def write(self, data):
+        data = self._buffer + ''.join(data.split())
+        end = len(data) - len(data) % 4
+        self._buffer = data[end:]
+        if end:
+            decoded = base64.b64decode(data[:end])
+            self.size += len(decoded)
+            self.fileobj.write(decoded)
+
+    def flush(self):
+        if self._buffer:
+            self.write('=' * (-len(self._buffer) % 4))
+        self.fileobj.flush()
+
+
+def parse_to(response, tag, output, decode=True):
+    """
+    Parse a file-like Seur response writing the text of tag to output
+
+    :param response: file-like
+    :param tag: tag to write
+    :param output: file path or file-like object
+    :param decode: decode the base64 text
+    :return: ResponseParser
+    """
+    if isinstance(output, basestring):
+        with open(output, 'wb') as f:
+            return parse_to(response, tag, f, decode=decode)
+    if decode:
+        output = Base64Writer(output)
+    return ResponseParser(outputs={tag: output}).parse(response)
@@ -2,16 +2,143 @@
 #this repository contains the full copyright notices and license terms.
 
 from seur.api import API
+from seur.coalesce import coalesced
+from seur.labels import write
+from seur.parser import parse, parse_to
+from seur.records import iterexpediciones
+from seur.retry import idempotent, retried
+from seur.metrics import instrumented
+from seur.parser import ResponseParser
+from seur.utils import imap_unordered
 
 from xml.dom.minidom import parseString
-import os
+import base64
 import datetime
-import genshi
-import genshi.template
 
-loader = genshi.template.TemplateLoader(
-    os.path.join(os.path.dirname(__file__), 'template'),
-    auto_reload=True)
+#Error of a create whose response was lost but Seur has the expedition
+EXISTING = 'Expedition %s already exists in Seur'
+
+
+def registros(result):
+    """
+    Get the REGn records of an infoPoblacionesCortoStr response
+
+    :param result: file-like XML response
+    :return: list dict
+    """
+    data = parse(result).text('out')
+
+    dom2 = parseString(data.encode('utf-8'))
+    registros = dom2.getElementsByTagName('REGISTROS')
+
+    total = registros[0].childNodes.length
+
+    values = []
+    for i in range(1, total+1):
+        reg_name = 'REG%s' % i
+        reg = registros[0].getElementsByTagName(reg_name)[0]
+        vals = {}
+        for r in reg.childNodes:
+            vals[r.nodeName] = r.firstChild.data
+        values.append(vals)
+    return values
+
+
+def bultos(data):
+    """
+    Parcels of a picking: data['bultos'], a list of dicts with the
+    peso_bulto and ref_bulto of each parcel, or total_bultos parcels with
+    the peso_bulto and ref_bulto of data
+
+    :param data: Dictionary of values
+    :return: list dict
+    """
+    peso_bulto = data.get('peso_bulto', '1')
+    ref_bulto = data.get('ref_bulto', '')
+    if data.get('bultos'):
+        return [{
+                'peso_bulto': bulto.get('peso_bulto', peso_bulto),
+                'ref_bulto': bulto.get('ref_bulto', ref_bulto),
+                } for bulto in data['bultos']]
+    return [{
+            'peso_bulto': peso_bulto,
+            'ref_bulto': ref_bulto,
+            }] * int(data.get('total_bultos', 1))
+
+
+def pickup_key(data):
+    """
+    Origin and date of a pickup: pickups of the same key are booked once by
+    pickup_service_many
+
+    :param data: Dictionary of values (see pickup_service)
+    :return: tuple
+    """
+    return tuple(data.get(name) for name in ('nif_origen', 'cp_origen',
+            'calle_origen', 'num_origen', 'dia_recogida', 'mes_recogida',
+            'anyo_recogida'))
+
+
+def recogida(out):
+    """
+    Values of the out payload of a crearRecogida response
+
+    :param out: unicode XML
+    :return: pickup_ref, pickup_num, amount, error_code, error_description
+             (False when not found)
+    """
+    parser = ResponseParser(tags=('RECOGIDA', 'ERROR', 'LOCALIZADOR',
+            'NUM_RECOGIDA', 'TASACION', 'CODIGO', 'DESCRIPCION'))
+    parser.feed(out.encode('utf-8'))
+    parser.close()
+
+    def last(tag):
+        texts = parser.texts(tag)
+        return texts and texts[-1] or False
+
+    values = [False] * 5
+    if parser.texts('RECOGIDA'):
+        values[:3] = last('LOCALIZADOR'), last('NUM_RECOGIDA'), \
+            last('TASACION')
+    if parser.texts('ERROR'):
+        values[3:] = last('CODIGO'), last('DESCRIPCION')
+    return tuple(values)
+
+
+def total_kilos(bultos):
+    """
+    Sum of the weights of the parcels. Weights may use a decimal comma
+    """
+    total = sum(float(str(bulto['peso_bulto'] or 0).replace(',', '.'))
+        for bulto in bultos)
+    return ('%.2f' % total).rstrip('0').rstrip('.')
+
+
+def kilos(data, parcels):
+    """
+    total_kilos of data or, if not set, the sum of the weights of the parcels
+    of data['bultos'] (1 without bultos)
+    """
+    if 'total_kilos' in data:
+        return data['total_kilos']
+    if not data.get('bultos'):
+        return '1'
+    try:
+        return total_kilos(parcels)
+    except ValueError:
+        return '1'
+
+
+def ecb_reference(data, ecb):
+    """
+    Reference of a created picking: the list of the ECB codes of each
+    parcel with bultos, else the ECB code of the first parcel
+
+    :param ecb: list of ECB codes of the response
+    """
+    if data.get('bultos'):
+        return ecb
+    return ecb and ecb[0] or None
 
 
 class Picking(API):
@@ -20,38 +147,62 @@ class Picking(API):
     """
     __slots__ = ()
 
-    def create(self, data):
+    def _parse_label(self, response, tag, output=None, decode=True):
+        """
+        Parse a response keeping the text of tag, or writing it to output
+
+        :param response: file-like XML response
+        :param tag: label tag
+        :param output: file path or file-like object
+        :param decode: decode the base64 text written to output
+        :return: ResponseParser, label text or output (None if not found)
+        """
+        if output is None:
+            result = parse(response, streams=(tag,))
+            return result, result.text(tag)
+        result = parse_to(response, tag, output, decode=decode)
+        return result, result.texts(tag) and output or None
+
+    @instrumented('create')
+    @idempotent('referencia_expedicion', check='_existing_picking')
+    def create(self, data, output=None):
         """
         Create a picking using the given data
 
-        :param data: Dictionary of values
-        :return: reference (str), label (pdf), error (str)
+        :param data: Dictionary of values. bultos, a list of dicts with the
+                     peso_bulto and ref_bulto of each parcel, sends several
+                     parcels in the same request
+        :param output: file path or file-like object the label is written
+                       to, the PDF decoded, while it is received
+        :return: reference (str, list of the ECB codes of each parcel with
+                 bultos), label (pdf or output), error (str)
         """
-        reference = None
-        label = None
-        error = None
+        account = self.account
+        url, xml = self._create_request(data, account)
+        return self._create_result(self.connect_stream(url, xml), data,
+            output, account)
+
+    def _create_request(self, data, account):
+        """
+        URL and XML of a create request
 
-        if self.context.get('pdf'):
-            tmpl = loader.load('picking_send_pdf.xml')
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        if account.pdf:
+            template = 'picking_send_pdf.xml'
         else:
-            tmpl = loader.load('picking_send.xml')
+            template = 'picking_send.xml'
 
+        parcels = bultos(data)
         vals = {
-            'username': self.username,
-            'password': self.password,
-            'vat': self.vat,
-            'franchise': self.franchise,
-            'seurid': self.seurid,
-            'ci': self.ci,
-            'ccc': self.ccc,
             'servicio': data.get('servicio', '1'),
             'product': data.get('product', '2'),
-            'total_bultos': data.get('total_bultos', 1),
-            'total_kilos': data.get('total_kilos', '1'),
-            'peso_bulto': data.get('peso_bulto', '1'),
+            'bultos': parcels,
+            'total_bultos': len(parcels),
+            'total_kilos': kilos(data, parcels),
             'observaciones': data.get('observaciones', ''),
             'referencia_expedicion': data.get('referencia_expedicion', ''),
-            'ref_bulto': data.get('ref_bulto', ''),
             'clave_portes': data.get('clave_portes', 'F'), # F: Facturacion
             'clave_reembolso': data.get('clave_reembolso', 'F'), # F: Facturacion
             'valor_reembolso': data.get('valor_reembolso', ''),
@@ -77,56 +228,103 @@ class Picking(API):
             'id_mercancia': data.get('id_mercancia', ''),
         }
 
-        if not self.context.get('pdf'):
-            vals['printer'] = self.context.get('printer', 'ZEBRA')
-            vals['printer_model'] = self.context.get('printer_model', 'LP2844-Z')
-            vals['ecb_code'] = self.context.get('ecb_code', '2C')
+        vals.update(account.credentials)
+        vals.update(account.printing)
+
+        url = self.get_url('ImprimirECBWebService', account)
+        xml = self.render(template, vals, fixed=account.credentials)
+        return url, xml
 
-        url = 'https://cit.seur.com/CIT-war/services/ImprimirECBWebService'
-        if self.is_test_config:
-            url = 'https://citpre.seur.com/CIT-war/services/'\
-                'ImprimirECBWebService'
-        xml = tmpl.generate(**vals).render()
+    def _create_result(self, response, data, output, account):
+        """
+        Parse a create response and store its label (see create)
+
+        :param response: file-like XML response
+        :return: tuple
+        """
+        reference = None
+        label = None
+        error = None
 
-        result = self.connect(url, xml)
-        dom = parseString(result)
+        label_tag = account.pdf and 'PDF' or 'traza'
+        result, label = self._parse_label(response, label_tag, output,
+            decode=label_tag == 'PDF')
 
         #Get message error from XML
-        mensaje = dom.getElementsByTagName('mensaje')
-        if mensaje:
-            if mensaje[0].firstChild.data != 'OK':
-                error = mensaje[0].firstChild.data
-                return reference, label, error
+        mensaje = result.text('mensaje')
+        if mensaje is not None:
+            if mensaje != 'OK':
+                error = mensaje
+                return reference, None, error
 
         #Get reference from XML
-        ecb = dom.getElementsByTagName('ECB')
-        if ecb:
-            reference = ecb[0].childNodes[0].firstChild.data
-
-        if self.context.get('pdf'):
-            #Get PDF file from XML
-            pdf = dom.getElementsByTagName('PDF')
-            if pdf:
-                label = pdf[0].firstChild.data
-        else:
-            #Get TXT file from XML
-            traza = dom.getElementsByTagName('traza')
-            if traza:
-                label = traza[0].firstChild.data
+        reference = ecb_reference(data, result.texts('ECB'))
+
+        if self.labels is not None and label is not None:
+            references = [data.get('referencia_expedicion')]
+            if isinstance(reference, basestring):
+                references.append(reference)
+            self._store_label(references, label, output, account)
 
         return reference, label, error
 
+    def _existing_picking(self, data, output=None):
+        """
+        Check if Seur has the expedition of referencia_expedicion, before
+        sending again a create whose response was lost. Its label is not
+        requested: it is printed with the same request that creates it.
+
+        :return: create result (no reference nor label, and the error that
+                 the expedition exists) or None if not found
+        """
+        expedicion = self.info({
+                'reference': data['referencia_expedicion'],
+                }, records=True)
+        if expedicion is None:
+            return None
+        return None, None, EXISTING % data['referencia_expedicion']
+
+    def create_many(self, datas, max_workers=4):
+        """
+        Create pickings in parallel. An error in one picking does not stop
+        the others.
+
+        :param datas: iterable of dictionary of values (see create)
+        :param max_workers: number of requests sent at the same time
+        :return: iterator of (index, reference, label, error) as requests
+                 complete. index is the position in datas and error the
+                 Seur message or the exception raised
+        """
+        for index, result, exception in imap_unordered(self.create, datas,
+                max_workers=max_workers):
+            if exception is not None:
+                yield index, None, None, exception
+            else:
+                reference, label, error = result
+                yield index, reference, label, error
+
+    @instrumented('pickup_service')
+    @idempotent('num_referencia')
     def pickup_service(self, data):
-        tmpl = loader.load('pickup_service.xml')
+        account = self.account
+        url, xml = self._pickup_service_request(data, account)
+        return self._pickup_service_result(self.connect_stream(url, xml))
+
+    def _pickup_service_request(self, data, account):
+        """
+        URL and XML of a pickup_service request
+
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        template = 'pickup_service.xml'
 
-        if not self.ws_username or not self.ws_password:
+        if not account.ws_username or not account.ws_password:
             raise Exception(
                 'You have not set the username and password for ws.seur.com '
                 'and are necessary for a pickup service.')
 
         vals = {
-            'username': self.ws_username,
-            'password': self.ws_password,
             'nombre_empresa': data.get('nombre_empresa', ''),
             'razon_social': data.get('razon_social', ''),
 
@@ -215,158 +413,272 @@ class Picking(API):
             'notas': data.get('notas', ''),
             'valor_declarado': data.get('valor_declarado', '0')
         }
-        url = 'https://ws.seur.com/webseur/services/WSCrearRecogida'
-        if self.is_test_config:
-            url = 'https://wspre.seur.com/webseur/services/WSCrearRecogida'
-        xml = tmpl.generate(**vals).render()
-
-        result = self.connect(url, xml)
-        dom = parseString(result)
-        try:
-            info = parseString(
-                dom.getElementsByTagName('out')[0].childNodes[0].data.
-                encode('utf-8'))
-        except:
-            info = parseString(
-                dom.getElementsByTagName('ns1:out')[0].childNodes[0].data.
-                encode('utf-8'))
-        pickup_ref = False
-        pickup_num = False
-        amount = False
-        error_code = False
-        error_description = False
-        pick = info.getElementsByTagName('RECOGIDA')
-        error = info.getElementsByTagName('ERROR')
-        if pick:
-            pickup_ref = info.getElementsByTagName('LOCALIZADOR').pop()\
-                .childNodes[0].data
-            pickup_num = info.getElementsByTagName('NUM_RECOGIDA').pop()\
-                .childNodes[0].data
-            amount = info.getElementsByTagName('TASACION').pop()\
-                .childNodes[0].data
-        if error:
-            error_code = info.getElementsByTagName('CODIGO').pop()\
-                .childNodes[0].data
-            error_description = info.getElementsByTagName('DESCRIPCION')\
-                .pop().childNodes[0].data
-        return pickup_ref, pickup_num, amount, error_code, error_description
+        vals.update(account.ws_credentials)
+        url = self.get_url('WSCrearRecogida', account)
+        xml = self.render(template, vals, fixed=account.ws_credentials)
+        return url, xml
+
+    def _pickup_service_result(self, response):
+        """
+        Parse a pickup_service response
 
+        :param response: file-like XML response
+        :return: tuple
+        """
+        result = parse(response)
+        #out or ns1:out
+        return recogida(result.text('out'))
+
+    def pickup_service_many(self, datas, max_workers=4):
+        """
+        Book pickups in parallel. Pickups of the same origin and date (see
+        pickup_key) are booked once and share the result. An error in one
+        pickup does not stop the others.
+
+        :param datas: iterable of dictionary of values (see pickup_service)
+        :param max_workers: number of requests sent at the same time
+        :return: list of (pickup_ref, pickup_num, amount, error_code,
+                 error_description) in the order of datas. error_description
+                 is the exception raised, if any
+        """
+        return self._many(self.pickup_service, datas, pickup_key, max_workers,
+            lambda e: (False, False, False, False, e))
+
+    def cancel_pickup_many(self, pickups, max_workers=4):
+        """
+        Cancel pickups in parallel. Repeated pickups are cancelled once.
+
+        :param pickups: iterable of (pickup_num, pickup_ref)
+        :param max_workers: number of requests sent at the same time
+        :return: list of (info, error) in the order of pickups. error is the
+                 exception raised, if any
+        """
+        return self._many(lambda pickup: self.cancel_pickup(*pickup),
+            pickups, tuple, max_workers,
+            lambda e: (None, e))
+
+    def _many(self, func, items, key, max_workers, failed):
+        """
+        Call func once per distinct key of items in parallel
+
+        :param failed: callable returning the result of an exception
+        :return: list of results in the order of items
+        """
+        positions = []
+        unique = []
+        seen = {}
+        for item in items:
+            k = key(item)
+            if k not in seen:
+                seen[k] = len(unique)
+                unique.append(item)
+            positions.append(seen[k])
+        results = [None] * len(unique)
+        for index, result, exception in imap_unordered(func, unique,
+                max_workers=max_workers):
+            if exception is not None:
+                result = failed(exception)
+            results[index] = result
+        return [results[position] for position in positions]
+
+    @instrumented('cancel_pickup')
     def cancel_pickup(self, pickup_num, pickup_ref):
-        tmpl = loader.load('pickup_service_cancel.xml')
+        account = self.account
+        url, xml = self._cancel_pickup_request(pickup_num, pickup_ref,
+            account)
+        return self._cancel_pickup_result(self.connect_stream(url, xml))
+
+    def _cancel_pickup_request(self, pickup_num, pickup_ref, account):
+        """
+        URL and XML of a cancel_pickup request
+
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        template = 'pickup_service_cancel.xml'
 
-        if not self.ws_username or not self.ws_password:
+        if not account.ws_username or not account.ws_password:
             raise Exception(
                 'You have not set the username and password for ws.seur.com '
                 'and are necessary for a pickup service.')
 
-        url = 'https://ws.seur.com/webseur/services/WSCrearRecogida'
-        if self.is_test_config:
-            url = 'https://wspre.seur.com/webseur/services/WSCrearRecogida'
+        url = self.get_url('WSCrearRecogida', account)
         vals = {
-            'username': self.ws_username,
-            'password': self.ws_password,
             'pickup_ref': pickup_ref,
             'pickup_num': pickup_num
         }
-        xml = tmpl.generate(**vals).render()
-        result = self.connect(url, xml)
-        dom = parseString(result)
-        info = dom.getElementsByTagName('ns1:out')[0].childNodes[0].data
+        vals.update(account.ws_credentials)
+        xml = self.render(template, vals, fixed=account.ws_credentials)
+        return url, xml
+
+    def _cancel_pickup_result(self, response):
+        """
+        Parse a cancel_pickup response
+
+        :param response: file-like XML response
+        :return: tuple
+        """
+        result = parse(response)
+        info = result.text('out')
         error = info
         # The label for success and error is the same, so we have to search
         # the word 'exito' but actually we search just 'xito' because the 'e'
         # comes with accent mark.
-        if info.find('xito'):
+        if 'xito' in info:
             error = False
         return info, error
 
-    def info(self, data):
+    @instrumented('info')
+    @coalesced('WSConsultaExpediciones', lambda data, records=False: (
+            data.get('expedicion', 'S'), data.get('reference'),
+            data.get('service', '0'), data.get('public', 'N'), records))
+    @retried
+    def info(self, data, records=False):
         """
         Picking info using the given data
 
         :param data: Dictionary of values
-        :return: info dict
+        :param records: return the parsed expedition
+        :return: info XML string (seur.records.Expedicion or None with
+                 records)
+        """
+        account = self.account
+        url, xml = self._info_request(data, account)
+        return self._info_result(self.connect_stream(url, xml), records)
+
+    def _info_request(self, data, account):
+        """
+        URL and XML of an info request
+
+        :param account: seur.account.Account read by the caller
+        :return: tuple
         """
-        tmpl = loader.load('picking_info.xml')
+        template = 'picking_info.xml'
 
         vals = {
-            'username': self.username,
-            'password': self.password,
             'expedicion': data.get('expedicion', 'S'),
             'reference': data.get('reference'),
             'service': data.get('service', '0'),
             'public': data.get('public', 'N'),
             }
+        vals.update(account.credentials)
 
-        url = 'https://ws.seur.com/webseur/services/WSConsultaExpediciones'
-        xml = tmpl.generate(**vals).render()
-        result = self.connect(url, xml)
-        dom = parseString(result)
+        url = self.get_url('WSConsultaExpediciones', account)
+        xml = self.render(template, vals, fixed=account.credentials)
+        return url, xml
+
+    def _info_result(self, response, records=False):
+        """
+        Parse an info response (see info)
+
+        :param response: file-like XML response
+        """
+        if records:
+            expediciones = list(iterexpediciones(response))
+            return expediciones and expediciones[0] or None
+        result = parse(response)
 
         #Get info
-        info = dom.getElementsByTagName('ns1:out')
-        return info[0].firstChild.data
+        return result.text('out')
 
-    def list(self, data):
+    @instrumented('list')
+    @retried
+    def list(self, data, records=False):
         """
         Picking list using the given data
 
         :param data: Dictionary of values
-        :return: list dict
+        :param records: return the parsed expeditions lazily, as the
+                        response is read. The connection is held until the
+                        iterator is exhausted or closed
+        :return: list XML string (iterator of seur.records.Expedicion with
+                 records)
         """
-        tmpl = loader.load('picking_list.xml')
+        account = self.account
+        url, xml = self._list_request(data, account)
+        return self._list_result(self.connect_stream(url, xml), records)
+
+    def _list_request(self, data, account):
+        """
+        URL and XML of a list request
+
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        template = 'picking_list.xml'
 
         t = datetime.datetime.now()
         today = '%s-%s-%s' % (t.day, t.month, t.year)
 
         vals = {
-            'username': self.username,
-            'password': self.password,
-            'ccc': self.ccc,
             'expedicion': data.get('expedicion', 'S'),
             'date_from': data.get('from', today),
             'date_to': data.get('to', today),
             'service': data.get('service', '0'),
             'public': data.get('public', 'N'),
             }
+        vals.update(account.credentials)
+
+        url = self.get_url('WSConsultaExpediciones', account)
+        xml = self.render(template, vals, fixed=account.credentials)
+        return url, xml
 
-        url = 'https://ws.seur.com/webseur/services/WSConsultaExpediciones'
-        xml = tmpl.generate(**vals).render()
-        result = self.connect(url, xml)
-        dom = parseString(result)
+    def _list_result(self, response, records=False):
+        """
+        Parse a list response (see list)
+
+        :param response: file-like XML response
+        """
+        if records:
+            return iterexpediciones(response)
+        result = parse(response)
 
         #Get list
-        info = dom.getElementsByTagName('ns1:out')
-        return info[0].firstChild.data
+        return result.text('out')
 
-    def label(self, data):
+    @instrumented('label')
+    @retried
+    def label(self, data, output=None):
         """
-        Get label picking using reference
+        Get label picking using reference, from the label store if the API
+        has one
 
-        :param data: Dictionary of values
-        :return: string
+        :param data: Dictionary of values (bultos, see create)
+        :param output: file path or file-like object the label is written
+                       to, the PDF decoded, while it is received
+        :return: string or output
         """
-        if self.context.get('pdf'):
-            tmpl = loader.load('picking_label_pdf.xml')
+        account = self.account
+        if self.labels is not None:
+            label = self._stored_label(data, output, account)
+            if label is not None:
+                return label
+
+        url, xml = self._label_request(data, account)
+        return self._label_result(self.connect_stream(url, xml), data, output,
+            account)
+
+    def _label_request(self, data, account):
+        """
+        URL and XML of a label request
+
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        if account.pdf:
+            template = 'picking_label_pdf.xml'
         else:
-            tmpl = loader.load('picking_label.xml')
+            template = 'picking_label.xml'
 
+        parcels = bultos(data)
         vals = {
-            'username': self.username,
-            'password': self.password,
-            'vat': self.vat,
-            'franchise': self.franchise,
-            'seurid': self.seurid,
-            'ci': self.ci,
-            'ccc': self.ccc,
             'servicio': data.get('servicio', '1'),
             'product': data.get('product', '2'),
-            'total_bultos': data.get('total_bultos', 1),
-            'total_kilos': data.get('total_kilos', '1'),
-            'peso_bulto': data.get('peso_bulto', '1'),
+            'bultos': parcels,
+            'total_bultos': len(parcels),
+            'total_kilos': kilos(data, parcels),
             'observaciones': data.get('observaciones', ''),
             'referencia_expedicion': data.get('referencia_expedicion', ''),
-            'ref_bulto': data.get('ref_bulto', ''),
             'clave_portes': data.get('clave_portes', 'F'), # F: Facturacion
             'clave_reembolso': data.get('clave_reembolso', 'F'), # F: Facturacion
             'valor_reembolso': data.get('valor_reembolso', ''),
@@ -386,69 +698,171 @@ class Picking(API):
             'cliente_atencion': data.get('cliente_atencion', ''),
             }
 
-        if not self.context.get('pdf'):
-            vals['printer'] = self.context.get('printer', 'ZEBRA')
-            vals['printer_model'] = self.context.get('printer_model', 'LP2844-Z')
-            vals['ecb_code'] = self.context.get('ecb_code', '2C')
+        vals.update(account.credentials)
+        vals.update(account.printing)
 
-        url = 'https://cit.seur.com/CIT-war/services/ImprimirECBWebService'
-        if self.is_test_config:
-            url = 'https://citpre.seur.com/CIT-war/services/'\
-                'ImprimirECBWebService'
-        xml = tmpl.generate(**vals).render()
+        url = self.get_url('ImprimirECBWebService', account)
+        xml = self.render(template, vals, fixed=account.credentials)
+        return url, xml
 
-        result = self.connect(url, xml)
-        dom = parseString(result)
+    def _label_result(self, response, data, output, account):
+        """
+        Parse a label response and store the label (see label)
 
-        if self.context.get('pdf'):
-            pdf = dom.getElementsByTagName('PDF')
-            if pdf:
-                return pdf[0].firstChild.data
-        else:
-            traza = dom.getElementsByTagName('traza')
-            if traza:
-                return traza[0].firstChild.data
+        :param response: file-like XML response
+        :return: label text or output (None if not found)
+        """
+        label_tag = account.pdf and 'PDF' or 'traza'
+        result, label = self._parse_label(response, label_tag, output,
+            decode=label_tag == 'PDF')
+        if self.labels is not None and label is not None:
+            self._store_label([data.get('referencia_expedicion')], label,
+                output, account)
+        return label
+
+    def label_format(self):
+        """
+        Format of the labels of the context: pdf or the printer, printer
+        model and ECB code of the traces
 
-        return None
+        :return: string
+        """
+        return self.account.label_format
+
+    def label_owner(self):
+        """
+        Account of the labels in the label store: username, ccc and server
+
+        :return: string
+        """
+        return self.account.label_owner
 
-    def manifiesto(self, data):
+    def _stored_label(self, data, output=None, account=None):
+        """
+        Label of referencia_expedicion in the label store, as returned by
+        label, or None if not stored
+        """
+        account = account or self.account
+        reference = data.get('referencia_expedicion')
+        if not reference:
+            return None
+        value = self.labels.get(account.label_owner, reference,
+            account.label_format)
+        if value is None:
+            return None
+        if output is not None:
+            return write(value, output)
+        if account.pdf:
+            return base64.b64encode(value[:]).decode('ascii')
+        return value[:].decode('utf-8')
+
+    def _store_label(self, references, label, output=None, account=None):
+        """
+        Save a label received, as written to output, in the label store.
+        Labels written to file-like outputs are not stored.
+        """
+        account = account or self.account
+        if output is None:
+            if account.pdf:
+                value = base64.b64decode(label)
+            else:
+                value = label.encode('utf-8')
+        elif isinstance(output, basestring):
+            with open(output, 'rb') as f:
+                value = f.read()
+        else:
+            return
+        self.labels.set(account.label_owner, references,
+            account.label_format, value)
+
+    @instrumented('manifiesto')
+    @coalesced('DetalleBultoPDFWebService', lambda data, output=None:
+        output is None and (data.get('date'),) or None)
+    @retried
+    def manifiesto(self, data, output=None):
         """
         Get Manifiesto
 
         :param data: Dictionary of values
-        :return: string
+        :param output: file path or file-like object the decoded PDF is
+                       written to while it is received
+        :return: string or output
         """
-        tmpl = loader.load('manifiesto.xml')
+        account = self.account
+        url, xml = self._manifiesto_request(data, account)
+        return self._manifiesto_result(self.connect_stream(url, xml), output)
 
-        vals = {
-            'username': self.username,
-            'password': self.password,
-            'vat': self.vat,
-            'franchise': self.franchise,
-            'seurid': self.seurid,
-            'ci': self.ci,
-            'ccc': self.ccc,
-        }
+    def _manifiesto_request(self, data, account):
+        """
+        URL and XML of a manifiesto request
+
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        template = 'manifiesto.xml'
+
+        vals = dict(account.credentials)
         if data.get('date'):
             vals['date'] = data.get('date')
         else:
             d = datetime.datetime.now()
             vals['date'] = '%s-%s-%s' % (d.year, d.strftime('%m'), d.strftime('%d'))
 
-        url = 'https://cit.seur.com/CIT-war/services/DetalleBultoPDFWebService'
-        if self.is_test_config:
-            url = 'https://citpre.seur.com/CIT-war/services/'\
-                'DetalleBultoPDFWebService'
-        xml = tmpl.generate(**vals).render()
+        url = self.get_url('DetalleBultoPDFWebService', account)
+        xml = self.render(template, vals, fixed=account.credentials)
+        return url, xml
 
-        result = self.connect(url, xml)
-        dom = parseString(result)
+    def _manifiesto_result(self, response, output=None):
+        """
+        Parse a manifiesto response (see manifiesto)
+
+        :param response: file-like XML response
+        :return: string or output
+        """
+        result, manifiesto = self._parse_label(response, 'out', output)
+        return manifiesto
+
+    def _lookup(self, method, key, fetch):
+        """
+        Get zip or city values from the catalogue or the cache and call
+        fetch (the webservice) when not found
+
+        :param method: 'zip' or 'city'
+        :param key: zip or city
+        :param fetch: function to get the values from Seur
+        :return: list dict
+        """
+        values = self._looked_up(method, key)
+        if values is not None:
+            return values
+        values = fetch(key)
+        self._keep_lookup(method, key, values)
+        return values
+
+    def _looked_up(self, method, key):
+        """
+        zip or city values in the catalogue or the cache, or None
+        """
+        if self.catalogue is not None:
+            values = getattr(self.catalogue, method)(key)
+            if values:
+                return values
+        if self.cache is not None:
+            return self.cache.get('%s:%s' % (method, key))
+        return None
 
-        pdf = dom.getElementsByTagName('ns1:out')
-        if pdf:
-            return pdf[0].firstChild.data
-        return
+    def _keep_lookup(self, method, key, values):
+        """
+        Add zip or city values received from Seur to the catalogue and the
+        cache
+        """
+        if self.catalogue is not None:
+            self.catalogue.add(values, **{method: key})
+        if self.cache is not None:
+            self.cache.set('%s:%s' % (method, key), values)
 
+    @instrumented('city')
+    @coalesced('WSServiciosWebPublicos', lambda city: city.upper())
     def city(self, city):
         """
         Get Seur values from city
@@ -456,37 +870,34 @@ class Picking(API):
         :param city: string
         :return: dict
         """
-        tmpl = loader.load('city.xml')
-
-        vals = {
-            'username': self.username,
-            'password': self.password,
-            'city': city.upper(),
-            }
+        return self._lookup('city', city.upper(), self._city)
 
-        url = 'https://ws.seur.com/WSEcatalogoPublicos/servlet/XFireServlet/WSServiciosWebPublicos'
-        xml = tmpl.generate(**vals).render()
-        result = self.connect(url, xml)
+    @retried
+    def _city(self, city):
+        account = self.account
+        url, xml = self._city_request(city, account)
+        return registros(self.connect_stream(url, xml))
 
-        dom = parseString(result)
-        info = dom.getElementsByTagName('ns1:out')
-        data = info[0].firstChild.data
-        dom2 = parseString(data.encode('utf-8'))
-        registros = dom2.getElementsByTagName('REGISTROS')
+    def _city_request(self, city, account):
+        """
+        URL and XML of a city request
 
-        total = registros[0].childNodes.length
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        template = 'city.xml'
 
-        values = []
-        for i in range(1, total+1):
-            reg_name = 'REG%s' % i
-            reg = registros[0].getElementsByTagName(reg_name)[0]
-            vals = {}
-            for r in reg.childNodes:
-                vals[r.nodeName] = r.firstChild.data
-            values.append(vals)
+        vals = {
+            'city': city,
+            }
+        vals.update(account.credentials)
 
-        return values
+        url = self.get_url('WSServiciosWebPublicos', account)
+        xml = self.render(template, vals, fixed=account.credentials)
+        return url, xml
 
+    @instrumented('zip')
+    @coalesced('WSServiciosWebPublicos', lambda zip: zip)
     def zip(self, zip):
         """
         Get Seur values from zip
@@ -494,34 +905,28 @@ class Picking(API):
         :param zip: string
         :return: list dict
         """
-        tmpl = loader.load('zip.xml')
+        return self._lookup('zip', zip, self._zip)
 
-        vals = {
-            'username': self.username,
-            'password': self.password,
-            'zip': zip,
-            }
-
-        url = 'https://ws.seur.com/WSEcatalogoPublicos/servlet/XFireServlet/WSServiciosWebPublicos'
-        xml = tmpl.generate(**vals).render()
-        result = self.connect(url, xml)
+    @retried
+    def _zip(self, zip):
+        account = self.account
+        url, xml = self._zip_request(zip, account)
+        return registros(self.connect_stream(url, xml))
 
-        dom = parseString(result)
-        info = dom.getElementsByTagName('ns1:out')
-        data = info[0].firstChild.data
-
-        dom2 = parseString(data.encode('utf-8'))
-        registros = dom2.getElementsByTagName('REGISTROS')
+    def _zip_request(self, zip, account):
+        """
+        URL and XML of a zip request
 
-        total = registros[0].childNodes.length
+        :param account: seur.account.Account read by the caller
+        :return: tuple
+        """
+        template = 'zip.xml'
 
-        values = []
-        for i in range(1, total+1):
-            reg_name = 'REG%s' % i
-            reg = registros[0].getElementsByTagName(reg_name)[0]
-            vals = {}
-            for r in reg.childNodes:
-                vals[r.nodeName] = r.firstChild.data
-            values.append(vals)
+        vals = {
+            'zip': zip,
+            }
+        vals.update(account.credentials)
 
-        return values
+        url = self.get_url('WSServiciosWebPublicos', account)
+        xml = self.render(template, vals, fixed=account.credentials)
+        return url, xml
@@ -0,0 +1,286 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from StringIO import StringIO
+import Queue
+import base64
+import multiprocessing
+import re
+import time
+
+try:
+    import PyPDF2
+except ImportError:
+    PyPDF2 = None
+
+#End of a ZPL label in an ECB trace
+TRACE_END = re.compile(r'\^XZ\s*')
+#Seconds a label is processed before it is given up (its worker died)
+TIMEOUT = 300
+
+
+def split_pdf(data):
+    """
+    Split a PDF in a PDF per page (a label per parcel). Requires PyPDF2.
+
+    :param data: PDF bytes
+    :return: list of PDF bytes
+    """
+    if PyPDF2 is None:
+        raise ImportError('PyPDF2 is required to split PDF labels')
+    reader = PyPDF2.PdfFileReader(StringIO(data))
+    pages = []
+    for number in range(reader.getNumPages()):
+        writer = PyPDF2.PdfFileWriter()
+        writer.addPage(reader.getPage(number))
+        output = StringIO()
+        writer.write(output)
+        pages.append(output.getvalue())
+    return pages
+
+
+def merge_pdfs(datas):
+    """
+    Merge PDFs in one. Requires PyPDF2.
+
+    :param datas: list of PDF bytes
+    :return: PDF bytes
+    """
+    if PyPDF2 is None:
+        raise ImportError('PyPDF2 is required to merge PDF labels')
+    merger = PyPDF2.PdfFileMerger()
+    for data in datas:
+        merger.append(StringIO(data))
+    output = StringIO()
+    merger.write(output)
+    return output.getvalue()
+
+
+def split_trace(trace):
+    """
+    Split an ECB trace in a trace per label (^XA ... ^XZ)
+
+    :param trace: trace bytes
+    :return: list of trace bytes
+    """
+    labels = []
+    start = 0
+    for match in TRACE_END.finditer(trace):
+        labels.append(trace[start:match.end()])
+        start = match.end()
+    if trace[start:].strip():
+        labels.append(trace[start:])
+    return labels
+
+
+def decode(label, pdf=True, split=False):
+    """
+    Decode a label returned by create or label
+
+    :param label: base64 PDF or ECB trace (unicode)
+    :param pdf: the label is a PDF
+    :param split: split it in a label per parcel
+    :return: list of PDF or trace bytes
+    """
+    if pdf:
+        data = base64.b64decode(label)
+        return split and split_pdf(data) or [data]
+    if isinstance(label, unicode):
+        label = label.encode('utf-8')
+    return split and split_trace(label) or [label]
+
+
+def merge(labels, pdf=True):
+    """
+    Merge decoded labels in one print batch
+
+    :return: PDF or trace bytes
+    """
+    if pdf:
+        return merge_pdfs(labels)
+    return ''.join(labels)
+
+
+def call(func, args):
+    """
+    Call func in a worker process returning (result, exception): exceptions
+    can not be returned by the pool callbacks of Python 2
+    """
+    try:
+        return func(*args), None
+    except Exception as e:
+        return None, e
+
+
+class LabelPipeline(object):
+    """
+    Post-processing of labels (decode, split and merge) in a process pool,
+    overlapped with the requests that produce them
+
+    The stages consume their input lazily and keep at most max_pending
+    labels in the pool, so a producer like Picking.create_many only sends
+    requests as fast as the labels are processed. The pool is started with
+    the pipeline: create it before the threads of the producer.
+
+    Example usage ::
+
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context=context) as picking_api, LabelPipeline() as pipeline:
+            results = picking_api.create_many(datas, max_workers=8)
+            labels = ((index, label) for index, _, label, _ in results
+                if label)
+            for station, keys, batch, error in pipeline.batches(
+                    pipeline.decoded(labels, pdf=True, split=True),
+                    station=lambda index: datas[index]['station'],
+                    pdf=True):
+                print_batch(station, batch)
+    """
+
+    def __init__(self, processes=None, max_pending=None, timeout=TIMEOUT):
+        """
+        :param processes: processes of the pool (default CPU count)
+        :param max_pending: labels in the pool at the same time (default
+                            two per process)
+        :param timeout: seconds a label is processed before it is returned
+                        with a multiprocessing.TimeoutError
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_pending = max_pending or self.processes * 2
+        self.timeout = timeout
+        #Forked now, not from a stage running with the producer threads
+        self._pool = multiprocessing.Pool(self.processes)
+        #Tasks timed out
+        self._lost = False
+
+    def __enter__(self):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.processes)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            raise ValueError('LabelPipeline is closed')
+        return self._pool
+
+    def close(self):
+        """
+        Stop the processes of the pool
+        """
+        if self._pool is not None:
+            if self._lost:
+                #join waits forever for the tasks of a dead worker
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._lost = False
+
+    def map(self, func, items):
+        """
+        Call func in the pool for the arguments of each item
+
+        :param func: module level function (picklable)
+        :param items: iterable of (key, args tuple), consumed lazily
+        :return: iterator of (key, result, exception) as they complete. A
+                 call not done after timeout seconds (its worker died) is
+                 returned with a multiprocessing.TimeoutError
+        """
+        pool = self.pool
+        done = Queue.Queue()
+        #Key and deadline by task
+        pending = {}
+        for task, (key, args) in enumerate(items):
+            pending[task] = key, time.time() + self.timeout
+            pool.apply_async(call, (func, args),
+                callback=lambda value, task=task: done.put((task,) + value))
+            while pending:
+                result = self._next(done, pending,
+                    block=len(pending) >= self.max_pending)
+                if result is None:
+                    break
+                yield result
+        while pending:
+            yield self._next(done, pending, block=True)
+
+    def _next(self, done, pending, block):
+        """
+        Next (key, result, exception) of the pending tasks, or None if none
+        is done and not block. Waits up to the first deadline.
+        """
+        while True:
+            timeout = None
+            if block:
+                deadline = min(deadline for _, deadline in pending.values())
+                timeout = max(0, deadline - time.time())
+            try:
+                task, result, exception = done.get(block, timeout)
+            except Queue.Empty:
+                if not block:
+                    return None
+                task = min(pending, key=lambda task: pending[task][1])
+                key, _ = pending.pop(task)
+                self._lost = True
+                return key, None, multiprocessing.TimeoutError(
+                    'Label not processed in %s seconds' % self.timeout)
+            #Results of the tasks already timed out are dropped
+            if task in pending:
+                key, _ = pending.pop(task)
+                return key, result, exception
+
+    def decoded(self, labels, pdf=True, split=False):
+        """
+        Decode labels
+
+        :param labels: iterable of (key, label as returned by create or
+                       label)
+        :param pdf: the labels are PDF
+        :param split: split them in a label per parcel
+        :return: iterator of (key, list of PDF or trace bytes, exception) as
+                 they complete
+        """
+        return self.map(decode, ((key, (label, pdf, split))
+                for key, label in labels))
+
+    def batches(self, decoded, station, size=50, pdf=True):
+        """
+        Merge decoded labels in print batches of each station
+
+        :param decoded: iterable of (key, list of labels, exception), like
+                        the decoded output
+        :param station: callable returning the station of a key
+        :param size: labels of a batch
+        :param pdf: the labels are PDF
+        :return: iterator of (station, list of keys, merged bytes, exception)
+                 as they complete. A label that failed to decode is returned
+                 alone with no bytes and its exception.
+        """
+        failed = []
+
+        def groups():
+            pending = {}
+            for key, labels, exception in decoded:
+                name = station(key)
+                if exception is not None:
+                    failed.append((name, [key], None, exception))
+                    continue
+                group = pending.setdefault(name, ([], []))
+                group[0].append(key)
+                group[1].extend(labels)
+                if len(group[1]) >= size:
+                    yield name, pending.pop(name)
+            for name, group in pending.items():
+                yield name, group
+
+        for (name, keys), batch, exception in self.map(merge,
+                (((name, keys), (labels, pdf))
+                    for name, (keys, labels) in groups())):
+            while failed:
+                yield failed.pop(0)
+            yield name, keys, batch, exception
+        while failed:
+            yield failed.pop(0)
@@ -0,0 +1,193 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from seur.parser import CHUNK_SIZE, ResponseParser
+from xml.parsers import expat
+import collections
+import datetime
+
+#Elements of the consultaExpedicionesStr XML (Picking.list and Picking.info)
+EXPEDICION = 'EXPEDICION'
+SITUACION = 'SITUACION'
+#Fields of the EXPEDICION and SITUACION records
+NUMBER_FIELD = 'EXPEDICION_NUM'
+REFERENCE_FIELD = 'REF_EXPEDICION'
+DATE_FIELD = 'FECHA_CAPTURA'
+SITUACION_DATE_FIELD = 'FECHA_SITUACION'
+SITUACION_CODE_FIELD = 'COD_SITUACION'
+SITUACION_DESCRIPTION_FIELD = 'DESCRIPCION_CLIENTE'
+DATE_FORMAT = '%d-%m-%Y'
+
+
+def parse_date(value):
+    """
+    Date of a dd-mm-yyyy value
+
+    :return: datetime.date or None if empty or in other format
+    """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value.strip()[:10],
+            DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+class Situacion(object):
+    """
+    Tracking event of an expedition
+
+    values has all the fields returned by Seur
+    """
+    __slots__ = ('date', 'code', 'description', 'values')
+
+    def __init__(self, values):
+        self.values = values
+        self.date = parse_date(values.get(SITUACION_DATE_FIELD))
+        self.code = values.get(SITUACION_CODE_FIELD)
+        self.description = values.get(SITUACION_DESCRIPTION_FIELD)
+
+    def __repr__(self):
+        return '<Situacion %s %s %s>' % (self.date, self.code,
+            self.description)
+
+
+class Expedicion(object):
+    """
+    Expedition of Picking.list and Picking.info with its tracking events
+
+    values has all the fields returned by Seur
+    """
+    __slots__ = ('number', 'reference', 'date', 'situaciones', 'values')
+
+    def __init__(self, values, situaciones=()):
+        self.values = values
+        self.situaciones = list(situaciones)
+        self.number = values.get(NUMBER_FIELD)
+        self.reference = values.get(REFERENCE_FIELD)
+        self.date = parse_date(values.get(DATE_FIELD))
+
+    def __repr__(self):
+        return '<Expedicion %s %s>' % (self.number, self.reference)
+
+    @property
+    def situacion(self):
+        """
+        Last tracking event or None
+        """
+        return self.situaciones and self.situaciones[-1] or None
+
+    def to_dict(self):
+        """
+        Values of the expedition, SITUACIONES is the list of values of the
+        tracking events
+        """
+        values = dict(self.values)
+        values['SITUACIONES'] = [s.values for s in self.situaciones]
+        return values
+
+
+class ExpedicionParser(object):
+    """
+    File-like object parsing the EXPEDICIONES XML written to it (utf-8) into
+    Expedicion records, appended to records as each EXPEDICION ends
+
+    Text that is not XML (a message instead of expeditions) is ignored.
+    """
+
+    def __init__(self):
+        self.records = collections.deque()
+        self._xml = None
+        self._values = None
+        self._situaciones = None
+        self._situacion = None
+        self._open = None
+        self._text = []
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._text.append
+
+    def _start(self, name, attrs):
+        if name == EXPEDICION:
+            self._values = {}
+            self._situaciones = []
+        elif name == SITUACION and self._values is not None:
+            self._situacion = {}
+        self._open = name
+        del self._text[:]
+
+    def _end(self, name):
+        #Elements without children are fields
+        leaf = self._open == name
+        self._open = None
+        if name == EXPEDICION and self._values is not None:
+            self.records.append(Expedicion(self._values, self._situaciones))
+            self._values = self._situaciones = None
+        elif name == SITUACION and self._situacion is not None:
+            self._situaciones.append(Situacion(self._situacion))
+            self._situacion = None
+        elif leaf and self._situacion is not None:
+            self._situacion[name] = u''.join(self._text)
+        elif leaf and self._values is not None:
+            self._values[name] = u''.join(self._text)
+        del self._text[:]
+
+    def write(self, data):
+        if self._xml is None:
+            start = data.lstrip()
+            if not start:
+                return
+            self._xml = start.startswith('<')
+        if self._xml:
+            self._parser.Parse(data, False)
+
+    def flush(self):
+        if self._xml:
+            self._parser.Parse('', True)
+
+
+def iterexpediciones(response, chunk_size=CHUNK_SIZE):
+    """
+    Parse a file-like consultaExpedicionesStr response lazily
+
+    The response is read a chunk at a time and the connection is released
+    when the iterator is exhausted or closed.
+
+    :param response: file-like
+    :return: iterator of Expedicion
+    """
+    expediciones = ExpedicionParser()
+    records = expediciones.records
+    parser = ResponseParser(outputs={'out': expediciones})
+    try:
+        while True:
+            data = response.read(chunk_size)
+            if not data:
+                break
+            parser.feed(data)
+            while records:
+                yield records.popleft()
+        parser.close()
+    finally:
+        response.close()
+    while records:
+        yield records.popleft()
+
+
+def expediciones(data):
+    """
+    Parse the text returned by Picking.list and Picking.info
+
+    :param data: XML string
+    :return: list of Expedicion
+    """
+    parser = ExpedicionParser()
+    if data:
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        parser.write(data)
+        parser.flush()
+    return list(parser.records)
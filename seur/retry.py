@@ -0,0 +1,173 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from functools import wraps
+from seur.transport import ConnectError
+import httplib
+import random
+import socket
+import threading
+import time
+import urllib2
+
+ATTEMPTS = 3
+BACKOFF = 0.5
+MAX_BACKOFF = 10.0
+#HTTP status of the responses retried
+STATUSES = (429, 500, 502, 503, 504)
+
+
+class Retry(object):
+    """
+    Retry policy: attempts with jittered exponential backoff on transient
+    errors (connection errors, timeouts and STATUSES responses)
+
+    Example usage ::
+
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context=context, retry=Retry(attempts=5)) as picking_api:
+            options = picking_api.zip('08720')
+    """
+
+    def __init__(self, attempts=ATTEMPTS, backoff=BACKOFF,
+            max_backoff=MAX_BACKOFF, statuses=STATUSES):
+        """
+        :param attempts: max calls, the first one included
+        :param backoff: seconds of the first backoff, doubled every retry
+        :param max_backoff: max seconds of a backoff
+        :param statuses: HTTP status retried
+        """
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def transient(self, exception):
+        """
+        Whether an exception is worth a retry
+        """
+        if isinstance(exception, urllib2.HTTPError):
+            return exception.code in self.statuses
+        return isinstance(exception, (socket.error, httplib.HTTPException))
+
+    def delay(self, attempt):
+        """
+        Seconds to wait before the retry after attempt (full jitter)
+        """
+        return random.uniform(0, min(self.max_backoff,
+                self.backoff * 2 ** attempt))
+
+    def count(self):
+        """
+        Count a retry in retries
+        """
+        with self._lock:
+            self.retries += 1
+
+    def call(self, func, safe=True, check=None, rewind=()):
+        """
+        Call func retrying transient errors
+
+        :param func: callable without arguments
+        :param safe: func may be sent again (read only). Else only the
+                     errors before sending the request are retried, or the
+                     others when check finds no earlier result
+        :param check: callable returning the result of a request that may
+                      have been processed by Seur, or None if it was not
+        :param rewind: file-like outputs truncated back to their position
+                       before the first call, before a check or retry.
+                       When one can not seek (a pipe), only the errors
+                       before the response is written are retried
+        :return: func result
+        """
+        positions = [(output, position(output)) for output in rewind]
+        seekable = None not in [p for _, p in positions]
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.attempts or not self.transient(e):
+                    raise
+                if not seekable and not isinstance(e, (ConnectError,
+                            urllib2.HTTPError)):
+                    #Part of the response may be written already
+                    raise
+                for output, start in positions:
+                    if start is not None:
+                        output.seek(start)
+                        output.truncate(start)
+                if not safe and not isinstance(e, ConnectError):
+                    if check is None:
+                        raise
+                    try:
+                        result = check()
+                    except Exception:
+                        raise e
+                    if result is not None:
+                        return result
+                self.count()
+                time.sleep(self.delay(attempt - 1))
+
+
+def position(output):
+    """
+    Position of a file-like output, or None if it can not be rewound
+    """
+    if not hasattr(output, 'seek') or not hasattr(output, 'truncate'):
+        return None
+    try:
+        return output.tell()
+    except (AttributeError, IOError, OSError):
+        return None
+
+
+def _outputs(args, kwargs):
+    return [arg for arg in list(args) + kwargs.values()
+        if hasattr(arg, 'write')]
+
+
+def retried(method):
+    """
+    Decorator of the read only API methods: retry them with the API retry
+    policy
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.retry is None:
+            return method(self, *args, **kwargs)
+        return self.retry.call(lambda: method(self, *args, **kwargs),
+            rewind=_outputs(args, kwargs))
+    return wrapper
+
+
+def idempotent(field, check=None):
+    """
+    Decorator of the API methods that create something in Seur, whose first
+    argument is the data dictionary
+
+    Errors after the request was sent are only retried, within the same
+    call, when the check method finds that Seur did not process the field
+    value (the idempotency key). Calls are never deduplicated across calls:
+    sending the same key again sends it to Seur again.
+
+    :param field: data key of the idempotency key
+    :param check: name of the method called with the same arguments
+                  returning the result of a processed request or None
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, data, *args, **kwargs):
+            retry = self.retry
+            if retry is None:
+                return method(self, data, *args, **kwargs)
+            checker = None
+            if check and data.get(field):
+                checker = lambda: getattr(self, check)(data, *args, **kwargs)
+            return retry.call(lambda: method(self, data, *args, **kwargs),
+                safe=False, check=checker, rewind=_outputs(args, kwargs))
+        return wrapper
+    return decorator
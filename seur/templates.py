@@ -0,0 +1,74 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+import os
+import threading
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'template')
+
+
+class TemplateCache(object):
+    """
+    Compiled Genshi templates shared by API and Picking
+
+    In production mode (default) every template in the directory is compiled
+    once, on first use, and the filesystem is never checked again. With
+    auto_reload templates are loaded by a Genshi TemplateLoader that reloads
+    changed files (development). The SEUR_TEMPLATE_AUTO_RELOAD environment
+    variable enables auto_reload for the default cache.
+    """
+
+    def __init__(self, search_path=TEMPLATE_DIR, auto_reload=False):
+        self.search_path = search_path
+        self.auto_reload = auto_reload
+        self.templates = {}
+        self._loader = None
+        self._lock = threading.Lock()
+
+    @property
+    def loader(self):
+        if self._loader is None:
+            #Genshi is imported on first use, not with the package
+            import genshi.template
+            self._loader = genshi.template.TemplateLoader(self.search_path,
+                auto_reload=self.auto_reload)
+        return self._loader
+
+    def preload(self):
+        """
+        Compile all templates of the directory
+
+        Return dict of template name and compiled template
+        """
+        with self._lock:
+            for name in sorted(os.listdir(self.search_path)):
+                if name.endswith('.xml') and name not in self.templates:
+                    self.templates[name] = self.loader.load(name)
+        return self.templates
+
+    def load(self, name):
+        """
+        Get a compiled template
+
+        :param name: template file name
+        Return genshi.template.MarkupTemplate
+        """
+        if self.auto_reload:
+            return self.loader.load(name)
+        tmpl = self.templates.get(name)
+        if tmpl is None:
+            tmpl = self.preload()[name]
+        return tmpl
+
+    def render(self, name, vals):
+        """
+        Render a template
+
+        :param name: template file name
+        :param vals: dict of template values
+        Return unicode XML
+        """
+        return self.load(name).generate(**vals).render()
+
+loader = TemplateCache(
+    auto_reload=bool(os.environ.get('SEUR_TEMPLATE_AUTO_RELOAD')))
@@ -0,0 +1,59 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Tests against the mock Seur server of bench/mockserver.py
+
+    python -m unittest discover -s seur/tests -t .
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..',
+        'bench'))
+
+from mockserver import MockServer
+from seur.picking import Picking
+from seur.retry import Retry
+from seur.transport import Transport
+
+DATA = {
+    'servicio': '1',
+    'product': '2',
+    'total_bultos': 1,
+    'referencia_expedicion': 'S/TEST/0001',
+    'ref_bulto': 'S/TEST/0001',
+    'cliente_nombre': 'Zikzakmedia SL',
+    'cliente_direccion': 'Sant Jaume, 9. Baixos 2',
+    'cliente_poblacion': 'Vilafranca del Penedes',
+    'cliente_cpostal': '08720',
+    'cliente_pais': 'ES',
+    }
+
+
+class MockServerTestCase(unittest.TestCase):
+    """
+    Mock server, transport and retry policy of each test
+    """
+    read_timeout = 5
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.transport = Transport(limits=False,
+            read_timeout=self.read_timeout, proxies=False)
+        self.retry = Retry(backoff=0.01)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def picking(self, **kwargs):
+        kwargs.setdefault('transport', self.transport)
+        kwargs.setdefault('retry', self.retry)
+        kwargs.setdefault('flights', False)
+        kwargs.setdefault('urls', self.server.urls)
+        return Picking('user', 'password', 'B00000000', '00', 'SEURID',
+            '0000', '00000', **kwargs)
+
+    def requests(self, service='ImprimirECBWebService'):
+        return self.server.requests.get(service, 0)
@@ -0,0 +1,132 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import socket
+import time
+import unittest
+import urllib2
+
+import trollius as asyncio
+
+from seur.aio import AsyncPicking
+from seur.aiotransport import AsyncTransport
+from seur.coalesce import SingleFlight
+from seur.picking import EXISTING
+from seur.tests import DATA, MockServerTestCase
+
+
+class AsyncPickingTest(MockServerTestCase):
+    read_timeout = 0.5
+
+    def setUp(self):
+        super(AsyncPickingTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.async_transport = AsyncTransport(
+            read_timeout=self.read_timeout, proxies=False, loop=self.loop)
+
+    def tearDown(self):
+        self.async_transport.close()
+        self.loop.close()
+        super(AsyncPickingTest, self).tearDown()
+
+    def async_picking(self, **kwargs):
+        kwargs.setdefault('transport', self.async_transport)
+        kwargs.setdefault('retry', self.retry)
+        kwargs.setdefault('flights', False)
+        kwargs.setdefault('urls', self.server.urls)
+        return AsyncPicking('user', 'password', 'B00000000', '00', 'SEURID',
+            '0000', '00000', loop=self.loop, **kwargs)
+
+    def wait(self, *futures):
+        return self.loop.run_until_complete(asyncio.gather(*futures,
+                loop=self.loop))
+
+    def test_requests_in_flight_together(self):
+        self.server.latency = 0.3
+        picking = self.async_picking()
+        start = time.time()
+        results = self.wait(*[picking.create(dict(DATA,
+                        referencia_expedicion='S/TEST/%04d' % i))
+                for i in range(20)])
+        self.assertLess(time.time() - start, 0.3 * 5)
+        self.assertTrue(all(reference and label and not error
+                for reference, label, error in results))
+        self.assertEqual(self.requests(), 20)
+
+    def test_connection_reused(self):
+        picking = self.async_picking()
+        for i in range(3):
+            self.wait(picking.zip('08720'))
+        stats = picking.pool_stats().values()[0]
+        self.assertEqual((stats['created'], stats['reused']), (1, 2))
+
+    def test_stale_connection_sent_again(self):
+        picking = self.async_picking(retry=False)
+        self.wait(picking.create(DATA))
+        self.server.close_connections()
+        (reference, label, error), = self.wait(picking.create(dict(DATA,
+                    referencia_expedicion='S/TEST/0002')))
+        self.assertTrue(reference)
+        self.assertEqual(self.requests(), 2)
+        self.assertEqual(picking.pool_stats().values()[0]['created'], 2)
+
+    def test_timeout(self):
+        picking = self.async_picking(retry=False)
+        self.server.script('ImprimirECBWebService', 1.0)
+        self.assertRaises(socket.timeout, self.wait, picking.create(DATA))
+
+    def test_retry_read_only(self):
+        picking = self.async_picking()
+        self.server.script('WSServiciosWebPublicos', 503, 503)
+        values, = self.wait(picking.zip('08720'))
+        self.assertEqual(values[0]['NOM_POBLACION'], 'VILAFRANCA DEL PENEDES')
+        self.assertEqual(self.requests('WSServiciosWebPublicos'), 3)
+        self.assertEqual(self.retry.retries, 2)
+
+    def test_http_error(self):
+        picking = self.async_picking(retry=False)
+        self.server.script('WSServiciosWebPublicos', 500)
+        with self.assertRaises(urllib2.HTTPError) as cm:
+            self.wait(picking.zip('08720'))
+        self.assertEqual(cm.exception.code, 500)
+
+    def test_lost_create_not_sent_again(self):
+        picking = self.async_picking()
+        self.server.script('ImprimirECBWebService', 'close')
+        result, = self.wait(picking.create(DATA))
+        self.assertEqual(result, (None, None,
+                EXISTING % DATA['referencia_expedicion']))
+        self.assertEqual(self.requests(), 1)
+        self.assertEqual(self.requests('WSConsultaExpediciones'), 1)
+
+    def test_coalesced(self):
+        flights = SingleFlight()
+        picking = self.async_picking(flights=flights)
+        first, second = self.wait(picking.zip('08720'), picking.zip('08720'))
+        self.assertEqual(first, second)
+        self.assertEqual(self.requests('WSServiciosWebPublicos'), 1)
+        self.assertEqual(flights.stats()['shared'], 1)
+
+    def test_list_records(self):
+        picking = self.async_picking()
+        expediciones, = self.wait(picking.list({}, records=True))
+        self.assertEqual(len(expediciones), 20)
+
+    def test_http_proxy(self):
+        host, port = self.server.server_address[:2]
+        transport = AsyncTransport(loop=self.loop,
+            proxies={'http': 'http://user:secret@%s:%s' % (host, port)})
+        urls = dict((service, 'http://seur.invalid/services/%s' % service)
+            for service in self.server.urls)
+        picking = self.async_picking(transport=transport, urls=urls)
+        (reference, label, error), = self.wait(picking.create(DATA))
+        transport.close()
+        self.assertTrue(reference)
+        path, headers = self.server.last_request
+        self.assertEqual(path,
+            'http://seur.invalid/services/ImprimirECBWebService')
+        self.assertEqual(headers['Proxy-Authorization'],
+            'Basic dXNlcjpzZWNyZXQ=')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import unittest
+
+from seur.tests import DATA, MockServerTestCase
+
+
+class APITest(MockServerTestCase):
+
+    def test_set_attributes_replace_account(self):
+        picking = self.picking()
+        account = picking.account
+        picking.username = 'other'
+        picking.ws_username = 'ws'
+        self.assertEqual(picking.account.credentials['username'], 'other')
+        self.assertEqual(picking.account.ws_credentials['username'], 'ws')
+        self.assertEqual(account.username, 'user')
+
+    def test_change_context(self):
+        picking = self.picking()
+        self.assertFalse(picking.context['pdf'])
+        picking.context['pdf'] = True
+        self.assertTrue(picking.account.pdf)
+        self.assertEqual(picking.label_format(), 'pdf')
+        picking.context = {'printer': 'OTHER'}
+        self.assertFalse(picking.account.pdf)
+        self.assertEqual(picking.account.printer, 'OTHER')
+
+    def test_set_urls(self):
+        picking = self.picking(urls={})
+        picking.urls = self.server.urls
+        reference, label, error = picking.create(DATA)
+        self.assertTrue(reference)
+        self.assertEqual(self.requests(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
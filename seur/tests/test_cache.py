@@ -0,0 +1,95 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import shutil
+import tempfile
+import time
+import unittest
+
+from seur.cache import Cache, FileBackend, MemoryBackend
+from seur.tests import MockServerTestCase
+
+SERVICE = 'WSServiciosWebPublicos'
+
+
+class CacheTest(MockServerTestCase):
+
+    def test_values_kept_until_ttl(self):
+        cache = Cache(ttl=0.2)
+        picking = self.picking(cache=cache)
+        values = picking.zip('08720')
+        self.assertEqual(picking.zip('08720'), values)
+        self.assertEqual(self.requests(SERVICE), 1)
+        time.sleep(0.3)
+        self.assertEqual(picking.zip('08720'), values)
+        self.assertEqual(self.requests(SERVICE), 2)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expired']),
+            (1, 2, 1))
+
+    def test_zip_and_city_keys(self):
+        picking = self.picking(cache=Cache())
+        picking.zip('08001')
+        picking.city('barcelona')
+        picking.city('BARCELONA')
+        self.assertEqual(self.requests(SERVICE), 2)
+
+    def test_empty_values_not_kept(self):
+        cache = Cache()
+        picking = self.picking(cache=cache)
+        self.assertEqual(picking.zip('99999'), [])
+        self.assertEqual(picking.zip('99999'), [])
+        self.assertEqual(self.requests(SERVICE), 2)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_empty_values_kept_until_negative_ttl(self):
+        cache = Cache(ttl=60, negative_ttl=0.2)
+        picking = self.picking(cache=cache)
+        self.assertEqual(picking.zip('99999'), [])
+        self.assertEqual(picking.zip('99999'), [])
+        self.assertEqual(self.requests(SERVICE), 1)
+        time.sleep(0.3)
+        self.assertEqual(picking.zip('99999'), [])
+        self.assertEqual(self.requests(SERVICE), 2)
+        picking.zip('08720')
+        time.sleep(0.3)
+        picking.zip('08720')
+        self.assertEqual(self.requests(SERVICE), 3)
+
+
+class BackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_least_recently_used_evicted(self):
+        backend = MemoryBackend(maxsize=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        self.assertEqual((backend.get('a'), backend.get('b'),
+                backend.get('c')), (1, None, 3))
+        self.assertEqual(backend.evictions, 1)
+
+    def test_file_shared_by_caches(self):
+        cache = Cache(FileBackend(self.directory))
+        cache.set('zip:08720', [{'CODIGO_POSTAL': '08720'}])
+        other = Cache(FileBackend(self.directory))
+        self.assertEqual(other.get('zip:08720'),
+            [{'CODIGO_POSTAL': '08720'}])
+        self.assertEqual(other.get(u'city:PLA\xc7A'), None)
+
+    def test_file_least_recently_used_evicted(self):
+        backend = FileBackend(self.directory, maxsize=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.set('c', 3)
+        self.assertEqual(len(backend), 2)
+        self.assertEqual(backend.evictions, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import os
+import shutil
+import tempfile
+import unittest
+
+from seur.cache import Cache
+from seur.catalogue import Catalogue
+from seur.tests import MockServerTestCase
+
+SERVICE = 'WSServiciosWebPublicos'
+
+
+class CatalogueTest(MockServerTestCase):
+
+    def setUp(self):
+        super(CatalogueTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(CatalogueTest, self).tearDown()
+
+    def test_complete_zip_and_city_answered(self):
+        catalogue = Catalogue()
+        picking = self.picking(catalogue=catalogue)
+        values = picking.zip('08720')
+        self.assertEqual(picking.zip(' 08720 '), values)
+        picking.city(u'Vilafranca del Pened\xe8s')
+        self.assertEqual(self.requests(SERVICE), 2)
+        self.assertEqual(picking.city('vilafranca  del penedes'), values)
+        self.assertEqual(self.requests(SERVICE), 2)
+
+    def test_zip_of_city_not_answered(self):
+        catalogue = Catalogue()
+        picking = self.picking(catalogue=catalogue)
+        picking.city('BARCELONA')
+        self.assertEqual(catalogue.zip('08001'), None)
+        picking.zip('08001')
+        self.assertEqual(self.requests(SERVICE), 2)
+
+    def test_saved_and_loaded(self):
+        path = os.path.join(self.directory, 'catalogue.json.gz')
+        catalogue = Catalogue(path)
+        catalogue.update(self.picking(), zips=['08720'], cities=['MADRID'])
+        catalogue.save()
+        picking = self.picking(catalogue=Catalogue(path))
+        self.assertEqual(picking.zip('08720')[0]['NOM_POBLACION'],
+            'VILAFRANCA DEL PENEDES')
+        self.assertEqual(picking.city('Madrid')[0]['CODIGO_POSTAL'],
+            '28001')
+        self.assertEqual(self.requests(SERVICE), 2)
+        self.assertEqual([v['NOM_POBLACION']
+                for v in Catalogue(path).city_prefix('mad')], ['MADRID'])
+
+    def test_unknown_zip_from_cache(self):
+        catalogue = Catalogue()
+        cache = Cache(negative_ttl=60)
+        picking = self.picking(catalogue=catalogue, cache=cache)
+        self.assertEqual(picking.zip('99999'), [])
+        self.assertEqual(picking.zip('99999'), [])
+        self.assertEqual(self.requests(SERVICE), 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
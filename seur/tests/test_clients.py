@@ -0,0 +1,117 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import threading
+import time
+import unittest
+import urllib2
+
+from seur.account import Account
+from seur.clients import ClientManager
+from seur.tests import DATA, MockServerTestCase
+
+
+class ClientManagerTest(MockServerTestCase):
+
+    def setUp(self):
+        super(ClientManagerTest, self).setUp()
+        self.done = []
+        self._lock = threading.Lock()
+
+    def manager(self, **kwargs):
+        kwargs.setdefault('retry', self.retry)
+        kwargs.setdefault('flights', False)
+        return ClientManager(**kwargs)
+
+    def account(self, ccc):
+        return Account('user', 'password', 'B00000000', '00', 'SEURID',
+            '0000', ccc, urls=self.server.urls)
+
+    def submit(self, manager, name, count):
+        tasks = []
+        for i in range(count):
+            task = manager.submit(name, 'create', dict(DATA,
+                    referencia_expedicion='S/%s/%04d' % (name, i)))
+            task.add_done_callback(lambda task, name=name: self.finished(
+                    name))
+            tasks.append(task)
+        return tasks
+
+    def finished(self, name):
+        with self._lock:
+            self.done.append(name)
+
+    def test_small_account_not_behind_wave(self):
+        self.server.latency = 0.05
+        with self.manager(max_workers=1) as manager:
+            manager.add('wave', self.account('00001'))
+            manager.add('small', self.account('00002'))
+            tasks = self.submit(manager, 'wave', 10)
+            tasks += self.submit(manager, 'small', 2)
+            for task in tasks:
+                task.result(timeout=5)
+        self.assertEqual(len(self.done), 12)
+        self.assertEqual([i for i, name in enumerate(self.done)
+                if name == 'small'], [1, 3])
+
+    def test_share_by_weight(self):
+        self.server.latency = 0.02
+        with self.manager(max_workers=1) as manager:
+            manager.add('heavy', self.account('00001'), weight=3)
+            manager.add('light', self.account('00002'))
+            manager.submit('light', 'test_connection').result(timeout=5)
+            del self.done[:]
+            tasks = self.submit(manager, 'light', 8)
+            tasks += self.submit(manager, 'heavy', 8)
+            for task in tasks:
+                task.result(timeout=5)
+        self.assertGreaterEqual(self.done[:8].count('heavy'), 5)
+
+    def test_concurrency_by_account(self):
+        with self.manager(max_workers=4) as manager:
+            manager.add('serial', self.account('00001'), concurrency=1)
+            manager.add('parallel', self.account('00002'))
+            manager.submit('serial', 'create', DATA).result(timeout=5)
+            self.server.latency = 0.2
+            start = time.time()
+            parallel = self.submit(manager, 'parallel', 3)
+            serial = self.submit(manager, 'serial', 3)
+            for task in parallel:
+                task.result(timeout=5)
+            self.assertLess(time.time() - start, 0.4)
+            for task in serial:
+                task.result(timeout=5)
+            self.assertGreaterEqual(time.time() - start, 0.6)
+
+    def test_stats_by_account(self):
+        with self.manager(max_workers=2, retry=False) as manager:
+            manager.add('first', self.account('00001'))
+            manager.add('second', self.account('00002'))
+            for task in self.submit(manager, 'first', 3):
+                task.result(timeout=5)
+            self.server.script('ImprimirECBWebService', 500)
+            task, = self.submit(manager, 'second', 1)
+            self.assertRaises(urllib2.HTTPError, task.result, 5)
+            manager['second'].zip('08720')
+            manager['second'].zip('08720')
+            stats = manager.stats()
+        first, second = stats['first'], stats['second']
+        self.assertEqual((first['completed'], first['errors']), (3, 0))
+        self.assertEqual((second['completed'], second['errors']), (1, 1))
+        self.assertEqual(first['operations']['create']['count'], 3)
+        self.assertEqual(second['operations']['create']['errors'], 1)
+        self.assertEqual(first['pools'].values()[0]['requests'], 3)
+        self.assertEqual(second['cache']['hits'], 1)
+        self.assertEqual(first['cache']['hits'], 0)
+
+    def test_map_indexes(self):
+        with self.manager(max_workers=2) as manager:
+            manager.add('acme', self.account('00001'))
+            results = sorted(manager.map('acme', 'zip',
+                    ['08720', '08400', '99999']))
+        self.assertEqual([(index, len(values), error)
+                for index, values, error in results],
+            [(0, 1, None), (1, 1, None), (2, 0, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
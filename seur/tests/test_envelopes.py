@@ -0,0 +1,104 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Parity of the compiled envelopes (seur.envelopes) with the Genshi rendering
+of the same templates. bench/envelopes.py compares their speed.
+"""
+import os
+import re
+import unittest
+
+from seur.account import Vals
+from seur.envelopes import TEMPLATES, EnvelopeBuilder
+from seur.templates import TEMPLATE_DIR, TemplateCache
+
+#Values of seur.account.Account.credentials, also rendered bound
+CREDENTIALS = ('username', 'password', 'vat', 'franchise', 'seurid', 'ci',
+    'ccc')
+
+VALUES = (
+    'X',
+    '',
+    None,
+    0,
+    12.5,
+    True,
+    u'Pla\xe7a Catalunya, 1 - 2\xaa',
+    '<b>Tom & "Jerry"</b> \'s',
+    ']]> &amp; &#34;',
+    u'\u20ac \t\n  ',
+    )
+
+
+def template_names(name):
+    """
+    Values and bulto fields of a template
+
+    :return: sorted list of names, sorted list of fields
+    """
+    with open(os.path.join(TEMPLATE_DIR, name)) as f:
+        source = f.read()
+    names = set(re.findall(r'\$\{(\w+)\}', source)) - set(['bultos'])
+    fields = set(re.findall(r'\$\{bulto\.(\w+)\}', source))
+    return sorted(names), sorted(fields)
+
+
+def cases(name):
+    """
+    Values of each template: every value in all fields, every value in one
+    field and 0 to 5 bultos
+    """
+    names, fields = template_names(name)
+    for value in VALUES:
+        vals = dict((n, value) for n in names)
+        if fields:
+            for count in range(6):
+                vals['bultos'] = [dict((f, value) for f in fields)
+                    for i in range(count)]
+                yield dict(vals)
+        else:
+            yield vals
+        for n in names:
+            vals = dict((m, 'v_%s' % m) for m in names)
+            vals[n] = value
+            if fields:
+                vals['bultos'] = [dict((f, '%s_%s' % (f, i)) for f in fields)
+                    for i in range(3)]
+            yield vals
+        for f in fields:
+            vals = dict((m, 'v_%s' % m) for m in names)
+            vals['bultos'] = [dict((g, '%s_%s' % (g, i)) for g in fields)
+                for i in range(4)]
+            vals['bultos'][2][f] = value
+            yield vals
+
+
+def differences(genshi, builder, name):
+    """
+    Cases of a template whose envelope differs from the Genshi output
+
+    :return: iterator of (vals, expected, result)
+    """
+    for vals in cases(name):
+        expected = genshi.render(name, vals)
+        fixed = Vals((n, vals[n]) for n in CREDENTIALS if n in vals)
+        for result in (builder.render(name, vals),
+                builder.render(name, vals, fixed=fixed)):
+            if result != expected:
+                yield vals, expected, result
+
+
+class EnvelopesTest(unittest.TestCase):
+
+    def test_parity(self):
+        genshi = TemplateCache()
+        builder = EnvelopeBuilder(loader=genshi)
+        for name in TEMPLATES:
+            for vals, expected, result in differences(genshi, builder,
+                    name):
+                self.fail('%s differs with %r\n%r\n%r' % (name, vals,
+                        expected, result))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+"""
+Import time of the seur package and modules, each measured in a new
+interpreter (best of RUNS), against their targets. bench/imports.py prints
+them.
+"""
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+RUNS = 5
+
+#Statement, target milliseconds and modules that must not be imported
+CASES = (
+    ('import seur', 10, ('genshi', 'seur.api', 'urllib2', 'xml.dom')),
+    ('from seur import Picking', 80, ('genshi',)),
+    ('import seur.outbox', 80, ('genshi', 'seur.picking')),
+    ('import seur.labels', 20, ('genshi', 'seur.api')),
+    )
+
+PROGRAM = """
+import json, sys, time
+start = time.time()
+%s
+elapsed = time.time() - start
+print json.dumps([elapsed * 1000, sorted(sys.modules)])
+"""
+
+
+def measure(statement):
+    """
+    Milliseconds of statement in a new interpreter and modules imported
+    """
+    output = subprocess.check_output([sys.executable, '-c',
+            PROGRAM % statement], cwd=ROOT)
+    return json.loads(output)
+
+
+def imports(statement, forbidden, runs=RUNS):
+    """
+    Best milliseconds of statement of runs and the forbidden modules it
+    imports
+    """
+    results = [measure(statement) for i in range(runs)]
+    best = min(elapsed for elapsed, _ in results)
+    modules = results[0][1]
+    loaded = [name for name in forbidden
+        if any(m == name or m.startswith(name + '.') for m in modules)]
+    return best, loaded
+
+
+class ImportsTest(unittest.TestCase):
+
+    def test_import_time(self):
+        for statement, target, forbidden in CASES:
+            best, loaded = imports(statement, forbidden)
+            self.assertEqual(loaded, [], '%s imports %s' % (statement,
+                    ', '.join(loaded)))
+            self.assertLessEqual(best, target, '%s takes %.1f ms' % (
+                    statement, best))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import base64
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from seur.labels import FileLabels, LabelStore, digest
+from seur.picking import Picking
+from seur.tests import DATA, MockServerTestCase
+
+
+class LabelStoreTest(MockServerTestCase):
+
+    def test_store_shared_by_accounts(self):
+        labels = LabelStore()
+        picking = self.picking(context={'pdf': True}, labels=labels)
+        other = Picking('other', 'password', 'B00000000', '00', 'SEURID',
+            '0000', '00001', context={'pdf': True}, labels=labels,
+            transport=self.transport, retry=self.retry, flights=False,
+            urls=self.server.urls)
+        label = picking.label(DATA)
+        self.assertEqual(base64.b64decode(picking.label(DATA)),
+            base64.b64decode(label))
+        self.assertEqual(self.requests(), 1)
+        other.label(DATA)
+        self.assertEqual(self.requests(), 2)
+        self.assertEqual(labels.stats()['size'], 2)
+
+
+class FileLabelsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_evicted_references_removed(self):
+        labels = FileLabels(self.directory, maxbytes=250)
+        labels.set('first', 'A' * 100)
+        labels.set('first copy', 'A' * 100)
+        old = time.time() - 60
+        os.utime(labels.blob(digest('A' * 100)), (old, old))
+        labels.set('second', 'B' * 100)
+        labels.set('third', 'C' * 100)
+        self.assertEqual(labels.evictions, 1)
+        self.assertEqual(len(labels), 2)
+        self.assertEqual(labels.get('first'), None)
+        self.assertEqual(labels.get('third'), 'C' * 100)
+
+if __name__ == '__main__':
+    unittest.main()
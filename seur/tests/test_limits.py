@@ -0,0 +1,40 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import unittest
+
+from seur.limits import AdaptiveLimiter, Limits
+
+URL = 'https://cit.seur.com/CIT-war/ImprimirECBWebService'
+
+
+class LimitsTest(unittest.TestCase):
+
+    def test_adaptive_opt_in(self):
+        limiter = Limits().get(URL)
+        limiter.acquire()
+        limiter.release(0.1, service=URL)
+        stats = limiter.stats()
+        self.assertEqual((stats['limit'], stats['requests']), (None, 1))
+        limiter = Limits(adaptive=True).get(URL)
+        self.assertEqual(limiter.stats()['limit'], 16)
+
+    def test_baseline_by_service(self):
+        limiter = AdaptiveLimiter(limit=4)
+        for i in range(100):
+            for service, latency in (('create', 0.05), ('label', 0.4),
+                    ('manifiesto', 1.0)):
+                limiter.acquire()
+                limiter.release(latency, service=service)
+        self.assertGreater(limiter.limit, 4)
+        self.assertEqual(limiter.baselines['manifiesto'], 1.0)
+
+    def test_latency_growth_shrinks(self):
+        limiter = AdaptiveLimiter(limit=8)
+        for latency in [0.05] * 10 + [0.5] * 100:
+            limiter.acquire()
+            limiter.release(latency, service='create')
+        self.assertLess(limiter.limit, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
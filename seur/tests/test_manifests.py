@@ -0,0 +1,38 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import datetime
+import shutil
+import tempfile
+import unittest
+
+from seur.manifests import ManifestService, ManifestStore
+from seur.tests import MockServerTestCase
+
+
+class ManifestStoreTest(MockServerTestCase):
+
+    def setUp(self):
+        super(ManifestStoreTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = ManifestStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ManifestStoreTest, self).tearDown()
+
+    def test_manifest_by_account(self):
+        date = datetime.date.today() - datetime.timedelta(days=1)
+        picking = self.picking()
+        other = self.picking()
+        other.ccc = '11111'
+        filename = ManifestService(picking, self.store).get(date)
+        other_filename = ManifestService(other, self.store).get(date)
+        self.assertNotEqual(filename, other_filename)
+        self.assertEqual(self.requests('DetalleBultoPDFWebService'), 2)
+        self.assertEqual(ManifestService(picking, self.store).get(date),
+            filename)
+        self.assertEqual(self.requests('DetalleBultoPDFWebService'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from seur.outbox import DONE, FAILED, PENDING, RUNNING, Outbox, Worker
+from seur.retry import Retry
+from seur.tests import DATA, MockServerTestCase
+
+
+class OutboxTest(MockServerTestCase):
+
+    def setUp(self):
+        super(OutboxTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.outbox = Outbox(os.path.join(self.directory, 'outbox.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(OutboxTest, self).tearDown()
+
+    def test_lease_renewed_while_sending(self):
+        job_id = self.outbox.put('create', DATA)
+        self.server.script('ImprimirECBWebService', 1.5)
+        worker = Worker(self.outbox, self.picking(), lease=0.6)
+        thread = threading.Thread(target=worker.work, args=(True,))
+        thread.start()
+        time.sleep(1.0)
+        self.assertEqual(self.outbox.claim('other', lease=0.6), [])
+        thread.join()
+        job = self.outbox.get(job_id)
+        self.assertEqual(job['state'], DONE)
+        self.assertEqual(job['attempts'], 1)
+        self.assertEqual(self.requests(), 1)
+
+    def test_only_owner_saves_result(self):
+        job_id = self.outbox.put('create', DATA)
+        self.outbox.claim('dead', lease=-1)
+        self.outbox.claim('alive')
+        self.assertFalse(self.outbox.renew(job_id, 'dead'))
+        self.assertFalse(self.outbox.complete(job_id, 'LOST', worker='dead'))
+        self.assertFalse(self.outbox.fail(job_id, 'lost', worker='dead'))
+        job = self.outbox.get(job_id)
+        self.assertEqual((job['state'], job['worker']), (RUNNING, 'alive'))
+        self.assertTrue(self.outbox.complete(job_id, 'SAVED',
+                worker='alive'))
+        self.assertEqual(self.outbox.get(job_id)['reference'], 'SAVED')
+
+    def test_retry_waits_backoff(self):
+        job_id = self.outbox.put('create', DATA)
+        self.outbox.claim('worker')
+        self.outbox.fail(job_id, 'error', retry=True, delay=60,
+            worker='worker')
+        self.assertEqual(self.outbox.get(job_id)['state'], PENDING)
+        self.assertEqual(self.outbox.claim('worker'), [])
+        self.outbox.connection().execute(
+            'UPDATE jobs SET not_before = ? WHERE id = ?',
+            (time.time() - 1, job_id))
+        job, = self.outbox.claim('worker')
+        self.assertEqual(job['attempts'], 2)
+
+    def test_worker_backoff_on_transient_error(self):
+        data = {'num_referencia': 'S/TEST/0001'}
+        job_id = self.outbox.put('pickup_service', data)
+        self.server.script('WSCrearRecogida', 503, 503, 503)
+        picking = self.picking(ws_username='ws', ws_password='ws')
+        worker = Worker(self.outbox, picking, retry=Retry(backoff=30))
+        worker.run(once=True)
+        job = self.outbox.get(job_id)
+        self.assertEqual((job['state'], job['attempts']), (PENDING, 1))
+        self.assertEqual(self.outbox.claim('worker'), [])
+
+    def test_failed_job_put_again(self):
+        job_id = self.outbox.put('create', DATA)
+        self.outbox.claim('worker')
+        self.outbox.fail(job_id, 'error', worker='worker')
+        self.assertEqual(self.outbox.get(job_id)['state'], FAILED)
+        data = dict(DATA, cliente_telefono='938902108')
+        self.assertEqual(self.outbox.put('create', data), job_id)
+        job = self.outbox.get(job_id)
+        self.assertEqual((job['state'], job['attempts'], job['error']),
+            (PENDING, 0, None))
+        self.assertEqual(job['data'], data)
+        Worker(self.outbox, self.picking()).run(once=True)
+        self.assertEqual(self.outbox.get(job_id)['state'], DONE)
+        self.assertEqual(self.outbox.put('create', DATA), job_id)
+        self.assertEqual(self.outbox.get(job_id)['state'], DONE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from seur.parser import Base64Writer, ResponseParser, parse, parse_to
+from seur.tests import DATA, MockServerTestCase
+
+RESPONSE = ('<?xml version="1.0" encoding="UTF-8"?>'
+    '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+    '<soap:Body><ns1:response xmlns:ns1="http://eCatalogoWS"><ns1:out>'
+    '<ECB xmlns="http://dto.servicios.ecb.seur"><string>A001</string>'
+    '<string>A002</string></ECB><mensaje>OK &amp; Pla\xc3\xa7a</mensaje>'
+    '<PDF>%s</PDF></ns1:out></ns1:response></soap:Body></soap:Envelope>')
+
+
+class ChunkedResponse(StringIO):
+    """
+    Response returning at most size bytes by read
+    """
+
+    def __init__(self, data, size):
+        StringIO.__init__(self, data)
+        self.size = size
+
+    def read(self, size=-1):
+        return StringIO.read(self, self.size)
+
+
+class ResponseParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pdf = os.urandom(5000)
+        self.response = RESPONSE % base64.encodestring(self.pdf)
+
+    def test_chunks_parsed_as_whole(self):
+        for size in (1, 7, len(self.response)):
+            result = parse(ChunkedResponse(self.response, size),
+                streams=('PDF',))
+            self.assertEqual(result.texts('ECB'), [u'A001', u'A002'])
+            self.assertEqual(result.text('mensaje'), u'OK & Pla\xe7a')
+            self.assertEqual(base64.decodestring(result.stream('PDF').read()),
+                self.pdf)
+            self.assertEqual(result.text('traza'), None)
+
+    def test_text_of_innermost_tag(self):
+        result = parse(StringIO(self.response))
+        self.assertEqual(result.text('out'), u'')
+        self.assertEqual(base64.decodestring(result.text('PDF')), self.pdf)
+
+    def test_tag_written_to_output(self):
+        output = StringIO()
+        result = parse_to(ChunkedResponse(self.response, 333), 'PDF', output)
+        self.assertEqual(output.getvalue(), self.pdf)
+        self.assertEqual(result.texts('ECB'), [u'A001', u'A002'])
+        output = StringIO()
+        ResponseParser(outputs={'mensaje': output}).parse(
+            StringIO(self.response))
+        self.assertEqual(output.getvalue(), 'OK & Pla\xc3\xa7a')
+
+
+class Base64WriterTest(unittest.TestCase):
+
+    def test_decoded_by_chunks(self):
+        for length in (0, 1, 2, 3, 1000):
+            data = os.urandom(length)
+            encoded = base64.encodestring(data)
+            for size in (1, 3, 5, 76, len(encoded) or 1):
+                output = StringIO()
+                writer = Base64Writer(output)
+                for i in range(0, len(encoded), size):
+                    writer.write(encoded[i:i + size])
+                writer.flush()
+                self.assertEqual(output.getvalue(), data)
+                self.assertEqual(writer.size, length)
+
+    def test_missing_padding(self):
+        output = StringIO()
+        writer = Base64Writer(output)
+        writer.write(base64.b64encode('seur').rstrip('='))
+        writer.flush()
+        self.assertEqual(output.getvalue(), 'seur')
+
+
+class LabelOutputTest(MockServerTestCase):
+
+    def setUp(self):
+        super(LabelOutputTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.pdf = base64.decodestring(self.server.pdf)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(LabelOutputTest, self).tearDown()
+
+    def test_label_written_to_file(self):
+        picking = self.picking(context={'pdf': True})
+        path = os.path.join(self.directory, 'label.pdf')
+        self.assertEqual(picking.label(DATA, output=path), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.pdf)
+        output = StringIO()
+        reference, label, error = picking.create(DATA, output=output)
+        self.assertTrue(reference)
+        self.assertEqual(label, output)
+        self.assertEqual(output.getvalue(), self.pdf)
+
+    def test_manifiesto_written_to_file(self):
+        picking = self.picking()
+        output = StringIO()
+        self.assertEqual(picking.manifiesto({}, output=output), output)
+        self.assertEqual(output.getvalue(), self.pdf)
+        self.assertEqual(base64.decodestring(picking.manifiesto({})),
+            self.pdf)
+
+
+if __name__ == '__main__':
+    unittest.main()
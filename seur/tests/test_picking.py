@@ -0,0 +1,109 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import random
+import time
+import unittest
+import urllib2
+
+from seur.picking import Picking, bultos, kilos
+from seur.tests import DATA, MockServerTestCase
+
+SERVICE = 'WSCrearRecogida'
+
+
+def pickup(zip, day=20):
+    return {
+        'nif_origen': 'B00000000',
+        'cp_origen': zip,
+        'calle_origen': 'Sant Jaume',
+        'num_origen': '9',
+        'dia_recogida': day,
+        'mes_recogida': 10,
+        'anyo_recogida': 2026,
+        }
+
+
+class EchoPicking(Picking):
+    """
+    Picking whose pickups, sent in random order, return their origin zip
+    with the result
+    """
+    __slots__ = ()
+
+    def pickup_service(self, data):
+        time.sleep(random.uniform(0, 0.05))
+        return data['cp_origen'], super(EchoPicking, self).pickup_service(
+            data)
+
+
+class PickingTest(MockServerTestCase):
+
+    def test_total_bultos_reference_string(self):
+        picking = self.picking(context={'pdf': True})
+        reference, label, error = picking.create(dict(DATA, total_bultos=2))
+        self.assertIsInstance(reference, basestring)
+        self.assertEqual(error, None)
+
+    def test_bultos_reference_list(self):
+        picking = self.picking(context={'pdf': True})
+        data = dict(DATA, bultos=[{'peso_bulto': '2,5'}, {'peso_bulto': '4'}])
+        reference, label, error = picking.create(data)
+        self.assertEqual(len(reference), 2)
+
+    def test_kilos_decimal_comma(self):
+        data = {'bultos': [{'peso_bulto': '2,5'}, {'peso_bulto': '4'}]}
+        self.assertEqual(kilos(data, bultos(data)), '6.5')
+        data = {'bultos': [{'peso_bulto': 'heavy'}]}
+        self.assertEqual(kilos(data, bultos(data)), '1')
+        self.assertEqual(kilos({'total_kilos': '3,2'}, []), '3,2')
+
+
+class PickupManyTest(MockServerTestCase):
+
+    def test_results_in_order_of_datas(self):
+        picking = EchoPicking('user', 'password', 'B00000000', '00',
+            'SEURID', '0000', '00000', ws_username='ws', ws_password='ws',
+            transport=self.transport, retry=self.retry, flights=False,
+            urls=self.server.urls)
+        zips = ['%05d' % i for i in range(12)]
+        results = picking.pickup_service_many([pickup(z) for z in zips],
+            max_workers=4)
+        self.assertEqual([zip for zip, result in results], zips)
+        self.assertEqual(self.requests(SERVICE), 12)
+
+    def test_same_origin_and_date_booked_once(self):
+        picking = self.picking(ws_username='ws', ws_password='ws')
+        datas = [pickup('08720'), pickup('08400'), pickup('08720'),
+            pickup('08720', day=21), pickup('08400')]
+        results = picking.pickup_service_many(datas)
+        self.assertEqual(self.requests(SERVICE), 3)
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[1], results[4])
+        self.assertEqual(len(set(r[0] for r in results)), 3)
+        self.assertTrue(all(r[0] and r[4] is False for r in results))
+
+    def test_error_does_not_stop_others(self):
+        picking = self.picking(ws_username='ws', ws_password='ws',
+            retry=False)
+        self.server.script(SERVICE, 500)
+        datas = [pickup('%05d' % i) for i in range(4)]
+        results = picking.pickup_service_many(datas + datas[:1])
+        errors = [r for r in results[:4] if r[4] is not False]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][:4], (False, False, False, False))
+        self.assertTrue(isinstance(errors[0][4], urllib2.HTTPError))
+        self.assertEqual(results[4], results[0])
+        self.assertEqual(self.requests(SERVICE), 4)
+
+    def test_cancel_repeated_once(self):
+        picking = self.picking(ws_username='ws', ws_password='ws')
+        results = picking.cancel_pickup_many([('1', 'L1'), ('2', 'L2'),
+                ('1', 'L1')])
+        self.assertEqual(self.requests(SERVICE), 2)
+        self.assertEqual([error for info, error in results],
+            [False, False, False])
+        self.assertEqual(results[2], results[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import multiprocessing
+import os
+import unittest
+
+from seur.pipeline import LabelPipeline
+
+
+def crash(value):
+    if value == 'crash':
+        os._exit(1)
+    return value
+
+
+class LabelPipelineTest(unittest.TestCase):
+
+    def test_failed_decode_returned(self):
+        error = ValueError('Invalid label')
+        decoded = [
+            (1, ['^XA1^XZ'], None),
+            (2, None, error),
+            (3, ['^XA3^XZ'], None),
+            ]
+        with LabelPipeline(processes=1) as pipeline:
+            batches = list(pipeline.batches(decoded, station=lambda key: 'A',
+                    pdf=False))
+        self.assertEqual(len(batches), 2)
+        self.assertIn(('A', [2], None, error), batches)
+        merged, = [b for b in batches if b[3] is None]
+        self.assertEqual(merged[1], [1, 3])
+        self.assertEqual(merged[2], '^XA1^XZ^XA3^XZ')
+
+    def test_crashed_worker_times_out(self):
+        pipeline = LabelPipeline(processes=1, timeout=2)
+        self.assertIsNotNone(pipeline.pool)
+        with pipeline:
+            results = sorted(pipeline.map(crash,
+                    [(1, ('one',)), (2, ('crash',)), (3, ('three',))]))
+        self.assertEqual(results[0], (1, 'one', None))
+        key, value, exception = results[1]
+        self.assertEqual((key, value), (2, None))
+        self.assertIsInstance(exception, multiprocessing.TimeoutError)
+        self.assertEqual(results[2], (3, 'three', None))
+        self.assertRaises(ValueError, list,
+            pipeline.map(crash, [(1, ('one',))]))
+
+
+if __name__ == '__main__':
+    unittest.main()
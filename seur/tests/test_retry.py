@@ -0,0 +1,62 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from StringIO import StringIO
+import os
+import threading
+import unittest
+
+from seur.picking import EXISTING
+from seur.tests import DATA, MockServerTestCase
+
+
+class RetryTest(MockServerTestCase):
+
+    def test_rewind_keeps_previous_content(self):
+        picking = self.picking()
+        output = StringIO()
+        output.write('PREVIOUS-LABEL')
+        self.server.script('DetalleBultoPDFWebService', 503)
+        picking.manifiesto({'date': '2026-10-18'}, output=output)
+        self.assertEqual(self.requests('DetalleBultoPDFWebService'), 2)
+        value = output.getvalue()
+        self.assertTrue(value.startswith('PREVIOUS-LABEL'))
+        self.assertEqual(len(value), len('PREVIOUS-LABEL')
+            + self.server.payload_size)
+
+    def test_pipe_output_not_rewound(self):
+        picking = self.picking(context={'pdf': True})
+        self.server.script('ImprimirECBWebService', 503)
+        read, write = os.pipe()
+        received = []
+        reader = threading.Thread(target=lambda: received.append(
+                os.fdopen(read, 'rb').read()))
+        reader.start()
+        output = os.fdopen(write, 'wb')
+        self.assertIs(picking.label(DATA, output=output), output)
+        output.close()
+        reader.join()
+        self.assertEqual(len(received[0]), self.server.payload_size)
+        self.assertEqual(self.requests(), 2)
+
+    def test_create_sent_again_by_each_call(self):
+        picking = self.picking(context={'pdf': True})
+        first = picking.create(DATA)
+        second = picking.create(DATA)
+        self.assertTrue(first[0] and second[0])
+        self.assertNotEqual(first[0], second[0])
+        self.assertEqual(self.requests(), 2)
+
+    def test_lost_create_not_sent_again(self):
+        picking = self.picking(context={'pdf': True})
+        self.server.script('ImprimirECBWebService', 'close')
+        output = StringIO()
+        result = picking.create(DATA, output=output)
+        self.assertEqual(result, (None, None,
+                EXISTING % DATA['referencia_expedicion']))
+        self.assertEqual(output.getvalue(), '')
+        #Only the lost create: no label nor second create
+        self.assertEqual(self.requests(), 1)
+        self.assertEqual(self.requests('WSConsultaExpediciones'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import urllib2
+
+from seur.tests import MockServerTestCase
+from seur.tracking import TrackingStore, TrackingSync, windows
+
+SERVICE = 'WSConsultaExpediciones'
+DATE = datetime.date(2026, 10, 1)
+
+
+class TrackingSyncTest(MockServerTestCase):
+
+    def setUp(self):
+        super(TrackingSyncTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tracking.json.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TrackingSyncTest, self).tearDown()
+
+    def sync(self, store, **kwargs):
+        kwargs.setdefault('max_workers', 1)
+        sync = TrackingSync(self.picking(retry=False), store, **kwargs)
+        return sync, sync.sync(DATE, date_from=DATE)
+
+    def test_unchanged_references_skipped(self):
+        store = TrackingStore(self.path)
+        sync, results = self.sync(store)
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(info.reference == reference and error is None
+                for reference, record, info, error in results))
+        self.assertEqual(self.requests(SERVICE), 21)
+        sync, results = self.sync(TrackingStore(self.path))
+        self.assertEqual(results, [])
+        self.assertEqual(sync.stats, {'list': 1, 'listed': 20, 'info': 0,
+                'errors': 0})
+        self.assertEqual(self.requests(SERVICE), 22)
+
+    def test_changed_reference_sent(self):
+        store = TrackingStore()
+        self.sync(store)
+        reference = sorted(store.fingerprints)[3]
+        store.fingerprints[reference][0] = 'status before'
+        sync, results = self.sync(store)
+        self.assertEqual([r[0] for r in results], [reference])
+        sync, results = self.sync(store)
+        self.assertEqual(results, [])
+
+    def test_failed_info_sent_next_sync(self):
+        store = TrackingStore()
+        self.server.script(SERVICE, 0.0, 500)
+        sync, results = self.sync(store)
+        errors = [(reference, error) for reference, record, info, error
+            in results if error is not None]
+        self.assertEqual(len(errors), 1)
+        reference, error = errors[0]
+        self.assertTrue(isinstance(error, urllib2.HTTPError))
+        self.assertEqual(len(store), 19)
+        sync, results = self.sync(store)
+        self.assertEqual([(r[0], r[3]) for r in results], [(reference, None)])
+
+    def test_lookback_from_high_water(self):
+        store = TrackingStore()
+        store.high_water = DATE
+        sync = TrackingSync(self.picking(), store, days=7, lookback=14)
+        sync.sync(DATE + datetime.timedelta(days=2))
+        self.assertEqual(sync.stats['list'], 3)
+        self.assertEqual(store.high_water, DATE + datetime.timedelta(days=2))
+
+    def test_windows(self):
+        self.assertEqual(list(windows(DATE, DATE + datetime.timedelta(
+                        days=9), days=7)), [
+                (DATE, DATE + datetime.timedelta(days=6)),
+                (DATE + datetime.timedelta(days=7),
+                    DATE + datetime.timedelta(days=9)),
+                ])
+
+
+if __name__ == '__main__':
+    unittest.main()
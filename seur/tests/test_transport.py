@@ -0,0 +1,107 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import os
+import socket
+import threading
+import time
+import unittest
+
+from seur.tests import DATA, MockServerTestCase
+from seur.transport import Transport
+
+
+class TransportTest(MockServerTestCase):
+    read_timeout = 0.5
+
+    def test_connection_reused(self):
+        picking = self.picking()
+        for i in range(3):
+            picking.zip('08720')
+        stats = self.transport.stats().values()[0]
+        self.assertEqual((stats['created'], stats['reused'], stats['idle']),
+            (1, 2, 1))
+
+    def test_idle_connections_kept_by_maxsize(self):
+        transport = Transport(maxsize=2, limits=False, proxies=False)
+        picking = self.picking(transport=transport)
+        self.server.latency = 0.2
+        threads = [threading.Thread(target=picking.zip, args=('08720',))
+            for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = transport.stats().values()[0]
+        transport.close()
+        self.assertEqual((stats['created'], stats['discarded'],
+                stats['idle']), (4, 2, 2))
+
+    def test_expired_connection_discarded(self):
+        transport = Transport(idle_timeout=0.1, limits=False, proxies=False)
+        picking = self.picking(transport=transport)
+        picking.zip('08720')
+        time.sleep(0.2)
+        picking.zip('08720')
+        stats = transport.stats().values()[0]
+        transport.close()
+        self.assertEqual((stats['created'], stats['reused'],
+                stats['discarded']), (2, 0, 1))
+
+    def test_stale_connection_sent_again(self):
+        picking = self.picking(retry=False)
+        picking.create(DATA)
+        self.server.close_connections()
+        reference, label, error = picking.create(dict(DATA,
+                referencia_expedicion='S/TEST/0002'))
+        self.assertTrue(reference)
+        self.assertEqual(self.requests(), 2)
+        stats = self.transport.stats().values()[0]
+        self.assertEqual(stats['created'], 2)
+
+    def test_timeout_not_sent_again(self):
+        picking = self.picking(retry=False)
+        picking.create(DATA)
+        self.server.script('ImprimirECBWebService', 1.0)
+        self.assertRaises(socket.timeout, picking.create, dict(DATA,
+                referencia_expedicion='S/TEST/0002'))
+        self.assertEqual(self.requests(), 2)
+
+    def test_http_proxy(self):
+        host, port = self.server.server_address[:2]
+        transport = Transport(limits=False,
+            proxies={'http': 'http://user:secret@%s:%s' % (host, port)})
+        urls = dict((service, 'http://seur.invalid/services/%s' % service)
+            for service in self.server.urls)
+        picking = self.picking(transport=transport, urls=urls)
+        reference, label, error = picking.create(DATA)
+        transport.close()
+        self.assertTrue(reference)
+        path, headers = self.server.last_request
+        self.assertEqual(path,
+            'http://seur.invalid/services/ImprimirECBWebService')
+        self.assertEqual(headers['Proxy-Authorization'],
+            'Basic dXNlcjpzZWNyZXQ=')
+
+    def test_https_proxy_tunnel(self):
+        transport = Transport(proxies={'https': 'http://proxy:3128'})
+        conn = transport.get_pool('https', 'cit.seur.com')._new_connection()
+        self.assertEqual((conn.host, conn.port), ('proxy', 3128))
+        self.assertEqual(conn._tunnel_host, 'cit.seur.com')
+
+    def test_proxy_environment(self):
+        environ = dict(os.environ)
+        os.environ['http_proxy'] = 'http://proxy:3128'
+        os.environ['no_proxy'] = 'local.invalid'
+        try:
+            transport = Transport()
+            self.assertEqual(transport.proxy('http', 'seur.invalid'),
+                'http://proxy:3128')
+            self.assertEqual(transport.proxy('http', 'local.invalid'), None)
+            self.assertEqual(transport.proxy('https', 'seur.invalid'), None)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+
+if __name__ == '__main__':
+    unittest.main()
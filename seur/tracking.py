@@ -0,0 +1,227 @@
+#This file is part of seur. The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+
+from seur.utils import imap_unordered
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+
+def windows(date_from, date_to, days=7):
+    """
+    Split a range of dates in windows
+
+    :param date_from: first date
+    :param date_to: last date (included)
+    :param days: days of each window
+    :return: iterator of (first date, last date) of each window
+    """
+    step = datetime.timedelta(days=days - 1)
+    while date_from <= date_to:
+        end = min(date_from + step, date_to)
+        yield date_from, end
+        date_from = end + datetime.timedelta(days=1)
+
+
+def fingerprint(record):
+    """
+    Hash of the values of an expedition record (status included)
+
+    :param record: seur.records.Expedicion
+    :return: string
+    """
+    return hashlib.sha1(json.dumps(record.to_dict(),
+            sort_keys=True)).hexdigest()
+
+
+class TrackingStore(object):
+    """
+    High-water mark and fingerprint of each expedition of a TrackingSync,
+    saved to a gzip JSON file
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: file of the store. Loaded if exists
+        """
+        self.path = path
+        self.high_water = None
+        self.fingerprints = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def changed(self, reference, fingerprint):
+        """
+        Whether the fingerprint of a reference is new or different
+        """
+        value = self.fingerprints.get(reference)
+        return value is None or value[0] != fingerprint
+
+    def set(self, reference, fingerprint, date):
+        """
+        Remember the fingerprint of a reference, seen in the list of date
+        """
+        with self._lock:
+            self.fingerprints[reference] = [fingerprint, date.isoformat()]
+
+    def prune(self, date):
+        """
+        Forget the references not seen since date
+        """
+        date = date.isoformat()
+        with self._lock:
+            for reference, (_, seen) in self.fingerprints.items():
+                if seen < date:
+                    del self.fingerprints[reference]
+
+    def load(self, path=None):
+        path = path or self.path
+        f = gzip.open(path, 'rb')
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+        high_water = data.get('high_water')
+        if high_water:
+            high_water = datetime.datetime.strptime(high_water,
+                '%Y-%m-%d').date()
+        self.high_water = high_water
+        self.fingerprints = data.get('fingerprints', {})
+
+    def save(self, path=None):
+        """
+        Write the store to a gzip JSON file
+        """
+        path = path or self.path
+        with self._lock:
+            data = {
+                'high_water': (self.high_water
+                    and self.high_water.isoformat()),
+                'fingerprints': dict(self.fingerprints),
+                }
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        f = gzip.open(tmp, 'wb')
+        try:
+            json.dump(data, f, separators=(',', ':'))
+        finally:
+            f.close()
+        os.rename(tmp, path)
+
+
+class TrackingSync(object):
+    """
+    Incremental tracking of the expeditions
+
+    Lists the expeditions from lookback days before the high-water mark (the
+    last day synchronized) to today in windows of days, and only calls
+    Picking.info for the expeditions that are new or whose list record
+    (status included) changed since the last sync.
+
+    Example usage ::
+
+        store = TrackingStore('/var/lib/seur/tracking.json.gz')
+        with Picking(username, password, vat, franchise, seurid, ci, ccc,
+                context=context) as picking_api:
+            sync = TrackingSync(picking_api, store)
+            for reference, record, info, error in sync.sync():
+                print reference, record.situacion, error
+    """
+
+    def __init__(self, picking, store, days=7, lookback=15, max_workers=4,
+            data=None):
+        """
+        :param picking: Picking instance
+        :param store: TrackingStore
+        :param days: days listed in each Picking.list call
+        :param lookback: days before the high-water mark listed again to
+                         find status changes
+        :param max_workers: Picking.info requests sent at the same time
+        :param data: dict of values of Picking.list and Picking.info
+                     (expedicion, service, public)
+        """
+        self.picking = picking
+        self.store = store
+        self.days = days
+        self.lookback = lookback
+        self.max_workers = max_workers
+        self.data = data or {}
+        self.stats = {}
+
+    def list(self, date_from, date_to):
+        """
+        Expedition records of a range of dates, a Picking.list call per
+        window
+
+        :return: iterator of (date of the window, record)
+        """
+        for start, end in windows(date_from, date_to, self.days):
+            data = self.data.copy()
+            data['from'] = '%s-%s-%s' % (start.day, start.month, start.year)
+            data['to'] = '%s-%s-%s' % (end.day, end.month, end.year)
+            self.stats['list'] += 1
+            for record in self.picking.list(data, records=True):
+                yield end, record
+
+    def info(self, reference):
+        data = self.data.copy()
+        data['reference'] = reference
+        return self.picking.info(data, records=True)
+
+    def sync(self, date_to=None, date_from=None):
+        """
+        Synchronize the expeditions until date_to
+
+        :param date_to: last date (default today)
+        :param date_from: first date (default lookback days before the
+                          high-water mark or date_to)
+        :return: list of (reference, list record, info, error) of the new and
+                 changed expeditions. record and info are
+                 seur.records.Expedicion, error the exception raised by
+                 Picking.info; its fingerprint is not saved to retry it on
+                 the next sync
+        """
+        store = self.store
+        lookback = datetime.timedelta(days=self.lookback)
+        if date_to is None:
+            date_to = datetime.date.today()
+        if date_from is None:
+            date_from = (store.high_water or date_to) - lookback
+        self.stats = {'list': 0, 'listed': 0, 'info': 0, 'errors': 0}
+
+        changed = {}
+        for date, record in self.list(date_from, date_to):
+            ref = record.reference or record.number
+            if not ref:
+                continue
+            self.stats['listed'] += 1
+            fp = fingerprint(record)
+            if store.changed(ref, fp):
+                changed[ref] = (record, fp, date)
+            else:
+                store.set(ref, fp, date)
+
+        references = sorted(changed)
+        results = []
+        for index, info, exception in imap_unordered(self.info, references,
+                max_workers=self.max_workers):
+            ref = references[index]
+            record, fp, date = changed[ref]
+            self.stats['info'] += 1
+            if exception is not None:
+                self.stats['errors'] += 1
+            else:
+                store.set(ref, fp, date)
+            results.append((ref, record, info, exception))
+
+        store.high_water = max(store.high_water or date_to, date_to)
+        store.prune(date_from)
+        if store.path:
+            store.save()
+        return results
@@ -1,6 +1,10 @@
 #This file is part of seur. The COPYRIGHT file at the top level of
 #this repository contains the full copyright notices and license terms.
 
+import Queue
+import threading
+
+
 def services():
     services = {
         '001': 'SEUR - 24',
@@ -16,3 +20,50 @@ def services():
         '083': 'SEUR 8:30',
     }
     return services
+
+
+def imap_unordered(func, iterable, max_workers=4):
+    """
+    Call func for every item of iterable in a pool of max_workers threads.
+    The iterable is consumed lazily, keeping at most two items per worker
+    waiting, and an exception in func does not stop the other items.
+
+    :param func: callable with one argument
+    :param iterable: items
+    :param max_workers: number of threads
+    :return: iterator of (index, result, exception) as they complete
+    """
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            index, item = task
+            try:
+                results.put((index, func(item), None))
+            except Exception as e:
+                results.put((index, None, e))
+
+    for i in range(max_workers):
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+
+    window = max_workers * 2
+    pending = 0
+    try:
+        for task in enumerate(iterable):
+            tasks.put(task)
+            pending += 1
+            if pending >= window:
+                yield results.get()
+                pending -= 1
+        while pending:
+            yield results.get()
+            pending -= 1
+    finally:
+        for i in range(max_workers):
+            tasks.put(None)